@@ -1,10 +1,45 @@
 # -*- coding: utf-8 -*-
 import re
+import time
+
 from cms.utils.conf import get_cms_setting
 
 CMS_PAGE_CACHE_VERSION_KEY = get_cms_setting("CACHE_PREFIX") + '_PAGE_CACHE_VERSION'
 
 
+# Process-local copy of the page cache version: {key: (version, expires)}
+_local_cache_versions = {}
+
+
+def _get_new_cache_version():
+    # Versions are based on the current time so that a version key lost
+    # by the cache backend never gets re-created with a previous value.
+    return int(time.time() * 1000000)
+
+
+def _get_local_cache_version():
+    """
+    Returns the page cache version held by this process,
+    or None if it's unknown or has expired.
+    """
+    version, expires = _local_cache_versions.get(CMS_PAGE_CACHE_VERSION_KEY, (None, 0))
+
+    if version is not None and time.time() < expires:
+        return version
+    return None
+
+
+def _set_local_cache_version(version):
+    """
+    Keeps the given page cache version in this process for
+    CMS_PAGE_CACHE_VERSION_LOCAL_TTL seconds.
+    """
+    ttl = get_cms_setting('PAGE_CACHE_VERSION_LOCAL_TTL')
+
+    if ttl:
+        _local_cache_versions[CMS_PAGE_CACHE_VERSION_KEY] = (version, time.time() + ttl)
+
+
 def _get_cache_version():
     """
     Returns the current page cache version, explicitly setting one if not
@@ -12,13 +47,21 @@ def _get_cache_version():
     """
     from django.core.cache import cache
 
-    version = cache.get(CMS_PAGE_CACHE_VERSION_KEY)
+    version = _get_local_cache_version()
 
-    if version:
+    if version is not None:
         return version
-    else:
-        _set_cache_version(1)
-        return 1
+
+    version = cache.get(CMS_PAGE_CACHE_VERSION_KEY)
+
+    if not version:
+        version = _get_new_cache_version()
+
+        if not cache.add(CMS_PAGE_CACHE_VERSION_KEY, version, None):
+            # Another process has set the version in the meantime
+            version = cache.get(CMS_PAGE_CACHE_VERSION_KEY, version)
+    _set_local_cache_version(version)
+    return version
 
 
 def _set_cache_version(version):
@@ -27,17 +70,19 @@ def _set_cache_version(version):
     """
     from django.core.cache import cache
 
-    cache.set(
-        CMS_PAGE_CACHE_VERSION_KEY,
-        version,
-        get_cms_setting('CACHE_DURATIONS')['content']
-    )
+    cache.set(CMS_PAGE_CACHE_VERSION_KEY, version, None)
+    _set_local_cache_version(version)
 
 
 def invalidate_cms_page_cache():
     """
     Invalidates the CMS PAGE CACHE.
     """
+    from django.core.cache import cache
+
+    from cms.cache import stats
+
+    start = time.time()
 
     #
     # NOTE: We're using a cache versioning strategy for invalidating the page
@@ -45,29 +90,20 @@ def invalidate_cms_page_cache():
     # increment the version number rendering all previous entries
     # inaccessible and left to expire naturally.
     #
-    # ALSO NOTE: According to the Django documentation, a timeout value of
-    # `None' (in version 1.6+) is supposed to mean "cache forever", however,
-    # this is actually only implemented as only slightly less than 30 days in
-    # some backends (memcached, in particular). In older Djangos, `None' means
-    # "use default value".  To avoid issues arising from different Django
-    # versions and cache backend implementations, we will explicitly set the
-    # lifespan of the CMS_PAGE_CACHE_VERSION entry to whatever is set in
-    # settings.CACHE_DURATIONS['content']. This allows users to adjust as
-    # necessary for their backend.
-    #
-    # To prevent writing cache entries that will live longer than our version
-    # key, we will always re-write the current version number into the cache
-    # just after we write any new cache entries, thus ensuring that the
-    # version number will always outlive any entries written against that
-    # version. This is a cheap operation.
+    # ALSO NOTE: The version is stored without expiration, so that it always
+    # outlives the entries cached against it, without having to re-write it
+    # after every cache write. Should the cache backend evict it anyway, a new
+    # version based on the current time is created, which can't match any
+    # existing entry.
     #
-    # If there are no new cache writes before the version key expires, its
-    # perfectly OK, since any previous entries cached against that version
-    # will have also expired, so, it'd be pointless to try to access them
-    # anyway.
+    # Processes holding a local copy of the version (see
+    # CMS_PAGE_CACHE_VERSION_LOCAL_TTL) pick up the new version once their
+    # copy expires.
     #
-    version = _get_cache_version()
+    # The local copy of the version is bypassed, it might be outdated.
+    version = cache.get(CMS_PAGE_CACHE_VERSION_KEY) or _get_new_cache_version()
     _set_cache_version(version + 1)
+    stats.record('page', stats.INVALIDATION, duration=time.time() - start)
 
 
 CLEAN_KEY_PATTERN = re.compile(r'[^a-zA-Z0-9_-]')
@@ -1,56 +1,397 @@
 # -*- coding: utf-8 -*-
 
 import hashlib
+import re
+import threading
+import time
+import zlib
 
+from calendar import timegm
+from collections import OrderedDict
 from datetime import timedelta
+from fnmatch import fnmatchcase
+from operator import itemgetter
 
 from django.conf import settings
-from django.utils.cache import add_never_cache_headers, patch_response_headers, patch_vary_headers
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.db.models import Max
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import (
+    add_never_cache_headers,
+    patch_cache_control,
+    patch_response_headers,
+    patch_vary_headers,
+)
 from django.utils.encoding import iri_to_uri
-from django.utils.timezone import now
+from django.utils.http import http_date, parse_http_date_safe
+from django.utils.six.moves.urllib.parse import unquote_plus
+from django.utils.text import compress_string
+from django.utils.timezone import is_naive, make_aware, now
+from django.utils.translation import get_language
 
-from cms.cache import _get_cache_version, _set_cache_version, _get_cache_key
-from cms.constants import EXPIRE_NOW, MAX_EXPIRATION_TTL
+from cms.cache import (
+    CMS_PAGE_CACHE_VERSION_KEY,
+    _get_cache_key,
+    _get_cache_version,
+    _get_local_cache_version,
+    _set_local_cache_version,
+)
+from cms.cache import stats
+from cms.constants import (
+    EXPIRE_NOW,
+    MAX_EXPIRATION_TTL,
+    PAGE_CACHE_LOCAL_DEPENDENCIES_SIZE,
+    PAGE_CACHE_LOCK_TTL,
+)
 from cms.toolbar.utils import get_toolbar_from_request
 from cms.utils.conf import get_cms_setting
 from cms.utils.helpers import get_timezone_name
 
+try:
+    # brotli is not guaranteed to be available
+    import brotli
+except ImportError:
+    brotli = None
+
+
+ETAG_MATCH = re.compile(r'(?:W/)?("[^"]*")')
+
+# Headers sent along with a 304 Not Modified response (RFC 7232)
+NOT_MODIFIED_HEADERS = ('cache-control', 'content-location', 'etag', 'expires', 'last-modified', 'vary')
+
+# The dependency keys of the page cache entries seen by this process, by cache
+# key, so that they are fetched along with the entries (LRU).
+_local_dependency_keys = OrderedDict()
+_local_dependency_keys_lock = threading.Lock()
+
+
+def _normalize_query_string(query_string):
+    """
+    Removes the query parameters which don't affect the page content
+    (as configured by CMS_PAGE_CACHE_QUERY_PARAMETERS and
+    CMS_PAGE_CACHE_IGNORED_QUERY_PARAMETERS) and sorts the remaining ones
+    by name, so that equivalent query strings share the same cache entry.
+    The order of repeated parameters is preserved.
+    """
+    allowed = get_cms_setting('PAGE_CACHE_QUERY_PARAMETERS')
+    ignored = get_cms_setting('PAGE_CACHE_IGNORED_QUERY_PARAMETERS')
+    parameters = []
+
+    for parameter in query_string.split('&'):
+        if not parameter:
+            continue
+
+        name = unquote_plus(parameter.partition('=')[0])
+
+        if allowed is not None:
+            keep = any(fnmatchcase(name, pattern) for pattern in allowed)
+        else:
+            keep = not any(fnmatchcase(name, pattern) for pattern in ignored)
+
+        if keep:
+            parameters.append((name, parameter))
+    parameters.sort(key=itemgetter(0))
+    return '&'.join(parameter for name, parameter in parameters)
+
 
 def _page_cache_key(request):
+    path, _, query_string = iri_to_uri(request.get_full_path()).partition('?')
+    query_string = _normalize_query_string(query_string)
+
+    if query_string:
+        path += '?' + query_string
+
     #sha1 key of current path
     cache_key = "%s:%d:%s" % (
         get_cms_setting("CACHE_PREFIX"),
         settings.SITE_ID,
-        hashlib.sha1(iri_to_uri(request.get_full_path()).encode('utf-8')).hexdigest()
+        hashlib.sha1(path.encode('utf-8')).hexdigest()
     )
     if settings.USE_TZ:
         cache_key += '.%s' % get_timezone_name()
+
+    user = getattr(request, 'user', None)
+
+    if user is not None and user.is_authenticated():
+        from cms.utils import get_current_site
+        from cms.utils.page_permissions import get_view_fingerprint
+
+        # Users who are allowed to see the same pages share the same entries
+        cache_key += '.%s' % get_view_fingerprint(user, get_current_site())
     return cache_key
 
 
+def _can_cache_page_for_user(user):
+    """
+    Returns True if pages rendered for the given user can be read from
+    and written to the page cache.
+    Staff users always bypass the page cache since they can see drafts.
+    """
+    if not user.is_authenticated():
+        return True
+    return get_cms_setting('PAGE_CACHE_AUTHENTICATED') and not user.is_staff
+
+
+def _page_cache_lock_key(request):
+    return _page_cache_key(request) + ':lock'
+
+
+def _page_cache_dependency_key(kind, pk):
+    return "%s:page_cache_dependency:%s:%s" % (
+        get_cms_setting("CACHE_PREFIX"),
+        kind,
+        pk,
+    )
+
+
+def _get_page_cache_dependency_keys(request, placeholders):
+    """
+    Returns the dependency keys of a page rendered for the given request.
+    Every page depends on the navigation of its site, because menus,
+    breadcrumbs and links to other pages are built from it.
+    """
+    keys = [_page_cache_dependency_key('menu', settings.SITE_ID)]
+    page = getattr(request, 'current_page', None)
+
+    if page:
+        keys.append(_page_cache_dependency_key('page', page.pk))
+    keys.extend(_page_cache_dependency_key('placeholder', ph.pk) for ph in placeholders)
+    return keys
+
+
+def _get_page_cache_dependency_timeout():
+    return get_cms_setting('CACHE_DURATIONS')['content'] + get_cms_setting('PAGE_CACHE_GRACE')
+
+
+def _get_page_cache_dependency_versions(keys):
+    """
+    Returns a {key: version} dictionary for the given dependency keys,
+    creating versions for the keys not yet in the cache.
+    Existing versions are never overwritten, an entry stored against
+    a version which is evicted or expires is simply not served.
+    """
+    from django.core.cache import cache
+
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+
+    if missing:
+        version = int(time.time() * 1000000)
+        timeout = _get_page_cache_dependency_timeout()
+        # A concurrent invalidation might have set some of the versions
+        lost = [key for key in missing if not cache.add(key, version, timeout)]
+        versions.update((key, version) for key in missing)
+
+        if lost:
+            versions.update(cache.get_many(lost))
+    return versions
+
+
+def _get_local_dependency_keys(cache_key):
+    with _local_dependency_keys_lock:
+        keys = _local_dependency_keys.pop(cache_key, ())
+
+        if keys:
+            _local_dependency_keys[cache_key] = keys
+    return keys
+
+
+def _set_local_dependency_keys(cache_key, keys):
+    with _local_dependency_keys_lock:
+        _local_dependency_keys.pop(cache_key, None)
+        _local_dependency_keys[cache_key] = tuple(keys)
+
+        while len(_local_dependency_keys) > PAGE_CACHE_LOCAL_DEPENDENCIES_SIZE:
+            _local_dependency_keys.popitem(last=False)
+
+
+def invalidate_page_cache_dependencies(dependencies):
+    """
+    Invalidates the page cache entries depending on any of the given
+    (kind, pk) pairs, where kind is one of "page", "placeholder" or "menu".
+    Used instead of invalidate_cms_page_cache() when
+    CMS_PAGE_CACHE_DEPENDENCIES is enabled.
+    """
+    from django.core.cache import cache
+
+    start = time.time()
+    version = int(time.time() * 1000000)
+    keys = [_page_cache_dependency_key(kind, pk) for kind, pk in dependencies]
+    cache.set_many(
+        dict.fromkeys(keys, version),
+        _get_page_cache_dependency_timeout(),
+    )
+    stats.record('page', stats.INVALIDATION, site_id=settings.SITE_ID,
+                 duration=time.time() - start)
+
+
+def _get_accepted_encodings(request):
+    """
+    Returns the content encodings accepted by the client,
+    according to the Accept-Encoding header of the request.
+    """
+    accepted = set()
+
+    for item in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        encoding, _, params = item.partition(';')
+        params = params.replace(' ', '')
+
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0
+        else:
+            quality = 1
+
+        if quality > 0:
+            accepted.add(encoding.strip().lower())
+
+    if '*' in accepted:
+        accepted.update(('br', 'gzip'))
+    return accepted
+
+
+def _compress_content(content):
+    """
+    Returns a dictionary with the gzip (and brotli, if installed)
+    compressed variants of the given content.
+    """
+    compressed = {'gzip': compress_string(content)}
+
+    if brotli is not None:
+        compressed['br'] = brotli.compress(content)
+    return compressed
+
+
+def _get_encoded_content(request, content, headers):
+    """
+    Returns the (content, headers) pair to serve for a cached page,
+    picking the compressed variant of the content accepted by the client.
+    Clients accepting none of them get the decompressed content.
+    """
+    if not isinstance(content, dict):
+        # Entry was stored without compression
+        return content, headers
+
+    headers = headers.copy()
+    accepted = _get_accepted_encodings(request)
+
+    for encoding in ('br', 'gzip'):
+        if encoding in content and encoding in accepted:
+            headers['content-encoding'] = ('Content-Encoding', encoding)
+
+            if 'etag' in headers:
+                # Each encoding of the content needs its own strong ETag
+                headers['etag'] = ('ETag', '%s-%s"' % (headers['etag'][1][:-1], encoding))
+            return content[encoding], headers
+    return zlib.decompress(content['gzip'], 16 + zlib.MAX_WBITS), headers
+
+
+def _get_last_modified(request, placeholders, versions):
+    """
+    Returns the most recent modification date of the current page, of the
+    plugins in the given placeholders and of the page cache «versions» the
+    page is cached against. Changes to other objects the page is built from
+    (static placeholders, the navigation...) only show in the versions.
+    """
+    from cms.models import CMSPlugin
+
+    dates = []
+    page = getattr(request, 'current_page', None)
+
+    if page:
+        dates.append(page.changed_date)
+
+    if placeholders:
+        plugins = CMSPlugin.objects.filter(placeholder__in=[ph.pk for ph in placeholders])
+        dates.append(plugins.aggregate(last_modified=Max('changed_date'))['last_modified'])
+
+    timestamps = [
+        timegm((make_aware(date) if is_naive(date) else date).utctimetuple())
+        for date in dates if date
+    ]
+    # The versions are the times (in microseconds) they were created at,
+    # rounded up so that changes made within the same second are not missed.
+    timestamps.extend(-(-version // 1000000) for version in versions if version)
+
+    if not timestamps:
+        return None
+    return max(timestamps)
+
+
+def _is_not_modified(request, headers):
+    """
+    Returns True if the client already holds the cached page described
+    by the given headers, according to its conditional request headers.
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return False
+
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+
+    if if_none_match:
+        # If-None-Match takes precedence over If-Modified-Since
+        if 'etag' not in headers:
+            return False
+
+        if if_none_match.strip() == '*':
+            return True
+
+        etag = ETAG_MATCH.search(headers['etag'][1])
+        return bool(etag) and etag.group(1) in ETAG_MATCH.findall(if_none_match)
+
+    if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE'))
+
+    if if_modified_since and 'last-modified' in headers:
+        last_modified = parse_http_date_safe(headers['last-modified'][1])
+        return last_modified is not None and last_modified <= if_modified_since
+    return False
+
+
 def set_page_cache(response):
     from django.core.cache import cache
 
+    request = response._request
+
+    try:
+        return _set_page_cache(response)
+    finally:
+        if getattr(request, '_page_cache_lock_acquired', False):
+            # This request won the revalidation lock in get_page_cache(),
+            # release it whether the page could be cached or not.
+            cache.delete(_page_cache_lock_key(request))
+            request._page_cache_lock_acquired = False
+
+
+def _set_page_cache(response):
+    from django.core.cache import cache
+
     request = response._request
     toolbar = get_toolbar_from_request(request)
     is_authenticated = request.user.is_authenticated()
 
-    if is_authenticated or toolbar._cache_disabled or not get_cms_setting("PAGE_CACHE"):
+    if not _can_cache_page_for_user(request.user) or toolbar._cache_disabled or not get_cms_setting("PAGE_CACHE"):
+        add_never_cache_headers(response)
+        return response
+
+    if is_authenticated and request.META.get('CSRF_COOKIE_USED'):
+        # The page contains a CSRF token bound to the current user
         add_never_cache_headers(response)
         return response
 
     # This *must* be TZ-aware
     timestamp = now()
 
-    placeholders = toolbar.content_renderer.get_rendered_placeholders()
+    renderer = toolbar.content_renderer
+    placeholders = renderer.get_rendered_placeholders()
     # Checks if there's a plugin using the legacy "cache = False"
     placeholder_ttl_list = []
     vary_cache_on_set = set()
     for ph in placeholders:
-        # get_cache_expiration() always returns:
-        #     EXPIRE_NOW <= int <= MAX_EXPIRATION_IN_SECONDS
-        ttl = ph.get_cache_expiration(request, timestamp)
-        vary_cache_on = ph.get_vary_cache_on(request)
+        # The ttl is always: EXPIRE_NOW <= int <= MAX_EXPIRATION_IN_SECONDS
+        # Computed once per render, shared with the placeholder cache.
+        ttl, vary_cache_on = renderer.get_placeholder_cache_info(ph)
 
         placeholder_ttl_list.append(ttl)
         if ttl and vary_cache_on:
@@ -70,45 +411,260 @@ def set_page_cache(response):
         )
 
         if ttl > 0:
+            compress = (
+                get_cms_setting('PAGE_CACHE_COMPRESSION')
+                and not response.has_header('Content-Encoding')
+            )
+
+            if compress:
+                # The cached response is served in different encodings
+                vary_cache_on_set.add('Accept-Encoding')
+
+            version = _get_cache_version()
+
+            if get_cms_setting('PAGE_CACHE_DEPENDENCIES'):
+                dependency_keys = _get_page_cache_dependency_keys(request, placeholders)
+                dependencies = _get_page_cache_dependency_versions(dependency_keys)
+                versions = list(dependencies.values())
+            else:
+                dependencies = None
+                versions = [version]
+
+            if not response.has_header('ETag'):
+                response['ETag'] = '"%s"' % hashlib.md5(response.content).hexdigest()
+
+            if not response.has_header('Last-Modified'):
+                last_modified = _get_last_modified(request, placeholders, versions)
+
+                if last_modified:
+                    response['Last-Modified'] = http_date(last_modified)
+
+            if is_authenticated:
+                # Shared caches must not store pages of logged in users
+                patch_cache_control(response, private=True)
+
             # Adds expiration, etc. to headers
             patch_response_headers(response, cache_timeout=ttl)
             patch_vary_headers(response, sorted(vary_cache_on_set))
 
-            version = _get_cache_version()
+            start = time.time()
+
+            if compress:
+                content = _compress_content(response.content)
+            else:
+                content = response.content
+
+            grace = get_cms_setting('PAGE_CACHE_GRACE')
             # We also store the absolute expiration timestamp to avoid
             # recomputing it on cache-reads.
             expires_datetime = timestamp + timedelta(seconds=ttl)
+            # The version is stored with the entry instead of being part of
+            # the key. This allows get_page_cache() to recognize entries
+            # from a previous version and serve them as stale content.
+            cache_key = _page_cache_key(request)
             cache.set(
-                _page_cache_key(request),
+                cache_key,
                 (
-                    response.content,
+                    content,
                     response._headers,
                     expires_datetime,
+                    version,
+                    dependencies,
                 ),
-                ttl,
-                version=version
+                ttl + grace,
+            )
+
+            if dependencies:
+                _set_local_dependency_keys(cache_key, dependencies)
+            stats.record(
+                'page',
+                stats.WRITE,
+                site_id=settings.SITE_ID,
+                language=get_language(),
+                duration=time.time() - start,
+                size=len(response.content),
             )
-            # See note in invalidate_cms_page_cache()
-            _set_cache_version(version)
     return response
 
 
 def get_page_cache(request):
+    """
+    Returns a (content, headers, expires_datetime) tuple for the current
+    request or None if the page has to be rendered.
+
+    When CMS_PAGE_CACHE_GRACE is set, entries which have expired or have
+    been invalidated are still returned for the duration of the grace period,
+    unless the current request wins the revalidation lock, in which case
+    None is returned so that the page gets rendered and re-cached.
+    Only one request at a time can hold the lock for a given cache key.
+
+    When CMS_PAGE_CACHE_DEPENDENCIES is enabled, entries are also
+    invalidated as soon as one of the objects they depend on changes.
+
+    When CMS_PAGE_CACHE_COMPRESSION is enabled, the returned content is
+    compressed according to the Accept-Encoding header of the request and
+    the headers contain the matching Content-Encoding.
+    """
     from django.core.cache import cache
-    return cache.get(_page_cache_key(request), version=_get_cache_version())
 
+    cache_key = _page_cache_key(request)
+    current_version = _get_local_cache_version()
+    keys = [cache_key]
 
-def get_xframe_cache(page):
+    if current_version is None:
+        keys.append(CMS_PAGE_CACHE_VERSION_KEY)
+    keys.extend(_get_local_dependency_keys(cache_key))
+
+    if len(keys) > 1:
+        # Fetch the entry, the current version and the dependencies
+        # of the entry in a single round trip
+        values = cache.get_many(keys)
+        cached = values.get(cache_key)
+    else:
+        values = {}
+        cached = cache.get(cache_key)
+
+    if current_version is None:
+        current_version = values.get(CMS_PAGE_CACHE_VERSION_KEY)
+
+        if current_version:
+            _set_local_cache_version(current_version)
+
+    if cached is None:
+        return None
+
+    content, headers, expires_datetime, version, dependencies = cached
+    timestamp = now()
+
+    if version == current_version and timestamp < expires_datetime:
+        if dependencies:
+            missing = [key for key in dependencies if key not in keys]
+
+            if missing:
+                # The entry was not seen by this process yet
+                _set_local_dependency_keys(cache_key, dependencies)
+                values.update(cache.get_many(missing))
+            is_valid = all(values.get(key) == value for key, value in dependencies.items())
+        else:
+            is_valid = True
+
+        if is_valid:
+            content, headers = _get_encoded_content(request, content, headers)
+            return content, headers, expires_datetime
+
+    grace = get_cms_setting('PAGE_CACHE_GRACE')
+
+    if not grace or timestamp >= expires_datetime + timedelta(seconds=grace):
+        return None
+
+    lock_acquired = cache.add(
+        _page_cache_lock_key(request),
+        True,
+        min(grace, PAGE_CACHE_LOCK_TTL),
+    )
+
+    if lock_acquired:
+        # This request will render the page, set_page_cache()
+        # releases the lock.
+        request._page_cache_lock_acquired = True
+        return None
+    # Another request is already rendering the page,
+    # serve the stale content in the meantime.
+    # Stale content is marked as expired right away.
+    content, headers = _get_encoded_content(request, content, headers)
+    return content, headers, timestamp
+
+
+def get_page_cache_response(request):
+    """
+    Returns the response for the current request built from the page cache
+    or None if the page has to be rendered.
+
+    Conditional requests matching the ETag or Last-Modified header of the
+    cached page are answered with a 304 Not Modified response.
+    The page cache is only looked up once per request.
+    """
+    if getattr(request, '_page_cache_checked', False):
+        # Already looked up by the PageCacheMiddleware
+        return None
+
+    request._page_cache_checked = True
+    response_timestamp = now()
+    start = time.time()
+    cache_content = get_page_cache(request)
+
+    if cache_content is None:
+        stats.record('page', stats.MISS, site_id=settings.SITE_ID,
+                     language=get_language(), duration=time.time() - start)
+        return None
+
+    content, headers, expires_datetime = cache_content
+    stats.record('page', stats.HIT, site_id=settings.SITE_ID, language=get_language(),
+                 duration=time.time() - start, size=len(content))
+
+    if _is_not_modified(request, headers):
+        response = HttpResponseNotModified()
+
+        for header in NOT_MODIFIED_HEADERS:
+            if header in headers:
+                response._headers[header] = headers[header]
+    else:
+        response = HttpResponse(content)
+        response._headers = headers
+
+    # Recalculate the max-age header for this cached response
+    max_age = max(int(
+        (expires_datetime - response_timestamp).total_seconds() + 0.5), 0)
+    patch_cache_control(response, max_age=max_age)
+
+    if get_cms_setting('CACHE_STATS_SERVER_TIMING'):
+        stats.add_server_timing_header(response)
+    return response
+
+
+def _get_versioned_cache(key, dependency):
+    """
+    Returns the value stored by _set_versioned_cache() under the given key,
+    None if there is none or if it is outdated.
+    """
     from django.core.cache import cache
-    return cache.get('cms:xframe_options:%s' % page.pk)
 
+    if not get_cms_setting('PAGE_CACHE_DEPENDENCIES'):
+        return cache.get(key, version=_get_cache_version())
 
-def set_xframe_cache(page, xframe_options):
+    dependency_key = _page_cache_dependency_key(*dependency)
+    # The value and the version of its dependency are read in one round trip
+    cached = cache.get_many([key, dependency_key])
+    value, version = cached.get(key, (None, None))
+
+    if version is None or version != cached.get(dependency_key):
+        return None
+    return value
+
+
+def _set_versioned_cache(key, value, dependency, timeout=DEFAULT_TIMEOUT):
+    """
+    Caches a value derived from pages. It is invalidated along with the page
+    cache or, when CMS_PAGE_CACHE_DEPENDENCIES is enabled, along with the
+    page cache entries depending on the given (kind, pk) «dependency».
+    """
     from django.core.cache import cache
-    cache.set('cms:xframe_options:%s' % page.pk,
-              xframe_options,
-              version=_get_cache_version())
-    _set_cache_version(_get_cache_version())
+
+    if not get_cms_setting('PAGE_CACHE_DEPENDENCIES'):
+        cache.set(key, value, timeout, version=_get_cache_version())
+        return
+
+    dependency_key = _page_cache_dependency_key(*dependency)
+    version = _get_page_cache_dependency_versions([dependency_key])[dependency_key]
+    cache.set(key, (value, version), timeout)
+
+
+def get_xframe_cache(page):
+    return _get_versioned_cache('cms:xframe_options:%s' % page.pk, ('page', page.pk))
+
+
+def set_xframe_cache(page, xframe_options):
+    _set_versioned_cache('cms:xframe_options:%s' % page.pk, xframe_options, ('page', page.pk))
 
 
 def _page_url_key(page_lookup, lang, site_id):
@@ -116,14 +672,15 @@ def _page_url_key(page_lookup, lang, site_id):
 
 
 def set_page_url_cache(page_lookup, lang, site_id, url):
-    from django.core.cache import cache
-    cache.set(_page_url_key(page_lookup, lang, site_id),
-              url,
-              get_cms_setting('CACHE_DURATIONS')['content'], version=_get_cache_version())
-    _set_cache_version(_get_cache_version())
+    # The url of a page depends on the slugs of its ancestors,
+    # which are part of the navigation.
+    _set_versioned_cache(
+        _page_url_key(page_lookup, lang, site_id),
+        url,
+        ('menu', site_id),
+        get_cms_setting('CACHE_DURATIONS')['content'],
+    )
 
 
 def get_page_url_cache(page_lookup, lang, site_id):
-    from django.core.cache import cache
-    return cache.get(_page_url_key(page_lookup, lang, site_id),
-                     version=_get_cache_version())
+    return _get_versioned_cache(_page_url_key(page_lookup, lang, site_id), ('menu', site_id))
@@ -1,13 +1,16 @@
 # -*- coding: utf-8 -*-
+import time
+
 from django.contrib.auth import get_user_model
 
+from cms.cache import stats
 from cms.utils.conf import get_cms_setting
 
 
 PERMISSION_KEYS = [
     'add_page', 'change_page', 'change_page_advanced_settings',
     'change_page_permissions', 'delete_page', 'move_page',
-    'publish_page', 'view_page',
+    'publish_page', 'view_page', 'view_fingerprint',
 ]
 
 
@@ -35,7 +38,12 @@ def get_permission_cache(user, key):
     Helper for reading values from cache
     """
     from django.core.cache import cache
-    return cache.get(get_cache_key(user, key), version=get_cache_permission_version())
+
+    start = time.time()
+    value = cache.get(get_cache_key(user, key), version=get_cache_permission_version())
+    event = stats.MISS if value is None else stats.HIT
+    stats.record('permission', event, duration=time.time() - start)
+    return value
 
 
 def set_permission_cache(user, key, value):
@@ -44,11 +52,14 @@ def set_permission_cache(user, key, value):
     all of them can be cleaned when clean_permission_cache gets called.
     """
     from django.core.cache import cache
+
+    start = time.time()
     # store this key, so we can clean it when required
     cache_key = get_cache_key(user, key)
     cache.set(cache_key, value,
               get_cms_setting('CACHE_DURATIONS')['permissions'],
               version=get_cache_permission_version())
+    stats.record('permission', stats.WRITE, duration=time.time() - start)
 
 
 def clear_user_permission_cache(user):
@@ -56,15 +67,22 @@ def clear_user_permission_cache(user):
     Cleans permission cache for given user.
     """
     from django.core.cache import cache
+
+    start = time.time()
+
     for key in PERMISSION_KEYS:
         cache.delete(get_cache_key(user, key), version=get_cache_permission_version())
+    stats.record('permission', stats.INVALIDATION, duration=time.time() - start)
 
 
 def clear_permission_cache():
     from django.core.cache import cache
+
+    start = time.time()
     version = get_cache_permission_version()
     if version > 1:
         cache.incr(get_cache_permission_version_key())
     else:
         cache.set(get_cache_permission_version_key(), 2,
                   get_cms_setting('CACHE_DURATIONS')['permissions'])
+    stats.record('permission', stats.INVALIDATION, duration=time.time() - start)
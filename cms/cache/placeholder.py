@@ -17,13 +17,26 @@ the current HTTPRequest object.
 
 The vary-on header-names are also stored with the version. This enables us to
 check for cache hits without re-computing placeholder.get_vary_cache_on().
+
+When CMS_PLACEHOLDER_CACHE_GENERATIONS is enabled, the version is instead the
+cache_generation of the placeholder row, incremented by each invalidation. The
+version key then only holds the vary-on header-names of that generation, its
+eviction no longer orphans the existing cache entries.
+
+The resolution of inherited placeholders, the placeholder of the closest
+ancestor page with content in a given slot, is cached as well. These entries
+are versioned by slot, the version being replaced whenever a placeholder in
+that slot is cleared, and by the page tree.
 """
 
 import hashlib
 import time
 
+from django.db.models import F
 from django.utils.timezone import now
 
+from cms.cache import stats
+from cms.cache.static_placeholder import clear_static_placeholders_cache
 from cms.utils.conf import get_cms_setting
 from cms.utils.helpers import get_header_name, get_timezone_name
 
@@ -61,7 +74,9 @@ def _get_placeholder_cache_version(placeholder, lang, site_id):
 
     key = _get_placeholder_cache_version_key(placeholder, lang, site_id)
     cached = cache.get(key)
-    if cached:
+    if get_cms_setting('PLACEHOLDER_CACHE_GENERATIONS'):
+        version, vary_on_list = _get_placeholder_cache_generation(placeholder, cached)
+    elif cached:
         version, vary_on_list = cached
     else:
         version = int(time.time() * 1000000)
@@ -70,6 +85,19 @@ def _get_placeholder_cache_version(placeholder, lang, site_id):
     return version, vary_on_list
 
 
+def _get_placeholder_cache_generation(placeholder, cached):
+    """
+    Returns the placeholder's cache generation and the vary-on header-names
+    list of the «cached» version, if it belongs to this generation,
+    otherwise an empty list.
+    """
+    version = placeholder.cache_generation
+
+    if cached and cached[0] == version:
+        return version, cached[1]
+    return version, []
+
+
 def _set_placeholder_cache_version(placeholder, lang, site_id, version, vary_on_list=None, duration=None):
     """
     Sets the (placeholder x lang)'s version and vary-on header-names list.
@@ -87,17 +115,12 @@ def _set_placeholder_cache_version(placeholder, lang, site_id, version, vary_on_
     cache.set(key, (version, vary_on_list), duration)
 
 
-def _get_placeholder_cache_key(placeholder, lang, site_id, request, soft=False):
+def _get_placeholder_cache_content_key(placeholder, lang, site_id, request, version, vary_on_list):
     """
-    Returns the fully-addressed cache key for the given placeholder and
-    the request.
-
-    The kwarg «soft» should be set to True if getting the cache key to then
-    read from the cache. If instead the key retrieval is to support a cache
-    write, let «soft» be False.
+    Returns the cache key of the content of the given placeholder for the
+    given «version» and vary-on header-names list, addressed by the request.
     """
     prefix = get_cms_setting('CACHE_PREFIX')
-    version, vary_on_list = _get_placeholder_cache_version(placeholder, lang, site_id)
     main_key = '{prefix}|render_placeholder|id:{id}|lang:{lang}|site:{site}|tz:{tz}|v:{version}'.format(
         prefix=prefix,
         id=placeholder.pk,
@@ -107,18 +130,6 @@ def _get_placeholder_cache_key(placeholder, lang, site_id, request, soft=False):
         version=version,
     )
 
-    if not soft:
-        # We are about to write to the cache, so we want to get the latest
-        # vary_cache_on headers and the correct cache expiration, ignoring any
-        # we already have. If the placeholder has already been rendered, this
-        # will be very efficient (zero-additional queries) due to the caching
-        # of all its plugins during the rendering process anyway.
-        vary_on_list = placeholder.get_vary_cache_on(request)
-        duration = placeholder.get_cache_expiration(request, now())
-        # Update the main placeholder cache version
-        _set_placeholder_cache_version(
-            placeholder, lang, site_id, version, vary_on_list, duration)
-
     sub_key_list = []
     for key in vary_on_list:
         value = request.META.get(get_header_name(key)) or '_'
@@ -137,23 +148,99 @@ def _get_placeholder_cache_key(placeholder, lang, site_id, request, soft=False):
     return cache_key
 
 
-def set_placeholder_cache(placeholder, lang, site_id, content, request):
+def _get_content_size(content):
+    # Rendered placeholders are cached along with their sekizai data
+    if isinstance(content, dict):
+        content = content['content']
+    return len(content)
+
+
+def get_placeholder_cache_info(placeholder, request):
+    """
+    Returns the (ttl, vary_on_list) tuple of the given placeholder, derived
+    from the plugins it contains.
+    """
+    vary_on_list = placeholder.get_vary_cache_on(request)
+    duration = min(
+        get_cms_setting('CACHE_DURATIONS')['content'],
+        placeholder.get_cache_expiration(request, now())
+    )
+    return duration, vary_on_list
+
+
+def set_placeholder_cache(placeholder, lang, site_id, content, request, cache_info=None):
     """
     Sets the (correct) placeholder cache with the rendered placeholder.
+
+    «cache_info» is the (ttl, vary_on_list) tuple of the placeholder as
+    returned by get_placeholder_cache_info(), computed if not given.
+    """
+    set_placeholders_cache([(placeholder, lang, site_id, content, cache_info)], request)
+
+
+def set_placeholders_cache(entries, request):
+    """
+    Sets the placeholder cache of several rendered placeholders at once,
+    «entries» being a list of (placeholder, lang, site_id, content, cache_info)
+    tuples, «cache_info» being as in set_placeholder_cache().
+
+    The versions of all the placeholders are fetched in one round trip, then
+    the contents and the versions are written with one set_many() per
+    distinct duration. Each version is written ("touched") only once.
     """
     from django.core.cache import cache
 
-    key = _get_placeholder_cache_key(placeholder, lang, site_id, request)
+    start = time.time()
+    use_generations = get_cms_setting('PLACEHOLDER_CACHE_GENERATIONS')
+    version_keys = [
+        _get_placeholder_cache_version_key(placeholder, lang, site_id)
+        for placeholder, lang, site_id, content, cache_info in entries
+    ]
 
-    duration = min(
-      get_cms_setting('CACHE_DURATIONS')['content'],
-      placeholder.get_cache_expiration(request, now())
-    )
-    cache.set(key, content, duration)
-    # "touch" the cache-version, so that it stays as fresh as this content.
-    version, vary_on_list = _get_placeholder_cache_version(placeholder, lang, site_id)
-    _set_placeholder_cache_version(
-        placeholder, lang, site_id, version, vary_on_list, duration=duration)
+    if use_generations:
+        # The versions are on the placeholder rows
+        cached_versions = {}
+    else:
+        cached_versions = cache.get_many(version_keys)
+    versions = {}
+    writes = {}
+
+    for (placeholder, lang, site_id, content, cache_info), version_key in zip(entries, version_keys):
+        if use_generations:
+            version = placeholder.cache_generation
+        elif cached_versions.get(version_key):
+            version = cached_versions[version_key][0]
+        else:
+            version = int(time.time() * 1000000)
+            # Other entries for this placeholder and language share the version
+            cached_versions[version_key] = (version, [])
+
+        if cache_info is None:
+            # We are about to write to the cache, so we want to get the latest
+            # vary_cache_on headers and the correct cache expiration. If the
+            # placeholder has already been rendered, this will be very efficient
+            # (zero-additional queries) due to the caching of all its plugins
+            # during the rendering process anyway.
+            cache_info = get_placeholder_cache_info(placeholder, request)
+        duration, vary_on_list = cache_info
+        key = _get_placeholder_cache_content_key(
+            placeholder, lang, site_id, request, version, vary_on_list)
+        writes.setdefault(duration, {})[key] = content
+        # "touch" the cache-version, so that it stays as fresh as this content.
+        versions[version_key] = (duration, (version, vary_on_list))
+
+    for version_key, (duration, version) in versions.items():
+        writes.setdefault(duration, {})[version_key] = version
+
+    for duration, values in writes.items():
+        cache.set_many(values, duration)
+
+    # The time of the round trips is shared by the placeholders
+    duration = (time.time() - start) / (len(entries) or 1)
+
+    for placeholder, lang, site_id, content, cache_info in entries:
+        stats.record('placeholder', stats.WRITE, site_id=site_id, language=lang,
+                     duration=duration, size=_get_content_size(content))
 
 
 def get_placeholder_cache(placeholder, lang, site_id, request):
@@ -161,11 +248,191 @@ def get_placeholder_cache(placeholder, lang, site_id, request):
     Returns the placeholder from cache respecting the placeholder's
     VARY headers.
     """
+    contents = get_placeholders_cache([placeholder], lang, site_id, request)
+    return contents.get(placeholder.pk)
+
+
+def get_placeholders_cache(placeholders, lang, site_id, request):
+    """
+    Returns a dictionary mapping the primary key of each of the given
+    placeholders to its content in the cache, respecting the placeholder's
+    VARY headers. Placeholders not in the cache are left out.
+
+    All the versions are fetched in one round trip and then all the
+    contents in a second one.
+    """
     from django.core.cache import cache
 
-    key = _get_placeholder_cache_key(placeholder, lang, site_id, request, soft=True)
-    content = cache.get(key)
-    return content
+    start = time.time()
+    use_generations = get_cms_setting('PLACEHOLDER_CACHE_GENERATIONS')
+    version_keys = dict(
+        (placeholder.pk, _get_placeholder_cache_version_key(placeholder, lang, site_id))
+        for placeholder in placeholders
+    )
+    keys = list(version_keys.values())
+
+    if use_generations:
+        # The versions are known already, so the content of the placeholders
+        # without VARY headers (most of them) is fetched along with the
+        # vary-on header-names.
+        keys += [
+            _get_placeholder_cache_content_key(
+                placeholder, lang, site_id, request, placeholder.cache_generation, [])
+            for placeholder in placeholders
+        ]
+
+    cached = cache.get_many(keys)
+    # Keys which have been looked up already, found or not
+    fetched_keys = set(keys)
+    new_versions = {}
+    content_keys = {}
+
+    for placeholder in placeholders:
+        version_key = version_keys[placeholder.pk]
+        cached_version = cached.get(version_key)
+
+        if use_generations:
+            version, vary_on_list = _get_placeholder_cache_generation(placeholder, cached_version)
+        elif cached_version:
+            version, vary_on_list = cached_version
+        else:
+            # Same as _get_placeholder_cache_version, reset to («timestamp», [])
+            version = int(time.time() * 1000000)
+            vary_on_list = []
+            new_versions[version_key] = (version, vary_on_list)
+
+        content_key = _get_placeholder_cache_content_key(
+            placeholder, lang, site_id, request, version, vary_on_list)
+        content_keys[placeholder.pk] = content_key
+
+        if version_key in new_versions:
+            # There's no content for a new version
+            fetched_keys.add(content_key)
+
+    if new_versions:
+        cache.set_many(new_versions, None)
+
+    keys = [key for key in content_keys.values() if key not in fetched_keys]
+
+    if keys:
+        cached.update(cache.get_many(keys))
+
+    # The time of the round trips is shared by the placeholders
+    duration = (time.time() - start) / (len(content_keys) or 1)
+    contents = {}
+
+    for placeholder_id, content_key in content_keys.items():
+        content = cached.get(content_key)
+
+        if content is None:
+            stats.record('placeholder', stats.MISS, site_id=site_id, language=lang,
+                         duration=duration)
+        else:
+            stats.record('placeholder', stats.HIT, site_id=site_id, language=lang,
+                         duration=duration, size=_get_content_size(content))
+            contents[placeholder_id] = content
+    return contents
+
+
+def _get_placeholder_inheritance_version_key(slot=None):
+    """
+    Returns the version key of the inheritance resolutions of the given
+    «slot», or of the page tree if no slot is given.
+    """
+    prefix = get_cms_setting('CACHE_PREFIX')
+
+    if slot is None:
+        key = '{prefix}|placeholder_inheritance_version|tree'.format(prefix=prefix)
+    else:
+        key = '{prefix}|placeholder_inheritance_version|slot:{slot}'.format(
+            prefix=prefix,
+            slot=slot,
+        )
+
+    if len(key) > 250:
+        key = '{prefix}|{hash}'.format(
+            prefix=prefix,
+            hash=hashlib.sha1(key.encode('utf-8')).hexdigest(),
+        )
+    return key
+
+
+def get_placeholder_inheritance_cache(page_id, slots, lang, site_id):
+    """
+    Returns a dictionary mapping each of the given «slots» of the page to a
+    (key, resolution) tuple, «key» being the cache key of the resolution.
+
+    The resolution is a (page_id, placeholder_id) tuple of the placeholder the
+    slot inherits its content from, an empty tuple if there's nothing to
+    inherit, or None if the resolution is not in the cache.
+    """
+    from django.core.cache import cache
+
+    prefix = get_cms_setting('CACHE_PREFIX')
+    tree_key = _get_placeholder_inheritance_version_key()
+    version_keys = dict((slot, _get_placeholder_inheritance_version_key(slot)) for slot in slots)
+    versions = cache.get_many([tree_key] + list(version_keys.values()))
+    new_versions = {}
+
+    for version_key in [tree_key] + list(version_keys.values()):
+        if not versions.get(version_key):
+            versions[version_key] = new_versions[version_key] = int(time.time() * 1000000)
+
+    if new_versions:
+        cache.set_many(new_versions, None)
+
+    keys = {}
+
+    for slot, version_key in version_keys.items():
+        key = '{prefix}|placeholder_inheritance|page:{page}|slot:{slot}|lang:{lang}|site:{site}|v:{tree}.{version}'.format(
+            prefix=prefix,
+            page=page_id,
+            slot=slot,
+            lang=lang,
+            site=site_id,
+            tree=versions[tree_key],
+            version=versions[version_key],
+        )
+
+        if len(key) > 250:
+            key = '{prefix}|{hash}'.format(
+                prefix=prefix,
+                hash=hashlib.sha1(key.encode('utf-8')).hexdigest(),
+            )
+        keys[slot] = key
+
+    # There's nothing in the cache for new versions
+    keys_to_fetch = [
+        key for slot, key in keys.items()
+        if tree_key not in new_versions and version_keys[slot] not in new_versions
+    ]
+
+    if keys_to_fetch:
+        resolutions = cache.get_many(keys_to_fetch)
+    else:
+        resolutions = {}
+    return dict((slot, (key, resolutions.get(key))) for slot, key in keys.items())
+
+
+def set_placeholder_inheritance_cache(key, resolution):
+    """
+    Sets the resolution of an inherited placeholder, as returned by
+    get_placeholder_inheritance_cache.
+    """
+    from django.core.cache import cache
+
+    cache.set(key, resolution, get_cms_setting('CACHE_DURATIONS')['content'])
+
+
+def clear_placeholder_inheritance_cache(slot=None):
+    """
+    Invalidates the inheritance resolutions of the given «slot»,
+    or of all the slots if the page tree has changed.
+    """
+    from django.core.cache import cache
+
+    version = int(time.time() * 1000000)
+    cache.set(_get_placeholder_inheritance_version_key(slot), version, None)
 
 
 def clear_placeholder_cache(placeholder, lang, site_id):
@@ -173,6 +440,26 @@ def clear_placeholder_cache(placeholder, lang, site_id):
     Invalidates all existing cache entries for (placeholder x lang x site_id).
     We don't need to re-store the vary_on_list, because the cache is now
     effectively empty.
+
+    When CMS_PLACEHOLDER_CACHE_GENERATIONS is enabled, the cache generation
+    of the placeholder is incremented instead, which invalidates the entries
+    of all its languages.
     """
-    version = int(time.time() * 1000000)
-    _set_placeholder_cache_version(placeholder, lang, site_id, version, [])
+    from cms.models import Placeholder
+
+    start = time.time()
+
+    if not get_cms_setting('PLACEHOLDER_CACHE_GENERATIONS'):
+        version = int(time.time() * 1000000)
+        _set_placeholder_cache_version(placeholder, lang, site_id, version, [])
+    else:
+        Placeholder.objects.filter(pk=placeholder.pk).update(cache_generation=F('cache_generation') + 1)
+        placeholder.refresh_from_db(fields=['cache_generation'])
+        # The static placeholders registry holds the generations
+        # of the placeholders of the static placeholders.
+        clear_static_placeholders_cache()
+    # Pages inheriting from this placeholder might have to inherit
+    # from another one, or the other way around.
+    clear_placeholder_inheritance_cache(placeholder.slot)
+    stats.record('placeholder', stats.INVALIDATION, site_id=site_id, language=lang,
+                 duration=time.time() - start)
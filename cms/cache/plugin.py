@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+
+"""
+This module manages the rendered-fragment cache of plugins, enabled by
+CMS_PLUGIN_FRAGMENT_CACHE.
+
+Unlike the placeholder cache, the entries are not versioned. Instead, the
+cache key includes the primary key and the changed_date of the plugin and of
+all its descendants, so that changing any plugin of the tree addresses a new
+entry. Entries of changed or deleted plugins simply expire.
+
+The cache key also includes additional sub-keys, according to the list of
+VARY header-names as returned by plugin.get_vary_cache_on() and the current
+HTTPRequest object.
+"""
+
+import hashlib
+import time
+import warnings
+
+from datetime import datetime, timedelta
+
+from django.utils import six
+from django.utils.encoding import force_text
+
+from cms.cache import stats
+from cms.constants import EXPIRE_NOW, MAX_EXPIRATION_TTL
+from cms.utils.conf import get_cms_setting
+from cms.utils.helpers import get_header_name, get_timezone_name
+
+
+def get_plugin_cache_expiration(plugin, instance, placeholder, request, response_timestamp):
+    """
+    Returns the number of seconds (from «response_timestamp») that the given
+    plugin «instance» can be cached, according to its plugin class, or None
+    if the plugin class gives no hint.
+    """
+    plugin_expiration = plugin.get_cache_expiration(request, instance, placeholder)
+
+    # The plugin_expiration should only ever be either: None, a TZ-
+    # aware datetime, a timedelta, or an integer.
+    if plugin_expiration is None:
+        return None
+
+    if isinstance(plugin_expiration, (datetime, timedelta)):
+        if isinstance(plugin_expiration, datetime):
+            # We need to convert this to a TTL against the
+            # response timestamp.
+            try:
+                delta = plugin_expiration - response_timestamp
+            except TypeError:
+                # Attempting to take the difference of a naive datetime
+                # and a TZ-aware one results in a TypeError. Ignore
+                # this plugin.
+                warnings.warn(
+                    'Plugin %(plugin_class)s (%(pk)d) returned a naive '
+                    'datetime : %(value)s for get_cache_expiration(), '
+                    'ignoring.' % {
+                        'plugin_class': plugin.__class__.__name__,
+                        'pk': instance.pk,
+                        'value': force_text(plugin_expiration),
+                    })
+                return None
+        else:
+            # Its already a timedelta instance...
+            delta = plugin_expiration
+        return int(delta.total_seconds() + 0.5)
+
+    # must be an int-like value
+    try:
+        return int(plugin_expiration)
+    except ValueError:
+        # Looks like it was not very int-ish. Ignore this plugin.
+        warnings.warn(
+            'Plugin %(plugin_class)s (%(pk)d) returned '
+            'unexpected value %(value)s for '
+            'get_cache_expiration(), ignoring.' % {
+                'plugin_class': plugin.__class__.__name__,
+                'pk': instance.pk,
+                'value': force_text(plugin_expiration),
+            })
+    return None
+
+
+def get_plugin_vary_cache_on(plugin, instance, placeholder, request):
+    """
+    Returns the list of (lowercase) VARY header-names of the given
+    plugin «instance», according to its plugin class.
+    """
+    vary_on = plugin.get_vary_cache_on(request, instance, placeholder)
+
+    if not vary_on:
+        # None, or an empty iterable
+        return []
+
+    if isinstance(vary_on, six.string_types):
+        return [vary_on.lower()]
+
+    try:
+        return [vary_on_item.lower() for vary_on_item in iter(vary_on)]
+    except TypeError:
+        warnings.warn(
+            'Plugin %(plugin_class)s (%(pk)d) returned '
+            'unexpected value %(value)s for '
+            'get_vary_cache_on(), ignoring.' % {
+                'plugin_class': plugin.__class__.__name__,
+                'pk': instance.pk,
+                'value': force_text(vary_on),
+            })
+    return []
+
+
+def _get_plugin_tree(instance):
+    """
+    Yields the given plugin «instance» and all its descendants.
+    """
+    yield instance
+
+    for child in instance.child_plugin_instances or []:
+        for plugin in _get_plugin_tree(child):
+            yield plugin
+
+
+def _get_plugin_tree_classes(plugin, instance):
+    """
+    Yields a (plugin, instance) tuple for the given plugin «instance»
+    and each of its rendered descendants.
+    """
+    yield plugin, instance
+
+    for child in instance.child_plugin_instances or []:
+        child, child_plugin = child.get_plugin_instance()
+
+        if child and child_plugin.render_plugin:
+            for item in _get_plugin_tree_classes(child_plugin, child):
+                yield item
+
+
+def get_plugin_cache_duration(plugin, instance, placeholder, request, response_timestamp):
+    """
+    Returns the number of seconds the rendered «instance» can be kept in the
+    fragment cache, EXPIRE_NOW if it must not be cached.
+    The rendered content includes the descendants of the plugin, so the
+    shortest duration of the tree wins.
+    """
+    if not get_cms_setting('PLUGIN_CACHE'):
+        return EXPIRE_NOW
+
+    ttl = MAX_EXPIRATION_TTL
+
+    for tree_plugin, tree_instance in _get_plugin_tree_classes(plugin, instance):
+        if not tree_plugin.cache:
+            return EXPIRE_NOW
+
+        plugin_ttl = get_plugin_cache_expiration(
+            tree_plugin, tree_instance, placeholder, request, response_timestamp)
+
+        if plugin_ttl is not None:
+            ttl = min(ttl, plugin_ttl)
+    return max(min(ttl, get_cms_setting('CACHE_DURATIONS')['content']), EXPIRE_NOW)
+
+
+def get_plugin_tree_vary_cache_on(plugin, instance, placeholder, request):
+    """
+    Returns the sorted list of VARY header-names of the given plugin
+    «instance» and of all its descendants.
+    """
+    vary_on = set()
+
+    for tree_plugin, tree_instance in _get_plugin_tree_classes(plugin, instance):
+        vary_on.update(get_plugin_vary_cache_on(tree_plugin, tree_instance, placeholder, request))
+    return sorted(vary_on)
+
+
+def get_plugin_cache_key(instance, site_id, request, vary_on_list):
+    """
+    Returns the fragment cache key of the given plugin «instance»
+    for the given request.
+    """
+    prefix = get_cms_setting('CACHE_PREFIX')
+    tree = ';'.join(
+        '{0}:{1}'.format(plugin.pk, plugin.changed_date.isoformat())
+        for plugin in _get_plugin_tree(instance)
+    )
+    cache_key = '{prefix}|render_plugin|id:{id}|lang:{lang}|site:{site}|tz:{tz}|tree:{tree}'.format(
+        prefix=prefix,
+        id=instance.pk,
+        lang=instance.language,
+        site=site_id,
+        tz=get_timezone_name(),
+        tree=hashlib.sha1(tree.encode('utf-8')).hexdigest(),
+    )
+
+    for key in vary_on_list:
+        value = request.META.get(get_header_name(key)) or '_'
+        cache_key += '|' + key + ':' + value
+
+    if len(cache_key) > 250:
+        cache_key = '{prefix}|{hash}'.format(
+            prefix=prefix,
+            hash=hashlib.sha1(cache_key.encode('utf-8')).hexdigest(),
+        )
+    return cache_key
+
+
+def get_plugins_cache(keys):
+    """
+    Returns a dictionary mapping each of the given fragment cache keys
+    to the rendered plugin, fetched in one round trip.
+    Keys not in the cache are left out.
+    """
+    from django.core.cache import cache
+
+    start = time.time()
+    contents = cache.get_many(keys)
+    # The time of the round trip is shared by the plugins
+    duration = (time.time() - start) / (len(keys) or 1)
+
+    for key in keys:
+        if key in contents:
+            stats.record('plugin', stats.HIT, duration=duration,
+                         size=len(contents[key]['content']))
+        else:
+            stats.record('plugin', stats.MISS, duration=duration)
+    return contents
+
+
+def set_plugin_cache(key, content, duration):
+    """
+    Sets the fragment cache of a rendered plugin, «content» being a dictionary
+    of the rendered content and the sekizai data.
+    """
+    from django.core.cache import cache
+
+    start = time.time()
+    cache.set(key, content, duration)
+    stats.record('plugin', stats.WRITE, duration=time.time() - start,
+                 size=len(content['content']))
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+
+"""
+This module keeps a process-local registry of the static placeholders of each
+site, along with their draft and public placeholders, so that rendering a
+{% static_placeholder %} tag doesn't need any query.
+
+The registry is versioned by a key in the shared cache, replaced whenever a
+static placeholder is saved (publishing saves it), marked as dirty or deleted.
+A process rebuilds the registry of a site, with a single query, the first time
+it sees a new version.
+"""
+
+import time
+
+from django.db.models import Q
+
+from cms.utils.conf import get_cms_setting
+
+
+# {site_id: (version, {(code, site_bound): static_placeholder})}
+_registry = {}
+
+
+def _get_static_placeholders_version_key():
+    return '{prefix}|static_placeholders_version'.format(
+        prefix=get_cms_setting('CACHE_PREFIX'),
+    )
+
+
+def get_static_placeholders_version():
+    """
+    Returns the current version of the static placeholders registry,
+    explicitly setting one if not defined.
+    """
+    from django.core.cache import cache
+
+    key = _get_static_placeholders_version_key()
+    version = cache.get(key)
+
+    if not version:
+        version = int(time.time() * 1000000)
+
+        if not cache.add(key, version, None):
+            # Another process has set the version in the meantime
+            version = cache.get(key, version)
+    return version
+
+
+def clear_static_placeholders_cache():
+    """
+    Invalidates the static placeholders registry of all the processes.
+    """
+    from django.core.cache import cache
+
+    version = int(time.time() * 1000000)
+    cache.set(_get_static_placeholders_version_key(), version, None)
+
+
+def _get_registry(site_id, version):
+    from cms.models import StaticPlaceholder
+
+    registered_version, registry = _registry.get(site_id, (None, None))
+
+    if registered_version == version:
+        return registry
+
+    static_placeholders = (
+        StaticPlaceholder
+        .objects
+        .filter(Q(site=site_id) | Q(site__isnull=True))
+        .select_related('draft', 'public')
+    )
+    registry = dict(
+        ((static_placeholder.code, bool(static_placeholder.site_id)), static_placeholder)
+        for static_placeholder in static_placeholders
+    )
+    _registry[site_id] = (version, registry)
+    return registry
+
+
+def _copy_instance(instance):
+    # A new instance of the same row, sharing no state with «instance»
+    field_names = [field.attname for field in instance._meta.concrete_fields]
+    values = [getattr(instance, name) for name in field_names]
+    return instance.from_db(instance._state.db, field_names, values)
+
+
+def get_static_placeholder(code, site, site_bound=False, version=None):
+    """
+    Returns the static placeholder with the given «code» of the given «site»,
+    or the one shared by all the sites unless «site_bound».
+
+    The static placeholder is created if it does not exist yet.
+
+    Rendering sets attributes on the placeholders, so the registered
+    instances are never returned, each caller gets its own copies.
+    """
+    from cms.models import StaticPlaceholder
+
+    if version is None:
+        version = get_static_placeholders_version()
+
+    registry = _get_registry(site.pk, version)
+    registered = registry.get((code, site_bound))
+
+    if registered is None:
+        # Created once, the registry of every process is then rebuilt.
+        kwargs = {
+            'code': code,
+            'defaults': {'creation_method': StaticPlaceholder.CREATION_BY_TEMPLATE}
+        }
+
+        if site_bound:
+            kwargs['site'] = site
+        else:
+            kwargs['site_id__isnull'] = True
+        return StaticPlaceholder.objects.get_or_create(**kwargs)[0]
+
+    static_placeholder = _copy_instance(registered)
+    static_placeholder.draft = _copy_instance(registered.draft)
+    static_placeholder.public = _copy_instance(registered.public)
+    return static_placeholder
@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+
+"""
+This module collects statistics about the effectiveness of the page,
+placeholder, menu and permission caches.
+
+Every cache read (hit or miss), write and invalidation is recorded along with
+the time it took and the number of bytes involved, broken down by site and
+language, when CMS_CACHE_STATS is enabled. Records are handed over to the sink
+configured by CMS_CACHE_STATS_SINK.
+
+The default sink keeps counters in the memory of each process and
+periodically publishes them to the cache, so that the "cms cache-stats"
+command can aggregate the counters of all processes.
+
+When CMS_CACHE_STATS_SERVER_TIMING is enabled, the cache operations of the
+current request are also reported in a Server-Timing header.
+"""
+
+import os
+import socket
+import threading
+import time
+import zlib
+
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+from django.utils.translation import ugettext as _
+
+from cms.constants import (
+    CACHE_STATS_MAX_PROCESSES,
+    CACHE_STATS_PUBLISH_INTERVAL,
+    CACHE_STATS_TTL,
+)
+from cms.utils.conf import get_cms_setting
+
+
+HIT = 'hit'
+MISS = 'miss'
+WRITE = 'write'
+INVALIDATION = 'invalidation'
+
+EVENTS = (HIT, MISS, WRITE, INVALIDATION)
+
+# Operations of the current request, reported in the Server-Timing header
+_request_stats = threading.local()
+
+_sinks = {}
+
+
+class BaseStatsSink(object):
+    """
+    Base class for cache statistics sinks.
+    """
+
+    def record(self, cache_name, event, site_id, language, duration, size):
+        """
+        Records a single cache operation.
+        """
+        raise NotImplementedError
+
+    def get_stats(self):
+        """
+        Returns a dictionary mapping (cache_name, site_id, language, event)
+        tuples to [count, duration, size] lists.
+        """
+        raise NotImplementedError
+
+    def reset(self):
+        """
+        Discards all the statistics collected so far.
+        """
+        raise NotImplementedError
+
+
+class MemoryStatsSink(BaseStatsSink):
+    """
+    Keeps the statistics of the current process in memory.
+    They are published to the cache at most every
+    CACHE_STATS_PUBLISH_INTERVAL seconds, under one of the
+    CACHE_STATS_MAX_PROCESSES slot keys, claimed by the process with
+    cache.add() so that no two processes publish under the same key.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._published = 0
+        self._epoch = 0
+        # (process name, slot key)
+        self._slot = None
+
+    def _get_key(self, name):
+        return '%s:cache_stats:%s' % (get_cms_setting('CACHE_PREFIX'), name)
+
+    def _get_slot_keys(self):
+        return [self._get_key('slot:%d' % slot) for slot in range(CACHE_STATS_MAX_PROCESSES)]
+
+    def _get_process_name(self):
+        # The pid is resolved every time, forked processes
+        # must not publish under the slot of their parent.
+        return '%s:%s' % (socket.gethostname(), os.getpid())
+
+    def _claim_slot(self, process, stats):
+        from django.core.cache import cache
+
+        slot_keys = self._get_slot_keys()
+        # Processes start from different slots, so that they
+        # usually claim a slot on their first attempt.
+        first = zlib.crc32(process.encode('utf-8')) % len(slot_keys)
+
+        for slot_key in slot_keys[first:] + slot_keys[:first]:
+            if cache.add(slot_key, (process, stats), CACHE_STATS_TTL):
+                return slot_key
+        return None
+
+    def record(self, cache_name, event, site_id, language, duration, size):
+        with self._lock:
+            stats = self._stats.setdefault((cache_name, site_id, language, event), [0, 0.0, 0])
+            stats[0] += 1
+            stats[1] += duration
+            stats[2] += size
+
+        if time.time() - self._published >= CACHE_STATS_PUBLISH_INTERVAL:
+            self.publish()
+
+    def publish(self):
+        """
+        Stores the statistics of this process in the cache.
+        The statistics are dropped when all the slots are taken.
+        """
+        from django.core.cache import cache
+
+        self._published = time.time()
+        epoch = cache.get(self._get_key('epoch'), 0)
+
+        with self._lock:
+            if epoch > self._epoch:
+                # Statistics have been reset since the last publication
+                self._stats = {}
+                self._epoch = epoch
+            stats = dict((key, list(value)) for key, value in self._stats.items())
+
+        process = self._get_process_name()
+        slot_key = None
+
+        if self._slot and self._slot[0] == process:
+            slot_key = self._slot[1]
+            owner = cache.get(slot_key)
+
+            if owner is None:
+                # The slot expired or the statistics were reset
+                if not cache.add(slot_key, (process, stats), CACHE_STATS_TTL):
+                    slot_key = None
+            elif owner[0] == process:
+                cache.set(slot_key, (process, stats), CACHE_STATS_TTL)
+            else:
+                slot_key = None
+
+        if slot_key is None:
+            slot_key = self._claim_slot(process, stats)
+        self._slot = (process, slot_key) if slot_key else None
+
+    def get_stats(self):
+        from django.core.cache import cache
+
+        self.publish()
+
+        aggregated = {}
+
+        for process, stats in cache.get_many(self._get_slot_keys()).values():
+            for key, (count, duration, size) in stats.items():
+                total = aggregated.setdefault(key, [0, 0.0, 0])
+                total[0] += count
+                total[1] += duration
+                total[2] += size
+        return aggregated
+
+    def reset(self):
+        from django.core.cache import cache
+
+        cache.delete_many(self._get_slot_keys())
+        # Other processes discard their statistics when they see
+        # a new epoch, on their next publication.
+        cache.set(self._get_key('epoch'), time.time(), CACHE_STATS_TTL)
+
+        with self._lock:
+            self._stats = {}
+
+
+def get_stats_sink():
+    """
+    Returns the instance of the sink configured by CMS_CACHE_STATS_SINK.
+    Raises an ImproperlyConfigured exception if it can't be imported.
+    """
+    path = get_cms_setting('CACHE_STATS_SINK')
+
+    if path not in _sinks:
+        try:
+            sink_class = import_string(path)
+        except ImportError:
+            raise ImproperlyConfigured(
+                _('Unable to import the specified CMS_CACHE_STATS_SINK: '
+                  '"{0}".').format(path))
+        _sinks[path] = sink_class()
+    return _sinks[path]
+
+
+def record(cache_name, event, site_id=None, language=None, duration=0.0, size=0):
+    """
+    Records an operation on the given cache, «duration» being in seconds
+    and «size» in bytes. Does nothing unless CMS_CACHE_STATS is enabled.
+    """
+    if not get_cms_setting('CACHE_STATS'):
+        return
+
+    get_stats_sink().record(cache_name, event, site_id, language, duration, size)
+
+    request_stats = getattr(_request_stats, 'stats', None)
+
+    if request_stats is not None:
+        counts, durations = request_stats.setdefault(cache_name, ({}, [0.0]))
+        counts[event] = counts.get(event, 0) + 1
+        durations[0] += duration
+
+
+def reset_request_stats(**kwargs):
+    """
+    Starts collecting the cache operations of a new request.
+    Connected to the request_started signal.
+    """
+    if get_cms_setting('CACHE_STATS') and get_cms_setting('CACHE_STATS_SERVER_TIMING'):
+        _request_stats.stats = {}
+    else:
+        _request_stats.stats = None
+
+
+def add_server_timing_header(response):
+    """
+    Reports the cache operations of the current request
+    in the Server-Timing header of the given response.
+    """
+    request_stats = getattr(_request_stats, 'stats', None)
+
+    if not request_stats:
+        return response
+
+    metrics = []
+
+    for cache_name, (counts, durations) in sorted(request_stats.items()):
+        description = ' '.join(
+            '%s=%d' % (event, counts[event]) for event in EVENTS if event in counts
+        )
+        metrics.append('cms-%s;desc="%s";dur=%.2f' % (cache_name, description, durations[0] * 1000))
+
+    if response.has_header('Server-Timing'):
+        metrics.insert(0, response['Server-Timing'])
+    response['Server-Timing'] = ', '.join(metrics)
+    return response
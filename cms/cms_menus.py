@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 from django.core.urlresolvers import reverse
+from django.db.models import Q
 from django.db.models.query import Prefetch, prefetch_related_objects
 from django.utils.functional import SimpleLazyObject
 from django.utils.translation import override as force_language
@@ -156,6 +157,56 @@ def get_menu_node_for_page(renderer, page, language, fallbacks=None):
         raise RuntimeError('Unable to render cms menu. There is a language misconfiguration.')
 
 
+def get_window_filter(request, pages, window):
+    """
+    Returns the filter of the given «pages» in the given MenuWindow,
+    around the current page of the request.
+
+    Pages are selected from the position of their tree node: the path of a
+    tree node starts with the path of its ancestors.
+    """
+    current_page = getattr(request, 'current_page', None)
+
+    if current_page:
+        node = current_page.node
+        # The paths of the ancestors of the current page, and its own
+        paths = [node.path[:end] for end in range(node.steplen, len(node.path) + 1, node.steplen)]
+    else:
+        paths = []
+
+    # The pages one level below the window are fetched too, so that the nodes
+    # at the bottom of the window know whether they are leaf nodes.
+    inactive_depth = window.inactive_depth + 2
+    # The pages at the root (the children of a home page hidden from the
+    # navigation being root nodes too), or under an ancestor of the current page
+    query = Q(node__depth__lte=inactive_depth + 1)
+
+    for depth, path in enumerate(paths[:-1], 1):
+        query |= Q(node__path__startswith=path, node__depth__lte=depth + inactive_depth)
+
+    if paths:
+        # The pages under the current page
+        active_depth = max(window.active_depth + 1, inactive_depth)
+        query |= Q(node__path__startswith=paths[-1], node__depth__lte=len(paths) + active_depth)
+
+    if window.max_level is not None:
+        # Levels are counted from the nearest soft root on the path, if any.
+        soft_root_depths = pages.filter(
+            node__path__in=paths,
+            soft_root=True,
+        ).values_list('node__depth', flat=True)
+        root_depth = max(soft_root_depths or [1])
+        # The children of a home page hidden from the navigation are root
+        # nodes, another level covers them.
+        query &= Q(node__depth__lte=root_depth + window.max_level + 2)
+
+    if paths:
+        # The current page and its ancestors are needed whatever their level,
+        # to mark the selected node and its ancestors.
+        query |= Q(node__path__in=paths)
+    return query
+
+
 class CMSNavigationNode(NavigationNode):
 
     def __init__(self, *args, **kwargs):
@@ -196,6 +247,10 @@ class CMSMenu(Menu):
             published=not self.renderer.draft_mode_active,
         )
 
+        if self.window:
+            # Only the pages the menu tag needs
+            pages = pages.filter(get_window_filter(request, pages, self.window))
+
         if is_valid_site_language(lang, site_id=site.pk):
             _valid_language = True
             _hide_untranslated = hide_untranslated(lang, site.pk)
@@ -461,36 +516,64 @@ class SoftRootCutter(Modifier):
         return nodes
 
     def find_and_remove_children(self, node, nodes):
-        for child in node.children:
-            if child.attr.get("soft_root", False):
-                self.remove_children(child, nodes)
-        return nodes
+        removed = set()
+        self._cut_soft_root_children(node, removed)
+        return self._exclude_removed(nodes, removed)
 
     def remove_children(self, node, nodes):
+        removed = set()
+        self._cut_children(node, removed)
+        return self._exclude_removed(nodes, removed)
+
+    def _exclude_removed(self, nodes, removed):
+        # Filtered once, instead of removing the nodes one by one
+        if removed:
+            nodes[:] = [node for node in nodes if id(node) not in removed]
+        return nodes
+
+    def _cut_soft_root_children(self, node, removed):
         for child in node.children:
-            nodes.remove(child)
-            self.remove_children(child, nodes)
-        node.children = []
+            if child.attr.get("soft_root", False):
+                self._cut_children(child, removed)
+
+    def _cut_children(self, node, removed):
+        """
+        Cuts all the descendants of «node», adding their ids to «removed».
+        """
+        stack = [node]
+
+        while stack:
+            node = stack.pop()
+
+            for child in node.children:
+                removed.add(id(child))
+                stack.append(child)
+            node.children = []
 
     def find_ancestors_and_remove_children(self, node, nodes):
         """
         Check ancestors of node for soft roots
         """
+        removed = set()
+        nodes = self._find_ancestors_and_cut_children(node, nodes, removed)
+        return self._exclude_removed(nodes, removed)
+
+    def _find_ancestors_and_cut_children(self, node, nodes, removed):
         if node.parent:
             if node.parent.attr.get("soft_root", False):
                 nodes = node.parent.get_descendants()
                 node.parent.parent = None
                 nodes = [node.parent] + nodes
             else:
-                nodes = self.find_ancestors_and_remove_children(
-                    node.parent, nodes)
+                nodes = self._find_ancestors_and_cut_children(
+                    node.parent, nodes, removed)
         else:
             for newnode in nodes:
                 if newnode != node and not newnode.parent:
-                    self.find_and_remove_children(newnode, nodes)
+                    self._cut_soft_root_children(newnode, removed)
         for child in node.children:
             if child != node:
-                self.find_and_remove_children(child, nodes)
+                self._cut_soft_root_children(child, removed)
         return nodes
 
 
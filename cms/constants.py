@@ -31,6 +31,18 @@ SLUG_REGEXP = '[0-9A-Za-z-_.//]+'
 EXPIRE_NOW = 0
 # HTTP Specification says max caching should only be up to one year.
 MAX_EXPIRATION_TTL = 365 * 24 * 3600
+# Max number of seconds a request is allowed to hold the page cache
+# revalidation lock (see CMS_PAGE_CACHE_GRACE).
+PAGE_CACHE_LOCK_TTL = 30
+# Max number of page cache entries per process whose dependency keys
+# are remembered (see CMS_PAGE_CACHE_DEPENDENCIES).
+PAGE_CACHE_LOCAL_DEPENDENCIES_SIZE = 1000
+# Min number of seconds between two publications of the cache statistics
+# of a process, and how long published statistics are kept.
+CACHE_STATS_PUBLISH_INTERVAL = 10
+CACHE_STATS_TTL = 7 * 24 * 3600
+# Max number of processes publishing their cache statistics.
+CACHE_STATS_MAX_PROCESSES = 256
 
 PLUGIN_TOOLBAR_JS = "CMS._plugins.push([\"cms-plugin-%(pk)s\", %(config)s]);\n"
 
@@ -6,6 +6,7 @@ from collections import OrderedDict
 import cms
 
 from .subcommands.base import SubcommandsCommand
+from .subcommands.cache_stats import CacheStatsCommand
 from .subcommands.check import CheckInstallation
 from .subcommands.list import ListCommand
 from .subcommands.moderator import ModeratorCommand
@@ -14,11 +15,13 @@ from .subcommands.tree import FixTreeCommand
 from .subcommands.uninstall import UninstallCommand
 from .subcommands.copy import CopyCommand
 from .subcommands.delete_orphaned_plugins import DeleteOrphanedPluginsCommand
+from .subcommands.warm_cache import WarmCacheCommand
 
 
 class Command(SubcommandsCommand):
     command_name = 'cms'
     subcommands = OrderedDict((
+        ('cache-stats', CacheStatsCommand),
         ('check', CheckInstallation),
         ('copy', CopyCommand),
         ('delete-orphaned-plugins', DeleteOrphanedPluginsCommand),
@@ -27,6 +30,7 @@ class Command(SubcommandsCommand):
         ('moderator', ModeratorCommand),
         ('publisher-publish', PublishCommand),
         ('uninstall', UninstallCommand),
+        ('warm-cache', WarmCacheCommand),
     ))
     missing_args_message = 'one of the available sub commands must be provided'
 
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, print_function, unicode_literals
+
+from django.core.management.base import CommandError
+
+from cms.cache import stats
+from cms.utils.conf import get_cms_setting
+
+from .base import SubcommandsCommand
+
+
+COLUMNS = (
+    ('cache', '%-12s'),
+    ('site', '%5s'),
+    ('language', '%9s'),
+    ('hits', '%9s'),
+    ('misses', '%9s'),
+    ('ratio', '%7s'),
+    ('writes', '%9s'),
+    ('invalidations', '%14s'),
+    ('read ms', '%9s'),
+    ('write ms', '%9s'),
+    ('bytes read', '%12s'),
+    ('bytes written', '%14s'),
+)
+
+
+def get_report():
+    """
+    Returns a list of rows summarizing the statistics of the cache
+    statistics sink, one per cache, site and language.
+    """
+    rows = {}
+
+    for (cache_name, site_id, language, event), values in stats.get_stats_sink().get_stats().items():
+        group = (cache_name, '-' if site_id is None else str(site_id), language or '-')
+        rows.setdefault(group, {})[event] = values
+
+    report = []
+
+    for group, events in sorted(rows.items()):
+        hits, hit_duration, hit_size = events.get(stats.HIT, (0, 0.0, 0))
+        misses, miss_duration, miss_size = events.get(stats.MISS, (0, 0.0, 0))
+        writes, write_duration, write_size = events.get(stats.WRITE, (0, 0.0, 0))
+        invalidations = events.get(stats.INVALIDATION, (0, 0.0, 0))[0]
+        reads = hits + misses
+
+        report.append(group + (
+            hits,
+            misses,
+            '%d%%' % (100 * hits / reads) if reads else '-',
+            writes,
+            invalidations,
+            '%.2f' % (1000 * (hit_duration + miss_duration) / reads) if reads else '-',
+            '%.2f' % (1000 * write_duration / writes) if writes else '-',
+            hit_size + miss_size,
+            write_size,
+        ))
+    return report
+
+
+class CacheStatsCommand(SubcommandsCommand):
+    help_string = 'Shows the hit ratio and timings of the page, placeholder, menu and permission caches'
+    command_name = 'cache-stats'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', dest='reset', default=False,
+                            help='Discard the statistics collected so far')
+
+    def handle(self, *args, **options):
+        if not get_cms_setting('CACHE_STATS'):
+            raise CommandError('Cache statistics are disabled, set CMS_CACHE_STATS to True to collect them.')
+
+        if options.get('reset'):
+            stats.get_stats_sink().reset()
+            self.stdout.write('Cache statistics have been reset.\n')
+            return
+
+        report = get_report()
+
+        if not report:
+            self.stdout.write('No cache statistics have been collected yet.\n')
+            return
+
+        line = ' '.join(width for name, width in COLUMNS) + '\n'
+        self.stdout.write(line % tuple(name for name, width in COLUMNS))
+
+        for row in report:
+            self.stdout.write(line % row)
+
+        self.stdout.write('\nread ms and write ms are averages per operation, '
+                          'writes of the menu cache include building the menu.\n')
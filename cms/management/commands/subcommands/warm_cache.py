@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, print_function, unicode_literals
+
+import time
+
+from multiprocessing import Pool
+
+from django.core.management.base import CommandError
+
+from cms.sitemaps import CMSSitemap
+from cms.utils import get_current_site
+
+from .base import SubcommandsCommand
+
+
+def init_worker():
+    import django
+
+    # Required on platforms where worker processes are spawned
+    # instead of forked.
+    django.setup()
+
+
+def warm_url(args):
+    """
+    Renders the given url like an anonymous visitor would,
+    priming the page, placeholder and menu caches on the way.
+    """
+    from django.test import Client
+
+    url, host = args
+    start = time.time()
+
+    try:
+        status = Client(HTTP_HOST=host).get(url).status_code
+    except Exception as error:
+        status = repr(error)
+    return url, status, time.time() - start
+
+
+def throttle(items, rate):
+    """
+    Yields the given items, no faster than «rate» items per second.
+    """
+    for index, item in enumerate(items):
+        if rate and index:
+            time.sleep(1.0 / rate)
+        yield item
+
+
+class WarmCacheCommand(SubcommandsCommand):
+    help_string = 'Render all the published pages of the current site to fill the caches'
+    command_name = 'warm-cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-l', '--language', dest='language', help='Language code of the pages to render')
+        parser.add_argument('--host', dest='host',
+                            help='Host header of the requests, defaults to the domain of the current site')
+        parser.add_argument('--processes', dest='processes', type=int, default=1,
+                            help='Number of processes rendering pages in parallel')
+        parser.add_argument('--rate', dest='rate', type=float, default=0,
+                            help='Maximum number of pages to render per second')
+
+    def handle(self, *args, **options):
+        """
+        Renders the pages listed by the CMS sitemap
+        (published, public, not redirecting and not requiring login)
+        through the whole request / response cycle.
+        """
+        from django.core.cache import caches
+        from django.db import connections
+
+        language = options.get('language')
+        processes = options.get('processes')
+        host = options.get('host') or get_current_site().domain
+
+        if processes < 1:
+            raise CommandError('The number of processes must be at least 1.')
+
+        sitemap = CMSSitemap()
+        titles = sitemap.items()
+
+        if language:
+            titles = titles.filter(language=language)
+
+        urls = [(sitemap.location(title), host) for title in titles.select_related('page')]
+        total = len(urls)
+        urls = throttle(urls, options.get('rate'))
+
+        self.stdout.write('Rendering %d pages...\n' % total)
+
+        if processes == 1:
+            results = (warm_url(url) for url in urls)
+        else:
+            # Forked workers must not share the database
+            # and cache connections of this process.
+            for connection in connections.all():
+                connection.close()
+
+            for cache in caches.all():
+                cache.close()
+
+            pool = Pool(processes, initializer=init_worker)
+            results = pool.imap_unordered(warm_url, urls)
+
+        failures = 0
+
+        for index, (url, status, duration) in enumerate(results, start=1):
+            if status != 200:
+                failures += 1
+            self.stdout.write('[%d/%d] %s %s (%.2fs)\n' % (index, total, status, url, duration))
+
+        if processes > 1:
+            pool.close()
+            pool.join()
+
+        self.stdout.write('\n')
+        self.stdout.write('=' * 40)
+        self.stdout.write('\nRendered: %s\n' % total)
+        self.stdout.write('Failed:   %s\n' % failures)
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+from cms.cache.page import get_page_cache_response
+from cms.utils.conf import get_cms_setting
+from cms.utils.compat.dj import MiddlewareMixin
+
+
+class PageCacheMiddleware(MiddlewareMixin):
+    """
+    Serves anonymous requests straight from the page cache,
+    skipping the middleware below it and the page view.
+
+    Only requests without any cookie are considered, since those can't
+    belong to a logged in user or to a user in edit mode.
+    """
+
+    def is_cacheable_request(self, request):
+        if request.method not in ('GET', 'HEAD') or request.COOKIES:
+            return False
+
+        toolbar_parameters = (
+            get_cms_setting('CMS_TOOLBAR_URL__EDIT_ON'),
+            get_cms_setting('CMS_TOOLBAR_URL__EDIT_OFF'),
+            get_cms_setting('CMS_TOOLBAR_URL__BUILD'),
+            get_cms_setting('CMS_TOOLBAR_URL__DISABLE'),
+            'preview',
+        )
+        # Requests changing the toolbar state need to go through the toolbar
+        return not any(parameter in request.GET for parameter in toolbar_parameters)
+
+    def process_request(self, request):
+        if not get_cms_setting('PAGE_CACHE') or not self.is_cacheable_request(request):
+            return None
+        return get_page_cache_response(request)
@@ -98,8 +98,15 @@ class ToolbarMiddleware(MiddlewareMixin):
             except IndexError:
                 request.cms_latest_entry = -1
         request.toolbar = CMSToolbar(request)
+        # Placeholders are written to the cache in process_response()
+        request.toolbar._defer_placeholder_cache = True
 
     def process_response(self, request, response):
+        toolbar = getattr(request, 'toolbar', None)
+
+        if toolbar is not None:
+            toolbar.flush_placeholder_cache()
+
         if not self.is_cms_request(request):
             return response
 
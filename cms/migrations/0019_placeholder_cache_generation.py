@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cms', '0018_pagenode'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='placeholder',
+            name='cache_generation',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+    ]
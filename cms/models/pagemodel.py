@@ -502,7 +502,7 @@ class Page(models.Model):
                 self.publisher_public._update_title_path(language)
                 self.mark_as_published(language)
                 self.mark_descendants_as_published(language)
-        self.clear_cache()
+        self.clear_cache(menu=True)
         return self
 
     def _copy_titles(self, target, language, published):
@@ -886,6 +886,11 @@ class Page(models.Model):
             public_page = Page(created_by=self.created_by)
             public_languages = [language]
 
+        if get_cms_setting('PAGE_CACHE_DEPENDENCIES') and public_page.pk:
+            old_menu_state = public_page._get_menu_state(language)
+        else:
+            old_menu_state = None
+
         self._copy_attributes(public_page, clean=False)
 
         if language not in public_languages:
@@ -936,17 +941,62 @@ class Page(models.Model):
 
         cms_signals.post_publish.send(sender=Page, instance=self, language=language)
 
+        if old_menu_state:
+            # Only invalidate the navigation of the cached pages
+            # if something the cms menu is built from changed.
+            menu_changed = old_menu_state != public_page._get_menu_state(language)
+        else:
+            menu_changed = True
+
         public_page.clear_cache(
             language,
             menu=True,
             placeholder=True,
+            menu_dependency=menu_changed,
         )
         return True
 
-    def clear_cache(self, language=None, menu=False, placeholder=False):
+    def _get_menu_state(self, language):
+        """
+        Returns the attributes of this page and its translation in the
+        given language which the navigation nodes are built from.
+        """
+        page_fields = (
+            'in_navigation', 'soft_root', 'reverse_id', 'navigation_extenders',
+            'login_required', 'limit_visibility_in_menu', 'is_home',
+            'application_urls', 'application_namespace', 'languages',
+            'publication_date', 'publication_end_date',
+        )
+        title_fields = ('title', 'menu_title', 'slug', 'path', 'redirect', 'published')
+        title = self.get_title_obj(language, fallback=False, force_reload=True)
+        page_state = [getattr(self, field) for field in page_fields]
+        title_state = [getattr(title, field) for field in title_fields]
+        return page_state + title_state
+
+    def clear_cache(self, language=None, menu=False, placeholder=False, menu_dependency=None):
+        """
+        Clears the caches of this page. «menu_dependency» tells whether the
+        page caches depending on the navigation are cleared as well when
+        CMS_PAGE_CACHE_DEPENDENCIES is enabled, it defaults to «menu».
+        """
         from cms.cache import invalidate_cms_page_cache
+        from cms.cache.page import invalidate_page_cache_dependencies
+        from cms.cache.placeholder import clear_placeholder_inheritance_cache
+
+        if menu_dependency is None:
+            menu_dependency = menu
 
-        if get_cms_setting('PAGE_CACHE'):
+        if get_cms_setting('PAGE_CACHE') and get_cms_setting('PAGE_CACHE_DEPENDENCIES'):
+            # Clears only the page caches depending on this page
+            dependencies = [('page', pk) for pk in (self.pk, self.publisher_public_id) if pk]
+
+            if placeholder:
+                dependencies.extend(('placeholder', ph.pk) for ph in self.get_placeholders())
+
+            if menu_dependency:
+                dependencies.append(('menu', self.node.site_id))
+            invalidate_page_cache_dependencies(dependencies)
+        elif get_cms_setting('PAGE_CACHE'):
             # Clears all the page caches
             invalidate_cms_page_cache()
 
@@ -962,6 +1012,10 @@ class Page(models.Model):
             # Clears all menu caches for this page's site
             menu_pool.clear(site_id=self.node.site_id)
 
+        if menu and get_cms_setting('PLACEHOLDER_CACHE'):
+            # Placeholders are inherited along the page tree
+            clear_placeholder_inheritance_cache()
+
     def unpublish(self, language, site=None):
         """
         Removes this page from the public site
@@ -980,7 +1034,7 @@ class Page(models.Model):
         public_page = self.get_public_object()
         public_page.update_translations(language, published=False)
         public_page._clear_placeholders(language)
-        public_page.clear_cache(language)
+        public_page.clear_cache(language, menu=True)
 
         self.mark_descendants_pending(language)
 
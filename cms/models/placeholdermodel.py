@@ -1,17 +1,14 @@
 # -*- coding: utf-8 -*-
 
-import warnings
-
-from datetime import datetime, timedelta
-
 from django.contrib import admin
 from django.db import models
 from django.template.defaultfilters import title
-from django.utils import six
 from django.utils.encoding import python_2_unicode_compatible
-from django.utils.translation import ugettext_lazy as _, force_text
+from django.utils.translation import ugettext_lazy as _
 
 from cms.cache.placeholder import clear_placeholder_cache
+from cms.cache.plugin import get_plugin_cache_expiration, get_plugin_vary_cache_on
+from cms.cache.static_placeholder import clear_static_placeholders_cache
 from cms.exceptions import LanguageError
 from cms.utils import get_site_id
 from cms.utils.compat import DJANGO_1_8
@@ -36,6 +33,9 @@ class Placeholder(models.Model):
     """
     slot = models.CharField(_("slot"), max_length=255, db_index=True, editable=False)
     default_width = models.PositiveSmallIntegerField(_("width"), null=True, editable=False)
+    # Incremented every time the cache of the placeholder is cleared,
+    # see CMS_PLACEHOLDER_CACHE_GENERATIONS.
+    cache_generation = models.PositiveIntegerField(default=1, editable=False)
     cache_placeholder = True
     is_static = False
     is_editable = True
@@ -431,51 +431,12 @@ class Placeholder(models.Model):
 
         language = get_language_from_request(request, self.page)
         for instance, plugin in inner_plugin_iterator(language):
-            plugin_expiration = plugin.get_cache_expiration(
-                request, instance, self)
+            ttl = get_plugin_cache_expiration(
+                plugin, instance, self, request, response_timestamp)
 
-            # The plugin_expiration should only ever be either: None, a TZ-
-            # aware datetime, a timedelta, or an integer.
-            if plugin_expiration is None:
+            if ttl is None:
                 # Do not consider plugins that return None
                 continue
-            if isinstance(plugin_expiration, (datetime, timedelta)):
-                if isinstance(plugin_expiration, datetime):
-                    # We need to convert this to a TTL against the
-                    # response timestamp.
-                    try:
-                        delta = plugin_expiration - response_timestamp
-                    except TypeError:
-                        # Attempting to take the difference of a naive datetime
-                        # and a TZ-aware one results in a TypeError. Ignore
-                        # this plugin.
-                        warnings.warn(
-                            'Plugin %(plugin_class)s (%(pk)d) returned a naive '
-                            'datetime : %(value)s for get_cache_expiration(), '
-                            'ignoring.' % {
-                                'plugin_class': plugin.__class__.__name__,
-                                'pk': instance.pk,
-                                'value': force_text(plugin_expiration),
-                            })
-                        continue
-                else:
-                    # Its already a timedelta instance...
-                    delta = plugin_expiration
-                ttl = int(delta.total_seconds() + 0.5)
-            else:  # must be an int-like value
-                try:
-                    ttl = int(plugin_expiration)
-                except ValueError:
-                    # Looks like it was not very int-ish. Ignore this plugin.
-                    warnings.warn(
-                        'Plugin %(plugin_class)s (%(pk)d) returned '
-                        'unexpected value %(value)s for '
-                        'get_cache_expiration(), ignoring.' % {
-                            'plugin_class': plugin.__class__.__name__,
-                            'pk': instance.pk,
-                            'value': force_text(plugin_expiration),
-                        })
-                    continue
 
             min_ttl = min(ttl, min_ttl)
             if min_ttl <= 0:
@@ -490,6 +451,11 @@ class Placeholder(models.Model):
             site_id = self.page.node.site_id
         clear_placeholder_cache(self, language, get_site_id(site_id))
 
+        if get_cms_setting('PAGE_CACHE') and get_cms_setting('PAGE_CACHE_DEPENDENCIES'):
+            from cms.cache.page import invalidate_page_cache_dependencies
+
+            invalidate_page_cache_dependencies([('placeholder', self.pk)])
+
     def mark_as_dirty(self, language, clear_cache=True):
         """
         Utility method to mark the attached object of this placeholder
@@ -514,6 +480,8 @@ class Placeholder(models.Model):
 
         elif attached_model is StaticPlaceholder:
             StaticPlaceholder.objects.filter(draft=self).update(dirty=True)
+            # update() sends no signal
+            clear_static_placeholders_cache()
 
     def get_plugin_tree_order(self, language, parent_id=None):
         """
@@ -551,27 +519,7 @@ class Placeholder(models.Model):
         for instance, plugin in inner_plugin_iterator(language):
             if not instance:
                 continue
-            vary_on = plugin.get_vary_cache_on(request, instance, self)
-            if not vary_on:
-                # None, or an empty iterable
-                continue
-            if isinstance(vary_on, six.string_types):
-                if vary_on.lower() not in vary_list:
-                    vary_list.add(vary_on.lower())
-            else:
-                try:
-                    for vary_on_item in iter(vary_on):
-                        if vary_on_item.lower() not in vary_list:
-                            vary_list.add(vary_on_item.lower())
-                except TypeError:
-                    warnings.warn(
-                        'Plugin %(plugin_class)s (%(pk)d) returned '
-                        'unexpected value %(value)s for '
-                        'get_vary_cache_on(), ignoring.' % {
-                            'plugin_class': plugin.__class__.__name__,
-                            'pk': instance.pk,
-                            'value': force_text(vary_on),
-                        })
+            vary_list.update(get_plugin_vary_cache_on(plugin, instance, self, request))
 
         return sorted(list(vary_list))
 
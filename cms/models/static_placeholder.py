@@ -72,6 +72,7 @@ class StaticPlaceholder(models.Model):
             self.public.clear(language=language)
             plugins = self.draft.get_plugins_list(language=language)
             copy_plugins_to(plugins, self.public, no_signals=True)
+            self.public.clear_cache(language, site_id=self.site_id)
             self.dirty = False
             self.save()
             return True
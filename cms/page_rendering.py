@@ -7,12 +7,20 @@ from django.template.response import TemplateResponse
 
 from cms import __version__
 from cms.cache.page import set_page_cache
+from cms.cache.stats import add_server_timing_header
 from cms.models import Page
+from cms.toolbar.utils import get_toolbar_from_request
 from cms.utils.conf import get_cms_setting
 from cms.utils.page import get_page_template_from_request
 from cms.utils.page_permissions import user_can_change_page, user_can_view_page
 
 
+def _flush_placeholder_cache(response):
+    toolbar = get_toolbar_from_request(response._request)
+    toolbar.flush_placeholder_cache()
+    return response
+
+
 def render_page(request, page, current_language, slug):
     """
     Renders a page
@@ -28,8 +36,14 @@ def render_page(request, page, current_language, slug):
 
     template = get_page_template_from_request(request)
     response = TemplateResponse(request, template, context)
+    response.add_post_render_callback(_flush_placeholder_cache)
     response.add_post_render_callback(set_page_cache)
 
+    if get_cms_setting('CACHE_STATS_SERVER_TIMING'):
+        # Added once the response has been cached,
+        # the timings only apply to this response.
+        response.add_post_render_callback(add_server_timing_header)
+
     # Add headers for X Frame Options - this really should be changed upon moving to class based views
     xframe_options = page.get_xframe_options()
     # xframe_options can be None if there's no xframe information on the page
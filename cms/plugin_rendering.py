@@ -11,8 +11,25 @@ from django.template import Context
 from django.utils.functional import cached_property
 from django.utils.module_loading import import_string
 from django.utils.safestring import mark_safe
-
-from cms.cache.placeholder import get_placeholder_cache, set_placeholder_cache
+from django.utils.timezone import now
+
+from cms.cache.placeholder import (
+    get_placeholder_cache,
+    get_placeholder_cache_info,
+    get_placeholder_inheritance_cache,
+    get_placeholders_cache,
+    set_placeholder_inheritance_cache,
+    set_placeholder_cache,
+    set_placeholders_cache,
+)
+from cms.cache.plugin import (
+    get_plugin_cache_duration,
+    get_plugin_cache_key,
+    get_plugin_tree_vary_cache_on,
+    get_plugins_cache,
+    set_plugin_cache,
+)
+from cms.cache.static_placeholder import get_static_placeholders_version
 from cms.toolbar.utils import (
     get_placeholder_toolbar_js,
     get_plugin_toolbar_js,
@@ -20,6 +37,7 @@ from cms.toolbar.utils import (
 )
 from cms.utils import get_language_from_request
 from cms.utils.conf import get_cms_setting
+from cms.utils.moderator import use_draft
 from cms.utils.permissions import has_plugin_permission
 from cms.utils.placeholder import get_toolbar_plugin_struct, restore_sekizai_context
 from cms.utils.plugins import get_plugin_restrictions
@@ -82,6 +100,7 @@ class BaseRenderer(object):
         self._placeholders_by_page_cache = {}
         self._rendered_placeholders = OrderedDict()
         self._rendered_static_placeholders = OrderedDict()
+        self._placeholders_cache_info = {}
         self._rendered_plugins_by_placeholder = {}
 
     @cached_property
@@ -96,6 +115,12 @@ class BaseRenderer(object):
     def toolbar(self):
         return get_toolbar_from_request(self.request)
 
+    @cached_property
+    def static_placeholders_version(self):
+        # The static placeholders registry is looked up
+        # once per request, whatever the number of tags.
+        return get_static_placeholders_version()
+
     @cached_property
     def templates(self):
         return self.toolbar.templates
@@ -172,6 +197,18 @@ class BaseRenderer(object):
         rendered = list(self._rendered_placeholders.values())
         return [r.placeholder for r in rendered]
 
+    def get_placeholder_cache_info(self, placeholder):
+        """
+        Returns the (ttl, vary_on_list) tuple of the given placeholder,
+        computed once per render and shared by the page and placeholder caches.
+        """
+        try:
+            return self._placeholders_cache_info[placeholder.pk]
+        except KeyError:
+            cache_info = get_placeholder_cache_info(placeholder, self.request)
+            self._placeholders_cache_info[placeholder.pk] = cache_info
+        return cache_info
+
     def get_rendered_editable_placeholders(self):
         rendered = list(self._rendered_placeholders.values())
         return [r.placeholder for r in rendered if r.editable]
@@ -196,11 +233,26 @@ class ContentRenderer(BaseRenderer):
     def __init__(self, request):
         super(ContentRenderer, self).__init__(request)
         self._placeholders_are_editable = bool(self.toolbar.edit_mode_active)
+        # Staff users see the draft content unless they preview the published one
+        self._placeholders_are_draft = use_draft(request)
+        self._pending_placeholder_cache = OrderedDict()
+        self._plugin_cache_keys = {}
+        self._placeholder_inheritance_keys = {}
+        self._inherited_placeholders = {}
+        self._inheritance_sources = {}
+        self._plugins_content_cache = {}
 
     def placeholder_cache_is_enabled(self):
         if not get_cms_setting('PLACEHOLDER_CACHE'):
             return False
-        if self.request.user.is_staff:
+        if self._placeholders_are_draft:
+            return False
+        return not self._placeholders_are_editable
+
+    def plugin_cache_is_enabled(self):
+        if not get_cms_setting('PLUGIN_FRAGMENT_CACHE'):
+            return False
+        if self._placeholders_are_draft:
             return False
         return not self._placeholders_are_editable
 
@@ -267,13 +319,27 @@ class ContentRenderer(BaseRenderer):
                 'content': placeholder_content,
                 'sekizai': watcher.get_changes(),
             }
-            set_placeholder_cache(
-                placeholder,
-                lang=language,
-                site_id=self.current_site.pk,
-                content=content,
-                request=self.request,
-            )
+            if self.toolbar._defer_placeholder_cache:
+                # Written along with the other placeholders
+                # once the response has been rendered.
+                site_id = self.current_site.pk
+                pending_key = (placeholder.pk, language, site_id)
+                self._pending_placeholder_cache[pending_key] = (
+                    placeholder,
+                    language,
+                    site_id,
+                    content,
+                    self.get_placeholder_cache_info(placeholder),
+                )
+            else:
+                set_placeholder_cache(
+                    placeholder,
+                    lang=language,
+                    site_id=self.current_site.pk,
+                    content=content,
+                    request=self.request,
+                    cache_info=self.get_placeholder_cache_info(placeholder),
+                )
 
         rendered_placeholder = RenderedPlaceholder(
             placeholder=placeholder,
@@ -302,6 +368,15 @@ class ContentRenderer(BaseRenderer):
         context.pop()
         return mark_safe(placeholder_content)
 
+    def flush_placeholder_cache(self):
+        """
+        Writes the placeholders rendered since the last call to the cache.
+        """
+        if self._pending_placeholder_cache:
+            entries = list(self._pending_placeholder_cache.values())
+            self._pending_placeholder_cache.clear()
+            set_placeholders_cache(entries, request=self.request)
+
     def get_editable_placeholder_context(self, placeholder, page=None):
         placeholder_cache = self.get_rendered_plugins_cache(placeholder)
         placeholder_toolbar_js = self.get_placeholder_toolbar_js(placeholder, page)
@@ -342,19 +417,38 @@ class ContentRenderer(BaseRenderer):
                 use_cache=True,
                 nodelist=None,
             )
-        parent_page = current_page.parent_page
-        should_inherit = (
-            inherit
-            and not content and parent_page
-            # The placeholder cache is primed when the first placeholder
-            # is loaded. If the current page's parent is not in there,
-            # it means its cache was never primed as it wasn't necessary.
-            and parent_page.pk in placeholder_cache
-            # don't display inherited plugins in edit mode, so that the user doesn't
-            # mistakenly edit/delete them. This is a fix for issue #1303. See the discussion
-            # there for possible enhancements
-            and not self.toolbar.edit_mode_active
-        )
+        inheritance_key = (current_page.pk, slot)
+
+        if inherit and not content and inheritance_key in self._inherited_placeholders:
+            # The inheritance of this slot is known already,
+            # no need to walk up the ancestors.
+            source = self._inherited_placeholders[inheritance_key]
+            should_inherit = False
+
+            if source is not None:
+                content = self.render_placeholder(
+                    source,
+                    context=context,
+                    page=source.page,
+                    editable=False,
+                    use_cache=True,
+                    nodelist=None,
+                )
+        else:
+            source = placeholder if content else None
+            parent_page = current_page.parent_page if inherit and not content else None
+            should_inherit = (
+                inherit
+                and not content and parent_page
+                # The placeholder cache is primed when the first placeholder
+                # is loaded. If the current page's parent is not in there,
+                # it means its cache was never primed as it wasn't necessary.
+                and parent_page.pk in placeholder_cache
+                # don't display inherited plugins in edit mode, so that the user doesn't
+                # mistakenly edit/delete them. This is a fix for issue #1303. See the discussion
+                # there for possible enhancements
+                and not self.toolbar.edit_mode_active
+            )
 
         if should_inherit:
             # nodelist is set to None to avoid rendering the nodes inside
@@ -367,6 +461,14 @@ class ContentRenderer(BaseRenderer):
                 nodelist=None,
                 editable=False,
             )
+            source = self._inheritance_sources.get((parent_page.pk, slot)) if content else None
+
+        if inherit and inheritance_key in self._placeholder_inheritance_keys:
+            set_placeholder_inheritance_cache(
+                self._placeholder_inheritance_keys.pop(inheritance_key),
+                (source.page.pk, source.pk) if source else (),
+            )
+        self._inheritance_sources[inheritance_key] = source
 
         if placeholder and (editable and self._placeholders_are_editable):
             # In edit mode, the contents of the placeholder are mixed with our
@@ -411,6 +513,8 @@ class ContentRenderer(BaseRenderer):
         return content
 
     def render_plugin(self, instance, context, placeholder=None, editable=False):
+        from sekizai.helpers import Watcher
+
         if not placeholder:
             placeholder = instance.placeholder
 
@@ -419,6 +523,19 @@ class ContentRenderer(BaseRenderer):
         if not instance or not plugin.render_plugin:
             return ''
 
+        if not editable and self.plugin_cache_is_enabled():
+            cache_key = self._get_plugin_cache_key(instance, plugin, placeholder)
+        else:
+            cache_key = None
+
+        if cache_key:
+            cached_value = self._get_cached_plugin_content(cache_key[0])
+
+            if cached_value is not None:
+                restore_sekizai_context(context, cached_value['sekizai'])
+                return mark_safe(cached_value['content'])
+            watcher = Watcher(context)
+
         # we'd better pass a flat dict to template.render
         # as plugin.render can return pretty much any kind of context / dictionary
         # we'd better flatten it and force to a Context object
@@ -438,6 +555,14 @@ class ContentRenderer(BaseRenderer):
             processor = import_string(path)
             content = processor(instance, placeholder, content, context)
 
+        if cache_key:
+            cached_value = {
+                'content': content,
+                'sekizai': watcher.get_changes(),
+            }
+            set_plugin_cache(cache_key[0], cached_value, duration=cache_key[1])
+            self._plugins_content_cache[cache_key[0]] = cached_value
+
         if editable:
             content = self.plugin_edit_template.format(pk=instance.pk, content=content)
             placeholder_cache = self._rendered_plugins_by_placeholder.setdefault(placeholder.pk, {})
@@ -451,10 +576,71 @@ class ContentRenderer(BaseRenderer):
             language=language,
         )
 
+        if not editable and self.plugin_cache_is_enabled():
+            # Fetch the fragments of all the plugins in one round trip
+            self._preload_plugins_cache(placeholder)
+
         for plugin in plugins:
             plugin._placeholder_cache = placeholder
             yield self.render_plugin(plugin, context, placeholder, editable)
 
+    def _get_plugin_cache_key(self, instance, plugin, placeholder):
+        """
+        Returns a (key, duration) tuple for the fragment cache of the given
+        plugin instance or None if the plugin can't be cached.
+        """
+        if instance.pk in self._plugin_cache_keys:
+            return self._plugin_cache_keys[instance.pk]
+
+        duration = get_plugin_cache_duration(plugin, instance, placeholder, self.request, now())
+
+        if duration > 0:
+            key = get_plugin_cache_key(
+                instance,
+                site_id=self.current_site.pk,
+                request=self.request,
+                vary_on_list=get_plugin_tree_vary_cache_on(plugin, instance, placeholder, self.request),
+            )
+            cache_key = (key, duration)
+        else:
+            cache_key = None
+        self._plugin_cache_keys[instance.pk] = cache_key
+        return cache_key
+
+    def _get_cached_plugin_content(self, key):
+        """
+        Returns a dictionary mapping plugin content and sekizai data.
+        Returns None if no cache is present.
+        """
+        if key not in self._plugins_content_cache:
+            self._plugins_content_cache[key] = get_plugins_cache([key]).get(key)
+        return self._plugins_content_cache[key]
+
+    def _preload_plugins_cache(self, placeholder):
+        """
+        Populates the internal fragment cache with all the plugins
+        of the given placeholder, including the child plugins.
+        """
+        keys = []
+
+        for instance in getattr(placeholder, '_all_plugins_cache', []):
+            instance, plugin = instance.get_plugin_instance()
+
+            if not instance or not plugin.render_plugin:
+                continue
+
+            cache_key = self._get_plugin_cache_key(instance, plugin, placeholder)
+
+            if cache_key and cache_key[0] not in self._plugins_content_cache:
+                keys.append(cache_key[0])
+
+        if keys:
+            cached_values = get_plugins_cache(keys)
+
+            for key in keys:
+                # None means nothing in the cache
+                self._plugins_content_cache[key] = cached_values.get(key)
+
     def _get_cached_placeholder_content(self, placeholder, language):
         """
         Returns a dictionary mapping placeholder content and sekizai data.
@@ -482,6 +668,84 @@ class ContentRenderer(BaseRenderer):
                 language_cache[placeholder.pk] = cached_value
         return language_cache.get(placeholder.pk)
 
+    def _get_cached_placeholders_content(self, placeholders, language):
+        """
+        Returns a dictionary mapping the primary key of each of the given
+        placeholders to its content and sekizai data.
+        Placeholders with no cache are left out.
+        """
+        site_id = self.current_site.pk
+        site_cache = self._placeholders_content_cache.setdefault(site_id, {})
+        language_cache = site_cache.setdefault(language, {})
+        placeholders_to_fetch = [pl for pl in placeholders if pl.pk not in language_cache]
+
+        if placeholders_to_fetch:
+            # Fetch all the placeholders in a couple round trips
+            # instead of a couple per placeholder.
+            cached_values = get_placeholders_cache(
+                placeholders_to_fetch,
+                lang=language,
+                site_id=site_id,
+                request=self.request,
+            )
+            language_cache.update(cached_values)
+        return dict((pl.pk, language_cache[pl.pk]) for pl in placeholders if pl.pk in language_cache)
+
+    def _preload_inherited_placeholders(self, page, slots):
+        """
+        Loads the placeholders the given slots of the page inherit from,
+        according to the cache. Returns the slots with a known inheritance.
+        """
+        from cms.models import Page, Placeholder
+
+        cached_resolutions = get_placeholder_inheritance_cache(
+            page.pk,
+            slots,
+            lang=self.request_language,
+            site_id=self.current_site.pk,
+        )
+        resolutions = {}
+
+        for slot, (key, resolution) in cached_resolutions.items():
+            if resolution is None:
+                # Resolved, and cached, once the placeholder is rendered
+                self._placeholder_inheritance_keys[(page.pk, slot)] = key
+            else:
+                resolutions[slot] = resolution
+
+        sources = [resolution for resolution in resolutions.values() if resolution]
+
+        if sources:
+            pages = Page.objects.in_bulk([page_id for page_id, placeholder_id in sources])
+            placeholders = Placeholder.objects.in_bulk([placeholder_id for page_id, placeholder_id in sources])
+        else:
+            pages = placeholders = {}
+
+        resolved_slots = []
+
+        for slot, resolution in resolutions.items():
+            if resolution:
+                page_id, placeholder_id = resolution
+
+                if page_id not in pages or placeholder_id not in placeholders:
+                    # Deleted since, resolve it again
+                    self._placeholder_inheritance_keys[(page.pk, slot)] = cached_resolutions[slot][0]
+                    continue
+
+                source = placeholders[placeholder_id]
+                source.page = pages[page_id]
+            else:
+                source = None
+            self._inherited_placeholders[(page.pk, slot)] = source
+            resolved_slots.append(slot)
+
+        # Fetch the content of the inherited placeholders in one go
+        self._get_cached_placeholders_content(
+            [source for source in self._inherited_placeholders.values() if source],
+            language=self.request_language,
+        )
+        return resolved_slots
+
     def _preload_placeholders_for_page(self, page, slots=None, inherit=False):
         """
         Populates the internal plugin cache of each placeholder
@@ -509,12 +773,15 @@ class ContentRenderer(BaseRenderer):
             slots_w_inheritance = []
 
         if self.placeholder_cache_is_enabled():
-            _cached_content = self._get_cached_placeholder_content
+            _cached_content = self._get_cached_placeholders_content(
+                placeholders,
+                language=self.request_language,
+            )
             # Only prefetch plugins if the placeholder
             # has not been cached.
             placeholders_to_fetch = [
                 placeholder for placeholder in placeholders
-                if _cached_content(placeholder, self.request_language) == None]
+                if placeholder.pk not in _cached_content]
         else:
             # cache is disabled, prefetch plugins for all
             # placeholders in the page.
@@ -529,7 +796,6 @@ class ContentRenderer(BaseRenderer):
                 is_fallback=inherit,
             )
 
-        parent_page = page.parent_page
         # Inherit only placeholders that have no plugins
         # or are not cached.
         placeholders_to_inherit = [
@@ -537,9 +803,14 @@ class ContentRenderer(BaseRenderer):
             if not getattr(pl, '_plugins_cache', None) and pl.slot in slots_w_inheritance
         ]
 
-        if parent_page and placeholders_to_inherit:
+        if placeholders_to_inherit and not inherit and self.placeholder_cache_is_enabled():
+            # Ancestors are only loaded for slots whose inheritance is unknown
+            resolved_slots = self._preload_inherited_placeholders(page, placeholders_to_inherit)
+            placeholders_to_inherit = [slot for slot in placeholders_to_inherit if slot not in resolved_slots]
+
+        if placeholders_to_inherit and page.parent_page:
             self._preload_placeholders_for_page(
-                page=parent_page,
+                page=page.parent_page,
                 slots=placeholders_to_inherit,
                 inherit=True,
             )
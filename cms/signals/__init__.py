@@ -1,17 +1,20 @@
 # -*- coding: utf-8 -*-
 
+from cms.cache.stats import reset_request_stats
 from cms.signals.apphook import debug_server_restart, trigger_server_restart
 from cms.signals.page import pre_save_page, pre_delete_page, post_delete_page
 from cms.signals.permissions import post_save_user, post_save_user_group, pre_save_user, pre_delete_user, pre_save_group, pre_delete_group, pre_save_pagepermission, pre_delete_pagepermission, pre_save_globalpagepermission, pre_delete_globalpagepermission
 from cms.signals.placeholder import pre_delete_placeholder_ref, post_delete_placeholder_ref
 from cms.signals.plugins import post_delete_plugins, pre_save_plugins, pre_delete_plugins
+from cms.signals.static_placeholder import post_save_static_placeholder, post_delete_static_placeholder
 from cms.signals.title import pre_save_title
 from cms.utils.conf import get_cms_setting
 
+from django.core.signals import request_started
 from django.db.models import signals
 from django.dispatch import Signal
 
-from cms.models import Page, Title, CMSPlugin, PagePermission, GlobalPagePermission, PageUser, PageUserGroup, PlaceholderReference
+from cms.models import Page, Title, CMSPlugin, PagePermission, GlobalPagePermission, PageUser, PageUserGroup, PlaceholderReference, StaticPlaceholder
 from django.conf import settings
 from django.contrib.auth.models import User, Group
 
@@ -82,6 +85,10 @@ urls_need_reloading.connect(
     dispatch_uid='aldryn-apphook-reload-handle-urls-need-reloading'
 )
 
+######################### cache #########################
+
+request_started.connect(reset_request_stats, dispatch_uid='cms_reset_request_cache_stats')
+
 ######################### plugins #######################
 
 signals.pre_delete.connect(pre_delete_plugins, sender=CMSPlugin, dispatch_uid='cms_pre_delete_plugin')
@@ -105,6 +112,13 @@ signals.pre_delete.connect(pre_delete_placeholder_ref, sender=PlaceholderReferen
 signals.post_delete.connect(post_delete_placeholder_ref, sender=PlaceholderReference,
                             dispatch_uid='cms_post_delete_placeholder_ref')
 
+################### static placeholder ###################
+
+signals.post_save.connect(post_save_static_placeholder, sender=StaticPlaceholder,
+                          dispatch_uid='cms_post_save_static_placeholder')
+signals.post_delete.connect(post_delete_static_placeholder, sender=StaticPlaceholder,
+                            dispatch_uid='cms_post_delete_static_placeholder')
+
 ###################### permissions #######################
 
 if get_cms_setting('PERMISSION'):
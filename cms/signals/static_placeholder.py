@@ -0,0 +1,10 @@
+# -*- coding: utf-8 -*-
+from cms.cache.static_placeholder import clear_static_placeholders_cache
+
+
+def post_save_static_placeholder(instance, **kwargs):
+    clear_static_placeholders_cache()
+
+
+def post_delete_static_placeholder(instance, **kwargs):
+    clear_static_placeholders_cache()
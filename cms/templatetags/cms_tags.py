@@ -27,6 +27,7 @@ from classytags.utils import flatten_context
 from classytags.values import ListValue, StringValue
 
 from cms.cache.page import get_page_url_cache, set_page_url_cache
+from cms.cache.static_placeholder import get_static_placeholder
 from cms.exceptions import PlaceholderNotFound
 from cms.models import Page, Placeholder as PlaceholderModel, CMSPlugin, StaticPlaceholder
 from cms.plugin_pool import plugin_pool
@@ -868,16 +869,12 @@ class StaticPlaceholderNode(Tag):
         if isinstance(code, StaticPlaceholder):
             static_placeholder = code
         else:
-            kwargs = {
-                'code': code,
-                'defaults': {'creation_method': StaticPlaceholder.CREATION_BY_TEMPLATE}
-            }
-
-            if 'site' in extra_bits:
-                kwargs['site'] = get_current_site()
-            else:
-                kwargs['site_id__isnull'] = True
-            static_placeholder = StaticPlaceholder.objects.get_or_create(**kwargs)[0]
+            static_placeholder = get_static_placeholder(
+                code,
+                site=get_current_site(),
+                site_bound='site' in extra_bits,
+                version=renderer.static_placeholders_version,
+            )
 
         content = renderer.render_static_placeholder(
             static_placeholder,
@@ -8,18 +8,20 @@ from django.template import Context
 from sekizai.context import SekizaiContext
 
 from cms.api import add_plugin, create_page, create_title
-from cms.cache import _get_cache_version, invalidate_cms_page_cache
+from cms.cache import _get_cache_version, invalidate_cms_page_cache, stats
+from cms.cache.page import _page_cache_key, _page_cache_lock_key, get_page_cache
 from cms.cache.placeholder import (
     _get_placeholder_cache_version_key,
     _get_placeholder_cache_version,
     _set_placeholder_cache_version,
-    _get_placeholder_cache_key,
     set_placeholder_cache,
     get_placeholder_cache,
+    get_placeholder_cache_info,
+    get_placeholders_cache,
     clear_placeholder_cache,
 )
 from cms.exceptions import PluginAlreadyRegistered
-from cms.models import Page
+from cms.models import Page, Placeholder
 from cms.plugin_pool import plugin_pool
 from cms.test_utils.project.placeholderapp.models import Example1
 from cms.test_utils.project.pluginapp.plugins.caching.cms_plugins import (
@@ -637,6 +639,710 @@ class CacheTestCase(CMSTestCase):
             response = self.client.get(page1_url)
             self.assertContains(response, 'Second content')
 
+    def test_page_cache_grace(self):
+        from django.core.cache import cache
+
+        exclude = [
+            'django.middleware.cache.UpdateCacheMiddleware',
+            'django.middleware.cache.FetchFromCacheMiddleware'
+        ]
+        overrides = dict(CMS_PAGE_CACHE_GRACE=60)
+        if getattr(settings, 'MIDDLEWARE', None):
+            overrides['MIDDLEWARE'] = [mw for mw in settings.MIDDLEWARE if mw not in exclude]
+        else:
+            overrides['MIDDLEWARE_CLASSES'] = [mw for mw in settings.MIDDLEWARE_CLASSES if mw not in exclude]
+        with self.settings(**overrides):
+            page1 = create_page('test page 1', 'nav_playground.html', 'en', published=True)
+            page1_url = page1.get_absolute_url()
+            placeholder = page1.placeholders.get(slot="body")
+            add_plugin(placeholder, "TextPlugin", 'en', body="First content")
+            page1.publish('en')
+            lock_key = _page_cache_lock_key(self.get_request(page1_url))
+
+            # Prime the cache
+            response = self.client.get(page1_url)
+            self.assertContains(response, 'First content')
+            self.assertIsNone(cache.get(lock_key))
+
+            add_plugin(placeholder, "TextPlugin", 'en', body="Second content")
+            page1.publish('en')
+
+            # Another request is busy rendering the page,
+            # the stale content is served without hitting the database.
+            cache.add(lock_key, True, 10)
+            with self.assertNumQueries(0):
+                response = self.client.get(page1_url)
+            self.assertContains(response, 'First content')
+            self.assertNotContains(response, 'Second content')
+            self.assertIn('max-age=0', response['Cache-Control'])
+
+            # The lock is released, the next request renders the page
+            # and releases the lock it acquired.
+            cache.delete(lock_key)
+            response = self.client.get(page1_url)
+            self.assertContains(response, 'Second content')
+            self.assertIsNone(cache.get(lock_key))
+
+            with self.assertNumQueries(0):
+                response = self.client.get(page1_url)
+            self.assertContains(response, 'Second content')
+
+    def test_page_cache_grace_uncacheable(self):
+        from django.core.cache import cache
+
+        exclude = [
+            'django.middleware.cache.UpdateCacheMiddleware',
+            'django.middleware.cache.FetchFromCacheMiddleware'
+        ]
+        overrides = dict(CMS_PAGE_CACHE_GRACE=60)
+        if getattr(settings, 'MIDDLEWARE', None):
+            overrides['MIDDLEWARE'] = [mw for mw in settings.MIDDLEWARE if mw not in exclude]
+        else:
+            overrides['MIDDLEWARE_CLASSES'] = [mw for mw in settings.MIDDLEWARE_CLASSES if mw not in exclude]
+        plugin_pool.register_plugin(NoCachePlugin)
+
+        try:
+            with self.settings(**overrides):
+                page1 = create_page('test page 1', 'nav_playground.html', 'en', published=True)
+                page1_url = page1.get_absolute_url()
+                placeholder = page1.placeholders.get(slot="body")
+                add_plugin(placeholder, "TextPlugin", 'en', body="First content")
+                page1.publish('en')
+                lock_key = _page_cache_lock_key(self.get_request(page1_url))
+
+                # Prime the cache
+                response = self.client.get(page1_url)
+                self.assertContains(response, 'First content')
+
+                # The page can no longer be cached
+                add_plugin(placeholder, "NoCachePlugin", 'en')
+                add_plugin(placeholder, "TextPlugin", 'en', body="Second content")
+                page1.publish('en')
+
+                # The request rendering the page releases the lock
+                # even though the page isn't cached.
+                response = self.client.get(page1_url)
+                self.assertContains(response, 'Second content')
+                self.assertIsNone(cache.get(lock_key))
+
+                # The next request renders the page again
+                # instead of serving the stale content.
+                add_plugin(placeholder, "TextPlugin", 'en', body="Third content")
+                page1.publish('en')
+                response = self.client.get(page1_url)
+                self.assertContains(response, 'Third content')
+                self.assertIsNone(cache.get(lock_key))
+        finally:
+            plugin_pool.unregister_plugin(NoCachePlugin)
+
+    def test_page_cache_dependencies(self):
+        exclude = [
+            'django.middleware.cache.UpdateCacheMiddleware',
+            'django.middleware.cache.FetchFromCacheMiddleware'
+        ]
+        overrides = dict(CMS_PAGE_CACHE_DEPENDENCIES=True)
+        if getattr(settings, 'MIDDLEWARE', None):
+            overrides['MIDDLEWARE'] = [mw for mw in settings.MIDDLEWARE if mw not in exclude]
+        else:
+            overrides['MIDDLEWARE_CLASSES'] = [mw for mw in settings.MIDDLEWARE_CLASSES if mw not in exclude]
+        with self.settings(**overrides):
+            page1 = create_page('test page 1', 'nav_playground.html', 'en', published=True, in_navigation=True)
+            page2 = create_page('test page 2', 'nav_playground.html', 'en', published=True, in_navigation=True)
+            page1_url = page1.get_absolute_url()
+            page2_url = page2.get_absolute_url()
+            placeholder = page1.placeholders.get(slot="body")
+            add_plugin(placeholder, "TextPlugin", 'en', body="First content")
+            page1.publish('en')
+
+            # Prime the cache
+            self.client.get(page1_url)
+            response = self.client.get(page2_url)
+            self.assertContains(response, 'test page 1')
+
+            # Publishing new content only invalidates the published page
+            add_plugin(placeholder, "TextPlugin", 'en', body="Second content")
+            page1.publish('en')
+
+            with self.assertNumQueries(0):
+                self.client.get(page2_url)
+            response = self.client.get(page1_url)
+            self.assertContains(response, 'Second content')
+
+            # Changing the title changes the navigation of every page
+            title = page1.get_title_obj('en')
+            title.title = 'renamed page 1'
+            title.save()
+            page1.publish('en')
+
+            response = self.client.get(page2_url)
+            self.assertContains(response, 'renamed page 1')
+
+    def test_page_cache_dependencies_page_url(self):
+        with self.settings(CMS_PAGE_CACHE_DEPENDENCIES=True):
+            create_page('home', 'nav_playground.html', 'en', published=True)
+            page1 = create_page(
+                'test page 1',
+                'nav_playground.html',
+                'en',
+                published=True,
+                reverse_id='page1',
+                slug='page1',
+            )
+            template = '{% load cms_tags %}{% page_url "page1" %}'
+
+            def render():
+                request = self.get_request('/en/')
+                return self.render_template_obj(template, {'request': request}, request)
+
+            self.assertEqual(render(), '/en/page1/')
+
+            # Changing the slug changes the url
+            title = page1.get_title_obj('en')
+            title.slug = 'renamed'
+            title.save()
+            page1._update_title_path('en')
+            page1.publish('en')
+            self.assertEqual(render(), '/en/renamed/')
+
+    def test_page_cache_dependencies_round_trips(self):
+        from django.core.cache import cache
+        from mock import patch
+
+        from cms.cache import page as page_cache
+
+        exclude = [
+            'django.middleware.cache.UpdateCacheMiddleware',
+            'django.middleware.cache.FetchFromCacheMiddleware'
+        ]
+        overrides = dict(CMS_PAGE_CACHE_DEPENDENCIES=True)
+        if getattr(settings, 'MIDDLEWARE', None):
+            overrides['MIDDLEWARE'] = [mw for mw in settings.MIDDLEWARE if mw not in exclude]
+        else:
+            overrides['MIDDLEWARE_CLASSES'] = [mw for mw in settings.MIDDLEWARE_CLASSES if mw not in exclude]
+        with self.settings(**overrides):
+            page1 = create_page('test page 1', 'nav_playground.html', 'en', published=True, in_navigation=True)
+            page2 = create_page('test page 2', 'nav_playground.html', 'en', published=True, in_navigation=True)
+            page1_url = page1.get_absolute_url()
+            page2_url = page2.get_absolute_url()
+
+            # Prime the cache
+            self.client.get(page1_url)
+            menu_key = page_cache._page_cache_dependency_key('menu', settings.SITE_ID)
+            menu_version = cache.get(menu_key)
+            self.assertIsNotNone(menu_version)
+
+            # The existing versions are not re-written
+            page_key = page_cache._page_cache_dependency_key('page', page2.pk)
+            self.assertIsNone(cache.get(page_key))
+
+            with patch.object(cache, 'set_many', wraps=cache.set_many) as set_many:
+                with patch.object(cache, 'set', wraps=cache.set) as set_:
+                    versions = page_cache._get_page_cache_dependency_versions([menu_key, page_key])
+            self.assertEqual(set_many.call_count + set_.call_count, 0)
+            self.assertEqual(versions[menu_key], menu_version)
+            self.assertEqual(cache.get(page_key), versions[page_key])
+            response = self.client.get(page2_url)
+            self.assertContains(response, 'test page 1')
+
+            # A hit is a single round trip, even for an entry
+            # which was not written by this process.
+            page_cache._local_dependency_keys.clear()
+            request = self.get_request(page1_url)
+            self.assertIsNotNone(get_page_cache(request))
+
+            with patch.object(cache, 'get_many', wraps=cache.get_many) as get_many:
+                with patch.object(cache, 'get', wraps=cache.get) as get:
+                    self.assertIsNotNone(get_page_cache(request))
+            self.assertEqual(get_many.call_count + get.call_count, 1)
+
+    def test_page_cache_compression(self):
+        import gzip
+        from io import BytesIO
+
+        exclude = [
+            'django.middleware.cache.UpdateCacheMiddleware',
+            'django.middleware.cache.FetchFromCacheMiddleware'
+        ]
+        overrides = dict(CMS_PAGE_CACHE_COMPRESSION=True)
+        if getattr(settings, 'MIDDLEWARE', None):
+            overrides['MIDDLEWARE'] = [mw for mw in settings.MIDDLEWARE if mw not in exclude]
+        else:
+            overrides['MIDDLEWARE_CLASSES'] = [mw for mw in settings.MIDDLEWARE_CLASSES if mw not in exclude]
+        with self.settings(**overrides):
+            page1 = create_page('test page 1', 'nav_playground.html', 'en', published=True)
+            page1_url = page1.get_absolute_url()
+            placeholder = page1.placeholders.get(slot="body")
+            add_plugin(placeholder, "TextPlugin", 'en', body="Cached content")
+            page1.publish('en')
+
+            # Prime the cache
+            response = self.client.get(page1_url)
+            self.assertContains(response, 'Cached content')
+            self.assertIn('Accept-Encoding', response['Vary'])
+
+            with self.assertNumQueries(0):
+                response = self.client.get(page1_url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            self.assertIn('Accept-Encoding', response['Vary'])
+            content = gzip.GzipFile(fileobj=BytesIO(response.content)).read()
+            self.assertIn(b'Cached content', content)
+
+            # Clients not accepting gzip get the decompressed content
+            with self.assertNumQueries(0):
+                response = self.client.get(page1_url, HTTP_ACCEPT_ENCODING='gzip;q=0')
+            self.assertFalse(response.has_header('Content-Encoding'))
+            self.assertContains(response, 'Cached content')
+
+    def test_page_cache_conditional_get(self):
+        from django.utils.http import parse_http_date
+
+        exclude = [
+            'django.middleware.cache.UpdateCacheMiddleware',
+            'django.middleware.http.ConditionalGetMiddleware',
+            'django.middleware.cache.FetchFromCacheMiddleware'
+        ]
+        overrides = dict()
+        if getattr(settings, 'MIDDLEWARE', None):
+            overrides['MIDDLEWARE'] = [mw for mw in settings.MIDDLEWARE if mw not in exclude]
+        else:
+            overrides['MIDDLEWARE_CLASSES'] = [mw for mw in settings.MIDDLEWARE_CLASSES if mw not in exclude]
+        with self.settings(**overrides):
+            page1 = create_page('test page 1', 'nav_playground.html', 'en', published=True)
+            page1_url = page1.get_absolute_url()
+            placeholder = page1.placeholders.get(slot="body")
+            add_plugin(placeholder, "TextPlugin", 'en', body="Cached content")
+            page1.publish('en')
+
+            # Prime the cache
+            response = self.client.get(page1_url)
+            etag = response['ETag']
+            last_modified = response['Last-Modified']
+
+            with self.assertNumQueries(0):
+                response = self.client.get(page1_url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.content, b'')
+            self.assertEqual(response['ETag'], etag)
+            self.assertIn('max-age', response['Cache-Control'])
+
+            with self.assertNumQueries(0):
+                response = self.client.get(page1_url, HTTP_IF_MODIFIED_SINCE=last_modified)
+            self.assertEqual(response.status_code, 304)
+
+            # Changes to other objects the page is built from (static
+            # placeholders, other pages in the navigation...) don't change
+            # the page or its plugins, but they invalidate the page cache.
+            time.sleep(1)  # Last-Modified has a resolution of one second
+            invalidate_cms_page_cache()
+            self.client.get(page1_url)
+            response = self.client.get(page1_url, HTTP_IF_MODIFIED_SINCE=last_modified)
+            self.assertEqual(response.status_code, 200)
+            self.assertGreater(
+                parse_http_date(response['Last-Modified']),
+                parse_http_date(last_modified),
+            )
+
+            # If-None-Match takes precedence over If-Modified-Since
+            response = self.client.get(
+                page1_url,
+                HTTP_IF_NONE_MATCH='"other"',
+                HTTP_IF_MODIFIED_SINCE=last_modified,
+            )
+            self.assertContains(response, 'Cached content')
+
+            # Compressed variants have their own ETag
+            with self.settings(CMS_PAGE_CACHE_COMPRESSION=True):
+                invalidate_cms_page_cache()
+                self.client.get(page1_url)
+                response = self.client.get(page1_url, HTTP_ACCEPT_ENCODING='gzip')
+                self.assertEqual(response['ETag'], etag[:-1] + '-gzip"')
+                response = self.client.get(
+                    page1_url,
+                    HTTP_ACCEPT_ENCODING='gzip',
+                    HTTP_IF_NONE_MATCH=etag,
+                )
+                self.assertEqual(response.status_code, 200)
+
+    def test_page_cache_middleware(self):
+        exclude = [
+            'django.middleware.cache.UpdateCacheMiddleware',
+            'django.middleware.cache.FetchFromCacheMiddleware'
+        ]
+        overrides = dict()
+        if getattr(settings, 'MIDDLEWARE', None):
+            middleware = [mw for mw in settings.MIDDLEWARE if mw not in exclude]
+            overrides['MIDDLEWARE'] = ['cms.middleware.cache.PageCacheMiddleware'] + middleware
+        else:
+            middleware = [mw for mw in settings.MIDDLEWARE_CLASSES if mw not in exclude]
+            overrides['MIDDLEWARE_CLASSES'] = ['cms.middleware.cache.PageCacheMiddleware'] + middleware
+        with self.settings(**overrides):
+            page1 = create_page('test page 1', 'nav_playground.html', 'en', published=True)
+            page1_url = page1.get_absolute_url()
+            placeholder = page1.placeholders.get(slot="body")
+            add_plugin(placeholder, "TextPlugin", 'en', body="Cached content")
+            page1.publish('en')
+
+            # Prime the cache
+            response = self.client.get(page1_url)
+            self.assertContains(response, 'Cached content')
+            self.assertIn(settings.LANGUAGE_COOKIE_NAME, response.cookies)
+
+            # Cookie-less requests skip the remaining middleware
+            self.client.cookies.clear()
+            with self.assertNumQueries(0):
+                response = self.client.get(page1_url)
+            self.assertContains(response, 'Cached content')
+            self.assertNotIn(settings.LANGUAGE_COOKIE_NAME, response.cookies)
+
+            # Requests changing the toolbar state go through the toolbar
+            self.client.cookies.clear()
+            response = self.client.get(page1_url + '?preview')
+            self.assertIn(settings.LANGUAGE_COOKIE_NAME, response.cookies)
+
+            # Requests with cookies go through the other middleware
+            self.client.cookies.clear()
+            self.client.cookies['other'] = 'value'
+            response = self.client.get(page1_url)
+            self.assertContains(response, 'Cached content')
+            self.assertIn(settings.LANGUAGE_COOKIE_NAME, response.cookies)
+
+    def test_page_cache_middleware_grace(self):
+        from django.core.cache import cache
+
+        exclude = [
+            'django.middleware.cache.UpdateCacheMiddleware',
+            'django.middleware.cache.FetchFromCacheMiddleware'
+        ]
+        overrides = dict(CMS_PAGE_CACHE_GRACE=60)
+        if getattr(settings, 'MIDDLEWARE', None):
+            middleware = [mw for mw in settings.MIDDLEWARE if mw not in exclude]
+            overrides['MIDDLEWARE'] = ['cms.middleware.cache.PageCacheMiddleware'] + middleware
+        else:
+            middleware = [mw for mw in settings.MIDDLEWARE_CLASSES if mw not in exclude]
+            overrides['MIDDLEWARE_CLASSES'] = ['cms.middleware.cache.PageCacheMiddleware'] + middleware
+        with self.settings(**overrides):
+            page1 = create_page('test page 1', 'nav_playground.html', 'en', published=True)
+            page1_url = page1.get_absolute_url()
+            placeholder = page1.placeholders.get(slot="body")
+            add_plugin(placeholder, "TextPlugin", 'en', body="First content")
+            page1.publish('en')
+            lock_key = _page_cache_lock_key(self.get_request(page1_url))
+
+            # Prime the cache
+            response = self.client.get(page1_url)
+            self.assertContains(response, 'First content')
+
+            add_plugin(placeholder, "TextPlugin", 'en', body="Second content")
+            page1.publish('en')
+
+            # The lock acquired by the middleware lets the page view
+            # render the page instead of serving the stale content.
+            self.client.cookies.clear()
+            response = self.client.get(page1_url)
+            self.assertContains(response, 'Second content')
+            self.assertIsNone(cache.get(lock_key))
+
+            # The page was re-cached
+            self.client.cookies.clear()
+            with self.assertNumQueries(0):
+                response = self.client.get(page1_url)
+            self.assertContains(response, 'Second content')
+
+    def test_page_cache_authenticated(self):
+        from django.contrib.auth.models import Group
+        from mock import patch
+
+        exclude = [
+            'django.middleware.cache.UpdateCacheMiddleware',
+            'django.middleware.cache.FetchFromCacheMiddleware'
+        ]
+        overrides = dict(CMS_PAGE_CACHE_AUTHENTICATED=True)
+        if getattr(settings, 'MIDDLEWARE', None):
+            overrides['MIDDLEWARE'] = [mw for mw in settings.MIDDLEWARE if mw not in exclude]
+        else:
+            overrides['MIDDLEWARE_CLASSES'] = [mw for mw in settings.MIDDLEWARE_CLASSES if mw not in exclude]
+        with self.settings(**overrides):
+            page1 = create_page('test page 1', 'nav_playground.html', 'en', published=True)
+            page1_url = page1.get_absolute_url()
+            placeholder = page1.placeholders.get(slot="body")
+            add_plugin(placeholder, "TextPlugin", 'en', body="Cached content")
+            page1.publish('en')
+            group = Group.objects.create(name='employees')
+            user1 = self._create_user('user1', is_staff=False)
+            user2 = self._create_user('user2', is_staff=False)
+            user3 = self._create_user('user3', is_staff=False)
+            user3.groups.add(group)
+            staff = self.get_staff_user_with_no_permissions()
+
+            with self.login_user_context(user1):
+                response = self.client.get(page1_url)
+                self.assertContains(response, 'Cached content')
+                self.assertIn('private', response['Cache-Control'])
+
+            # Users with the same rights share the cache entries
+            with self.login_user_context(user2):
+                with patch('cms.views.render_page', side_effect=AssertionError):
+                    response = self.client.get(page1_url)
+                self.assertContains(response, 'Cached content')
+
+            # Users with other rights don't
+            requests = [self.get_request(page1_url) for user in (user1, user2, user3)]
+
+            for request, user in zip(requests, (user1, user2, user3)):
+                request.user = user
+            self.assertEqual(_page_cache_key(requests[0]), _page_cache_key(requests[1]))
+            self.assertNotEqual(_page_cache_key(requests[0]), _page_cache_key(requests[2]))
+
+            # Staff users bypass the page cache
+            with self.login_user_context(staff):
+                response = self.client.get(page1_url)
+                self.assertIn('no-cache', response['Cache-Control'])
+
+    def test_page_cache_round_trips(self):
+        from django.core.cache import cache
+        from mock import patch
+        from cms.cache import _local_cache_versions
+
+        exclude = [
+            'django.middleware.cache.UpdateCacheMiddleware',
+            'django.middleware.cache.FetchFromCacheMiddleware'
+        ]
+        overrides = dict()
+        if getattr(settings, 'MIDDLEWARE', None):
+            overrides['MIDDLEWARE'] = [mw for mw in settings.MIDDLEWARE if mw not in exclude]
+        else:
+            overrides['MIDDLEWARE_CLASSES'] = [mw for mw in settings.MIDDLEWARE_CLASSES if mw not in exclude]
+        with self.settings(**overrides):
+            page1 = create_page('test page 1', 'nav_playground.html', 'en', published=True)
+            page1_url = page1.get_absolute_url()
+
+            # Prime the cache
+            self.client.get(page1_url)
+            request = self.get_request(page1_url)
+
+            with patch.object(cache, 'get', wraps=cache.get) as get:
+                with patch.object(cache, 'get_many', wraps=cache.get_many) as get_many:
+                    self.assertIsNotNone(get_page_cache(request))
+            self.assertEqual(get_many.call_count, 1)
+            # The local memory backend implements get_many() with get()
+            self.assertEqual(get.call_count, len(get_many.call_args[0][0]))
+
+            with self.settings(CMS_PAGE_CACHE_VERSION_LOCAL_TTL=10):
+                try:
+                    get_page_cache(request)
+
+                    with patch.object(cache, 'get', wraps=cache.get) as get:
+                        with patch.object(cache, 'get_many', wraps=cache.get_many) as get_many:
+                            self.assertIsNotNone(get_page_cache(request))
+                    self.assertEqual(get.call_count, 1)
+                    self.assertEqual(get_many.call_count, 0)
+
+                    # Invalidating the cache updates the local version
+                    invalidate_cms_page_cache()
+                    self.assertIsNone(get_page_cache(request))
+                finally:
+                    _local_cache_versions.clear()
+
+    def test_page_cache_key_query_string(self):
+        def get_key(path):
+            return _page_cache_key(self.get_request(path))
+
+        self.assertEqual(get_key('/en/?b=2&a=1'), get_key('/en/?a=1&b=2'))
+        self.assertNotEqual(get_key('/en/?a=1&a=2'), get_key('/en/?a=2&a=1'))
+        self.assertNotEqual(get_key('/en/?utm_source=x'), get_key('/en/'))
+
+        with self.settings(CMS_PAGE_CACHE_IGNORED_QUERY_PARAMETERS=['utm_*', 'fbclid']):
+            self.assertEqual(get_key('/en/?utm_source=x&utm_medium=y'), get_key('/en/'))
+            self.assertEqual(get_key('/en/?fbclid=x&a=1'), get_key('/en/?a=1'))
+            self.assertNotEqual(get_key('/en/?a=1'), get_key('/en/'))
+
+        with self.settings(CMS_PAGE_CACHE_QUERY_PARAMETERS=['page']):
+            self.assertEqual(get_key('/en/?page=2&utm_source=x'), get_key('/en/?page=2'))
+            self.assertNotEqual(get_key('/en/?page=2'), get_key('/en/'))
+
+    def test_cache_stats(self):
+        from django.core.cache import cache
+
+        exclude = [
+            'django.middleware.cache.UpdateCacheMiddleware',
+            'django.middleware.cache.FetchFromCacheMiddleware'
+        ]
+        overrides = dict()
+        if getattr(settings, 'MIDDLEWARE', None):
+            overrides['MIDDLEWARE'] = [mw for mw in settings.MIDDLEWARE if mw not in exclude]
+        else:
+            overrides['MIDDLEWARE_CLASSES'] = [mw for mw in settings.MIDDLEWARE_CLASSES if mw not in exclude]
+
+        page1 = create_page('test page 1', 'nav_playground.html', 'en', published=True)
+        page1_url = page1.get_absolute_url()
+        placeholder = page1.placeholders.get(slot="body")
+        add_plugin(placeholder, "TextPlugin", 'en', body="Cached content")
+        page1.publish('en')
+
+        with self.settings(**overrides):
+            # Statistics are disabled by default
+            response = self.client.get(page1_url)
+            self.assertFalse(response.has_header('Server-Timing'))
+            cache.clear()
+
+        with self.settings(CMS_CACHE_STATS=True, CMS_CACHE_STATS_SERVER_TIMING=True, **overrides):
+            sink = stats.get_stats_sink()
+            sink.reset()
+            self.assertEqual(sink.get_stats(), {})
+
+            def get_server_timing(response):
+                metrics = (metric.split(';') for metric in response['Server-Timing'].split(', '))
+                return dict((metric[0], metric[1]) for metric in metrics)
+
+            server_timing = get_server_timing(self.client.get(page1_url))
+            self.assertEqual(server_timing['cms-page'], 'desc="miss=1 write=1"')
+            self.assertEqual(server_timing['cms-placeholder'], 'desc="miss=4 write=2"')
+            self.assertIn('miss=1 write=1', server_timing['cms-menu'])
+
+            server_timing = get_server_timing(self.client.get(page1_url))
+            self.assertEqual(server_timing, {'cms-page': 'desc="hit=1"'})
+
+            page_stats = sink.get_stats()
+            self.assertEqual(page_stats[('page', 1, 'en', stats.MISS)][0], 1)
+            self.assertEqual(page_stats[('page', 1, 'en', stats.HIT)][0], 1)
+            self.assertEqual(page_stats[('page', 1, 'en', stats.WRITE)][0], 1)
+            self.assertEqual(page_stats[('placeholder', 1, 'en', stats.WRITE)][0], 2)
+            self.assertEqual(page_stats[('menu', 1, 'en', stats.MISS)][0], 1)
+            self.assertEqual(
+                page_stats[('page', 1, 'en', stats.HIT)][2],
+                page_stats[('page', 1, 'en', stats.WRITE)][2],
+            )
+
+            invalidate_cms_page_cache()
+            self.assertEqual(sink.get_stats()[('page', None, None, stats.INVALIDATION)][0], 1)
+
+            sink.reset()
+            self.assertEqual(sink.get_stats(), {})
+
+    def test_cache_stats_middleware(self):
+        exclude = [
+            'django.middleware.cache.UpdateCacheMiddleware',
+            'django.middleware.cache.FetchFromCacheMiddleware'
+        ]
+        overrides = dict(CMS_CACHE_STATS=True)
+        if getattr(settings, 'MIDDLEWARE', None):
+            middleware = [mw for mw in settings.MIDDLEWARE if mw not in exclude]
+            overrides['MIDDLEWARE'] = ['cms.middleware.cache.PageCacheMiddleware'] + middleware
+        else:
+            middleware = [mw for mw in settings.MIDDLEWARE_CLASSES if mw not in exclude]
+            overrides['MIDDLEWARE_CLASSES'] = ['cms.middleware.cache.PageCacheMiddleware'] + middleware
+
+        page1 = create_page('test page 1', 'nav_playground.html', 'en', published=True)
+        page1_url = page1.get_absolute_url()
+
+        with self.settings(**overrides):
+            sink = stats.get_stats_sink()
+            sink.reset()
+
+            def get_page_stats(event):
+                return sum(
+                    value[0] for key, value in sink.get_stats().items()
+                    if key[0] == 'page' and key[3] == event
+                )
+
+            # The page view doesn't look the page cache up again
+            # after a miss in the middleware.
+            self.client.cookies.clear()
+            self.client.get(page1_url)
+            self.assertEqual(get_page_stats(stats.MISS), 1)
+
+            self.client.cookies.clear()
+            self.client.get(page1_url)
+            self.assertEqual(get_page_stats(stats.MISS), 1)
+            self.assertEqual(get_page_stats(stats.HIT), 1)
+
+            # Without the middleware lookup, the page view looks it up
+            page1.publish('en')
+            self.client.cookies['other'] = 'value'
+            self.client.get(page1_url)
+            self.assertEqual(get_page_stats(stats.MISS), 2)
+            sink.reset()
+
+    def test_cache_stats_processes(self):
+        from django.core.cache import cache
+        from mock import patch
+
+        cache.clear()
+        sinks = [stats.MemoryStatsSink() for process in range(3)]
+
+        with patch('cms.cache.stats.CACHE_STATS_MAX_PROCESSES', 2):
+            for process, sink in enumerate(sinks):
+                with patch.object(sink, '_get_process_name', return_value='host:%d' % process):
+                    sink.record('page', stats.HIT, 1, 'en', 0.1, 10)
+                    sink.publish()
+                    # Publishing again keeps the slot of the process
+                    sink.publish()
+
+            # Each process publishes under its own slot,
+            # the processes without a slot are left out.
+            self.assertEqual(sorted(sink._slot is not None for sink in sinks), [False, True, True])
+            self.assertEqual(len(set(sink._slot[1] for sink in sinks if sink._slot)), 2)
+            self.assertEqual(sinks[0].get_stats()[('page', 1, 'en', stats.HIT)][0], 2)
+
+            sinks[0].reset()
+            self.assertEqual(cache.get_many(sinks[0]._get_slot_keys()), {})
+
+    def test_plugin_fragment_cache(self):
+        from djangocms_text_ckeditor.models import Text
+
+        page1 = create_page('test page 1', 'nav_playground.html', 'en', published=True)
+        text_plugin = add_plugin(page1.placeholders.get(slot='body'), 'TextPlugin', 'en', body='English')
+
+        def render():
+            request = self.get_request('/en/')
+            request.current_page = page1
+            context = SekizaiContext()
+            context['request'] = request
+            content_renderer = self.get_content_renderer(request)
+            placeholder = page1.placeholders.get(slot='body')
+            return content_renderer.render_placeholder(placeholder, context, 'en')
+
+        with self.settings(CMS_PLUGIN_FRAGMENT_CACHE=True):
+            self.assertEqual(render(), 'English')
+
+            # The fragment is addressed by the changed date of the plugin
+            Text.objects.filter(pk=text_plugin.pk).update(body='Cached')
+            self.assertEqual(render(), 'English')
+
+            text_plugin = Text.objects.get(pk=text_plugin.pk)
+            text_plugin.body = 'Changed'
+            text_plugin.save()
+            self.assertEqual(render(), 'Changed')
+
+        Text.objects.filter(pk=text_plugin.pk).update(body='Not cached')
+        self.assertEqual(render(), 'Not cached')
+
+    def test_plugin_fragment_cache_children(self):
+        from mock import patch
+
+        page1 = create_page('test page 1', 'nav_playground.html', 'en', published=True)
+        placeholder = page1.placeholders.get(slot='body')
+        parent = add_plugin(placeholder, 'StylePlugin', 'en', tag_type='div', class_name='info')
+        plugin_pool.register_plugin(NoCachePlugin)
+
+        try:
+            add_plugin(placeholder, 'NoCachePlugin', 'en', target=parent)
+
+            with self.settings(CMS_PLUGIN_FRAGMENT_CACHE=True):
+                request = self.get_request('/en/')
+                request.current_page = page1
+                context = SekizaiContext()
+                context['request'] = request
+                content_renderer = self.get_content_renderer(request)
+
+                # The parent renders its uncacheable child,
+                # so it can't be cached either.
+                with patch('cms.plugin_rendering.set_plugin_cache') as set_plugin_cache:
+                    content_renderer.render_placeholder(placeholder, context, 'en')
+                self.assertEqual(set_plugin_cache.call_count, 0)
+        finally:
+            plugin_pool.unregister_plugin(NoCachePlugin)
+
     def test_render_placeholder_cache(self):
         """
         Regression test for #4223
@@ -731,6 +1437,21 @@ class PlaceholderCacheTestCase(CMSTestCase):
         version, _ = _get_placeholder_cache_version(self.placeholder, 'en', 1)
         self.assertGreater(version, initial)
 
+    def get_placeholder_cache_key(self, lang, request, content=''):
+        """
+        Returns the content key written by set_placeholder_cache().
+        """
+        from django.core.cache import cache
+        from mock import patch
+
+        version_key = _get_placeholder_cache_version_key(self.placeholder, lang, 1)
+
+        with patch.object(cache, 'set_many', wraps=cache.set_many) as set_many:
+            set_placeholder_cache(self.placeholder, lang, 1, content, request)
+        keys = [key for args, kwargs in set_many.call_args_list for key in args[0] if key != version_key]
+        self.assertEqual(len(keys), 1)
+        return keys[0]
+
     def test_get_placeholder_cache_key(self):
         version, vary_on_list = _get_placeholder_cache_version(self.placeholder, 'en', 1)
         desired_key = '{prefix}|render_placeholder|id:{id}|lang:{lang}|site:{site}|tz:{tz}|v:{version}|country-code:{cc}'.format(  # noqa
@@ -743,14 +1464,14 @@ class PlaceholderCacheTestCase(CMSTestCase):
             cc='_',
         )
         _set_placeholder_cache_version(self.placeholder, 'en', 1, version, vary_on_list=vary_on_list, duration=1)
-        actual_key = _get_placeholder_cache_key(self.placeholder, 'en', 1, self.en_request)
+        actual_key = self.get_placeholder_cache_key('en', self.en_request)
         self.assertEqual(actual_key, desired_key)
 
-        en_key = _get_placeholder_cache_key(self.placeholder, 'en', 1, self.en_request)
-        de_key = _get_placeholder_cache_key(self.placeholder, 'de', 1, self.de_request)
+        en_key = self.get_placeholder_cache_key('en', self.en_request)
+        de_key = self.get_placeholder_cache_key('de', self.de_request)
         self.assertNotEqual(en_key, de_key)
 
-        en_us_key = _get_placeholder_cache_key(self.placeholder, 'en', 1, self.en_us_request)
+        en_us_key = self.get_placeholder_cache_key('en', self.en_us_request)
         self.assertNotEqual(en_key, en_us_key)
 
         desired_key = '{prefix}|render_placeholder|id:{id}|lang:{lang}|site:{site}|tz:{tz}|v:{version}|country-code:{cc}'.format(  # noqa
@@ -809,6 +1530,136 @@ class PlaceholderCacheTestCase(CMSTestCase):
         cached_en_uk_content = get_placeholder_cache(self.placeholder, 'en', 1, self.en_uk_request)
         self.assertNotEqual(cached_en_us_content, cached_en_uk_content)
 
+    def test_get_placeholders_cache(self):
+        from django.core.cache import cache
+        from mock import patch
+
+        placeholders = list(self.page.placeholders.all())
+        sidebar = self.page.placeholders.get(slot='right-column')
+        en_renderer = self.get_content_renderer(self.en_request)
+        en_context = Context({'request': self.en_request})
+        en_content = en_renderer.render_placeholder(self.placeholder, en_context, 'en', width=350)
+
+        # Nothing in the cache yet
+        self.assertEqual(get_placeholders_cache(placeholders, 'en', 1, self.en_request), {})
+
+        set_placeholder_cache(self.placeholder, 'en', 1, en_content, self.en_request)
+
+        with patch.object(cache, 'get_many', wraps=cache.get_many) as get_many:
+            cached = get_placeholders_cache(placeholders, 'en', 1, self.en_request)
+        self.assertEqual(get_many.call_count, 2)
+        self.assertEqual(cached, {self.placeholder.pk: en_content})
+        self.assertEqual(
+            cached[self.placeholder.pk],
+            get_placeholder_cache(self.placeholder, 'en', 1, self.en_request),
+        )
+
+        # The content is addressed by the placeholder VARY headers
+        cached = get_placeholders_cache([self.placeholder, sidebar], 'en', 1, self.en_us_request)
+        self.assertEqual(cached, {})
+
+        clear_placeholder_cache(self.placeholder, 'en', 1)
+        self.assertEqual(get_placeholders_cache(placeholders, 'en', 1, self.en_request), {})
+
+    def test_deferred_placeholder_cache(self):
+        from django.core.cache import cache
+        from mock import patch
+
+        sidebar = self.page.placeholders.get(slot='right-column')
+        add_plugin(sidebar, 'TextPlugin', 'en', body='Sidebar')
+        self.en_request.toolbar = CMSToolbar(self.en_request)
+        self.en_request.toolbar._defer_placeholder_cache = True
+        en_renderer = self.en_request.toolbar.content_renderer
+        en_context = Context({'request': self.en_request})
+        # Reading the cache of a placeholder without a version creates one,
+        # the versions are created beforehand to only count the deferred writes.
+        _get_placeholder_cache_version(self.placeholder, 'en', 1)
+        _get_placeholder_cache_version(sidebar, 'en', 1)
+
+        with patch.object(cache, 'set_many', wraps=cache.set_many) as set_many:
+            en_content = en_renderer.render_placeholder(
+                self.placeholder, en_context, 'en', use_cache=True)
+            en_renderer.render_placeholder(sidebar, en_context, 'en', use_cache=True)
+            # Nothing is written until the renderer is flushed
+            self.assertEqual(set_many.call_count, 0)
+            self.assertIsNone(get_placeholder_cache(self.placeholder, 'en', 1, self.en_request))
+
+            self.en_request.toolbar.flush_placeholder_cache()
+            self.assertEqual(set_many.call_count, 1)
+            # Two contents and two versions
+            self.assertEqual(len(set_many.call_args[0][0]), 4)
+
+            # Nothing left to write
+            self.en_request.toolbar.flush_placeholder_cache()
+            self.assertEqual(set_many.call_count, 1)
+
+        cached_en_content = get_placeholder_cache(self.placeholder, 'en', 1, self.en_request)
+        self.assertEqual(cached_en_content['content'], en_content)
+
+    def test_placeholder_cache_info(self):
+        from mock import patch
+
+        self.en_request.toolbar = CMSToolbar(self.en_request)
+        self.en_request.toolbar._defer_placeholder_cache = True
+        en_renderer = self.en_request.toolbar.content_renderer
+        en_context = Context({'request': self.en_request})
+        get_vary_cache_on = Placeholder.get_vary_cache_on
+
+        with patch.object(Placeholder, 'get_vary_cache_on', autospec=True,
+                          side_effect=get_vary_cache_on) as mocked:
+            en_renderer.render_placeholder(self.placeholder, en_context, 'en', use_cache=True)
+            self.en_request.toolbar.flush_placeholder_cache()
+            cache_info = en_renderer.get_placeholder_cache_info(self.placeholder)
+        # Computed once for the render and shared by the cache writers
+        self.assertEqual(mocked.call_count, 1)
+        self.assertEqual(cache_info, get_placeholder_cache_info(self.placeholder, self.en_request))
+        self.assertEqual(cache_info[1], ['country-code'])
+
+    def test_placeholder_cache_generations(self):
+        from django.core.cache import cache
+        from mock import patch
+
+        en_renderer = self.get_content_renderer(self.en_request)
+        en_context = Context({'request': self.en_request})
+        en_content = en_renderer.render_placeholder(self.placeholder, en_context, 'en', width=350)
+        sidebar = self.page.placeholders.get(slot='right-column')
+        generation = self.placeholder.cache_generation
+
+        # The generations are left alone when they are not used
+        self.placeholder.clear_cache('en', site_id=1)
+        self.assertEqual(
+            Placeholder.objects.get(pk=self.placeholder.pk).cache_generation,
+            generation,
+        )
+
+        with self.settings(CMS_PLACEHOLDER_CACHE_GENERATIONS=True):
+            set_placeholder_cache(self.placeholder, 'en', 1, en_content, self.en_request)
+            version, vary_on_list = _get_placeholder_cache_version(self.placeholder, 'en', 1)
+            self.assertEqual(version, generation)
+            self.assertEqual(vary_on_list, ['country-code'])
+
+            # The versions are not written on reads
+            with patch.object(cache, 'set_many', wraps=cache.set_many) as set_many:
+                cached = get_placeholders_cache([self.placeholder, sidebar], 'en', 1, self.en_request)
+            self.assertEqual(set_many.call_count, 0)
+            self.assertEqual(cached, {self.placeholder.pk: en_content})
+
+            # Evicting the version doesn't orphan the content,
+            # it's re-written along with the vary-on headers.
+            cache.delete(_get_placeholder_cache_version_key(self.placeholder, 'en', 1))
+            self.assertIsNone(get_placeholder_cache(self.placeholder, 'en', 1, self.en_request))
+            set_placeholder_cache(self.placeholder, 'en', 1, en_content, self.en_request)
+            self.assertEqual(get_placeholder_cache(self.placeholder, 'en', 1, self.en_request), en_content)
+
+            # Invalidation doesn't depend on the cache
+            self.placeholder.clear_cache('en', site_id=1)
+            self.assertEqual(self.placeholder.cache_generation, generation + 1)
+            self.assertEqual(
+                Placeholder.objects.get(pk=self.placeholder.pk).cache_generation,
+                generation + 1,
+            )
+            self.assertIsNone(get_placeholder_cache(self.placeholder, 'en', 1, self.en_request))
+
     def test_set_get_placeholder_cache_with_long_prefix(self):
         """
         This is for testing that everything continues to work even when the
@@ -827,10 +1678,9 @@ class PlaceholderCacheTestCase(CMSTestCase):
                 language='en',
                 width=350,
             )
-            set_placeholder_cache(self.placeholder, 'en', 1, en_crazy_content, en_crazy_request)
+            crazy_cache_key = self.get_placeholder_cache_key('en', en_crazy_request, en_crazy_content)
 
             # Prove that it is hashed...
-            crazy_cache_key = _get_placeholder_cache_key(self.placeholder, 'en', 1, en_crazy_request)
             key_length = len(crazy_cache_key)
             # 221 = 180 (prefix length) + 1 (separator) + 40 (sha1 hash)
             self.assertTrue('render_placeholder' not in crazy_cache_key and key_length == 221)
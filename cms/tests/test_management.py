@@ -330,6 +330,61 @@ class ManagementTestCase(CMSTestCase):
 
         self.assertEqual(Page.objects.public().count(), 3)
 
+    def test_warm_cache(self):
+        exclude = [
+            'django.middleware.cache.UpdateCacheMiddleware',
+            'django.middleware.cache.FetchFromCacheMiddleware'
+        ]
+        overrides = dict()
+        if getattr(settings, 'MIDDLEWARE', None):
+            overrides['MIDDLEWARE'] = [mw for mw in settings.MIDDLEWARE if mw not in exclude]
+        else:
+            overrides['MIDDLEWARE_CLASSES'] = [mw for mw in settings.MIDDLEWARE_CLASSES if mw not in exclude]
+
+        with self.settings(**overrides):
+            page_1 = create_page('home', 'nav_playground.html', 'en', published=True)
+            create_title('de', 'home', page_1)
+            page_1.publish('de')
+            page_2 = create_page('login required', 'nav_playground.html', 'en', published=True, login_required=True)
+            out = StringIO()
+            management.call_command('cms', 'warm-cache', '--host=testserver', interactive=False, stdout=out)
+            self.assertIn('[1/2] 200 /en/home/', out.getvalue())
+            self.assertIn('[2/2] 200 /de/home/', out.getvalue())
+            self.assertIn('Failed:   0', out.getvalue())
+            self.assertNotIn(page_2.get_absolute_url(), out.getvalue())
+
+            # The pages are served from the cache
+            page_1_url = page_1.get_absolute_url('en')
+
+            with self.assertNumQueries(0):
+                self.client.get(page_1_url)
+
+            out = StringIO()
+            management.call_command(
+                'cms', 'warm-cache', '--host=testserver', '--language=de', interactive=False, stdout=out)
+            self.assertIn('[1/1] 200 /de/home/', out.getvalue())
+
+    def test_cache_stats(self):
+        out = StringIO()
+
+        with self.assertRaises(CommandError):
+            management.call_command('cms', 'cache-stats', interactive=False, stdout=out)
+
+        with self.settings(CMS_CACHE_STATS=True):
+            management.call_command('cms', 'cache-stats', '--reset', interactive=False, stdout=out)
+            management.call_command('cms', 'cache-stats', interactive=False, stdout=out)
+            self.assertIn('No cache statistics have been collected yet.', out.getvalue())
+
+            page = create_page('home', 'nav_playground.html', 'en', published=True)
+            self.client.get(page.get_absolute_url('en'))
+            self.client.get(page.get_absolute_url('en'))
+
+            out = StringIO()
+            management.call_command('cms', 'cache-stats', interactive=False, stdout=out)
+            lines = dict((line.split()[0], line.split()) for line in out.getvalue().splitlines() if line)
+            self.assertEqual(lines['page'][1:5], ['1', 'en', '1', '1'])
+            self.assertEqual(lines['page'][5], '50%')
+
 
 class PageFixtureManagementTestCase(NavextendersFixture, CMSTestCase):
 
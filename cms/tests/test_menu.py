@@ -1,18 +1,22 @@
 # -*- coding: utf-8 -*-
 import copy
+import pickle
+import random
 from cms.test_utils.project.sampleapp.cms_apps import NamespacedApp, SampleApp, SampleApp2
 
 from django.conf import settings
 from django.contrib.auth.models import AnonymousUser, Permission, Group
 from django.contrib.sites.models import Site
+from django.core.cache import cache
 from django.template import Template, TemplateSyntaxError
 from django.template.context import Context
 from django.test.utils import override_settings
 from django.utils.translation import activate, override as force_language
 from cms.apphook_pool import apphook_pool
-from menus.base import NavigationNode
+from menus.base import MenuWindow, NavigationNode
 from menus.menu_pool import menu_pool, _build_nodes_inner_for_one_menu
-from menus.models import CacheKey
+from menus.templatetags import menu_tags
+from menus.tree import dump_nodes, load_nodes
 from menus.utils import mark_descendants, find_selected, cut_levels
 
 from cms.api import create_page, create_title
@@ -240,6 +244,70 @@ class ExtendedFixturesMenuTests(ExtendedMenusFixture, BaseMenuTest):
         self.assertEqual(len(nodes[1].children), 1)
         self.assertEqual(len(nodes[1].children[0].children), 1)
 
+    def test_partial_menus(self):
+        """
+        With CMS_PARTIAL_MENUS, only the pages around the current page are
+        fetched, the menus are the same.
+        """
+        # Pages deeper than the levels rendered by the menus
+        parent = Page.objects.drafts().get(title_set__title='P11')
+
+        for num in (12, 13):
+            parent = create_page(
+                'P%s' % num,
+                'nav_playground.html',
+                'en',
+                published=True,
+                in_navigation=True,
+                parent=parent,
+            )
+
+        templates = [
+            "{% load menu_tags %}{% show_menu 0 0 %}",
+            "{% load menu_tags %}{% show_menu 0 1 %}",
+            "{% load menu_tags %}{% show_menu 0 100 100 100 %}",
+            "{% load menu_tags %}{% show_menu 1 2 0 1 %}",
+            "{% load menu_tags %}{% show_sub_menu 1 %}",
+            "{% load menu_tags %}{% show_sub_menu 100 1 1 %}",
+            "{% load menu_tags %}{% show_breadcrumb %}",
+        ]
+
+        for num in range(1, 14):
+            page = self.get_page(num)
+
+            for template in templates:
+                context = self.get_context(path=page.get_absolute_url(), page=page)
+                full_menu = Template(template).render(context)
+
+                with self.settings(CMS_PARTIAL_MENUS=True):
+                    context = self.get_context(path=page.get_absolute_url(), page=page)
+                    partial_menu = Template(template).render(context)
+                self.assertEqual(partial_menu, full_menu)
+
+        # The selected page and its ancestors are marked, even below the window
+        page = self.get_page(13)
+        context = self.get_context(path=page.get_absolute_url(), page=page)
+
+        with self.settings(CMS_PARTIAL_MENUS=True):
+            Template("{% load menu_tags %}{% show_menu 0 1 %}").render(context)
+        self.assertEqual([node.title for node in context['children'] if node.ancestor], ['P1'])
+        self.assertEqual([node.title for node in context['children'][0].children if node.ancestor], ['P9'])
+
+        page = self.get_page(5)
+        request = self.get_request(path=page.get_absolute_url(), page=page)
+        window = MenuWindow(inactive_depth=0, active_depth=0, max_level=0)
+
+        nodes = menu_pool.get_renderer(request).get_nodes(window=window)
+        self.assertIn('P11', [node.title for node in nodes])
+
+        with self.settings(CMS_PARTIAL_MENUS=True):
+            nodes = menu_pool.get_renderer(request).get_nodes(window=window)
+        # P11 and below are more than a level below the window
+        self.assertEqual(
+            sorted(node.title for node in nodes),
+            ['P1', 'P10', 'P2', 'P3', 'P4', 'P5', 'P6', 'P7', 'P8', 'P9'],
+        )
+
     def test_show_submenu_template_root_level_none_no_nephew_limit(self):
         root = self.get_page(1)
         context = self.get_context(path=root.get_absolute_url(), page=root)
@@ -386,26 +454,24 @@ class FixturesMenuTests(MenusFixture, BaseMenuTest):
     def test_show_menu_num_queries(self):
         context = self.get_context()
         # test standard show_menu
-        with self.assertNumQueries(5):
+        with self.assertNumQueries(3):
             """
             The queries should be:
                 get all page nodes
                 get all page permissions
                 get all titles
-                get the menu cache key
-                set the menu cache key
             """
             tpl = Template("{% load menu_tags %}{% show_menu %}")
             tpl.render(context)
 
-    def test_show_menu_cache_key_leak(self):
+    def test_show_menu_cached_num_queries(self):
         context = self.get_context()
         tpl = Template("{% load menu_tags %}{% show_menu %}")
-        self.assertEqual(CacheKey.objects.count(), 0)
         tpl.render(context)
-        self.assertEqual(CacheKey.objects.count(), 1)
-        tpl.render(context)
-        self.assertEqual(CacheKey.objects.count(), 1)
+
+        # The cached menu is used without any query
+        with self.assertNumQueries(0):
+            tpl.render(context)
 
     def test_menu_cache_draft_only(self):
         # Tests that the cms uses a separate cache for draft & live
@@ -460,7 +526,7 @@ class FixturesMenuTests(MenusFixture, BaseMenuTest):
 
         self.assertEqual(len(node_ids), page_count, msg='Not all pages in the public menu are public')
 
-    def test_menu_cache_respects_database_keys(self):
+    def test_menu_cache_generations(self):
         public_page = self.get_page(1)
 
         # Prime the public menu cache
@@ -468,47 +534,96 @@ class FixturesMenuTests(MenusFixture, BaseMenuTest):
         context['request'].session['cms_edit'] = False
 
         # Prime the cache
-        with self.assertNumQueries(5):
+        with self.assertNumQueries(3):
             # The queries should be:
             #     get all page nodes
             #     get all page permissions
             #     get all titles
-            #     get the menu cache key
-            #     set the menu cache key
             Template("{% load menu_tags %}{% show_menu %}").render(context)
 
-        # One new CacheKey should have been created
-        self.assertEqual(CacheKey.objects.count(), 1)
+        # Because its cached, no query is made to the db
+        with self.assertNumQueries(0):
+            Template("{% load menu_tags %}{% show_menu %}").render(context)
 
-        # Because its cached, only one query is made to the db
-        with self.assertNumQueries(1):
-            # The queries should be:
-            #     get the menu cache key
+        # Clearing the menus of another site or language keeps the cache
+        menu_pool.clear(site_id=2)
+        menu_pool.clear(language='fr')
+        menu_pool.clear(site_id=1, language='fr')
+
+        with self.assertNumQueries(0):
             Template("{% load menu_tags %}{% show_menu %}").render(context)
 
-        # Delete the current cache key but don't touch the cache
-        CacheKey.objects.all().delete()
+        for kwargs in ({'site_id': 1, 'language': 'en'}, {'site_id': 1},
+                       {'language': 'en'}, {'all': True}):
+            menu_pool.clear(**kwargs)
 
-        # The menu should be recalculated
-        with self.assertNumQueries(5):
-            # The queries should be:
-            #     check if cache key exists
-            #     get all page nodes
-            #     get all page permissions
-            #     get all title objects
-            #     set the menu cache key
+            # The menu should be recalculated
+            with self.assertNumQueries(3):
+                Template("{% load menu_tags %}{% show_menu %}").render(context)
+
+    def test_menu_local_cache(self):
+        from mock import patch
+
+        page = self.get_page(1)
+        context = self.get_context(path=page.get_absolute_url(), page=page)
+        context['request'].session['cms_edit'] = False
+        cache_key = menu_pool.get_renderer(context['request']).cache_key
+
+        with self.assertNumQueries(3):
             Template("{% load menu_tags %}{% show_menu %}").render(context)
 
-    def test_menu_keys_duplicate_clear(self):
-        """
-        Tests that the menu clears all keys, including duplicates.
-        """
-        CacheKey.objects.create(language="fr", site=1, key="a")
-        CacheKey.objects.create(language="fr", site=1, key="a")
+        # The menu is kept by the process, the cached one is not needed
+        cache.delete(cache_key)
 
-        self.assertEqual(CacheKey.objects.count(), 2)
-        menu_pool.clear(site_id=1, language='fr')
-        self.assertEqual(CacheKey.objects.count(), 0)
+        with self.assertNumQueries(0):
+            output = Template("{% load menu_tags %}{% show_menu %}").render(context)
+        self.assertIn(page.get_absolute_url(), output)
+
+        with self.settings(CMS_MENU_LOCAL_CACHE_SIZE=0):
+            menu_pool.clear()
+
+            with self.assertNumQueries(3):
+                Template("{% load menu_tags %}{% show_menu %}").render(context)
+
+            # The cached menu is read along with the generations
+            renderer = menu_pool.get_renderer(context['request'])
+
+            with patch.object(cache, 'get_many', wraps=cache.get_many) as get_many:
+                with patch.object(cache, 'get', wraps=cache.get) as get:
+                    renderer._build_nodes()
+            self.assertEqual(get_many.call_count, 1)
+            self.assertEqual(get.call_count, 0)
+
+            cache.delete(cache_key)
+
+            with self.assertNumQueries(3):
+                Template("{% load menu_tags %}{% show_menu %}").render(context)
+
+        # Selection marks of a request don't leak into the shared menu
+        for selected_page in (page, self.get_page(2)):
+            path = selected_page.get_absolute_url()
+            context = self.get_context(path=path, page=selected_page)
+            context['request'].session['cms_edit'] = False
+            nodes = menu_pool.get_renderer(context['request']).get_nodes()
+            selected = [node.get_absolute_url() for node in nodes if node.selected]
+            self.assertEqual(selected, [path])
+
+    @override_settings(CMS_PERMISSION=True)
+    def test_menu_cache_shared_between_users(self):
+        page = self.get_page(1)
+        user_1 = self._create_user('user_1')
+        user_2 = self._create_user('user_2')
+        user_3 = self._create_user('user_3')
+        PagePermission.objects.create(page=page.get_draft_object(), user=user_3, can_view=True)
+
+        def get_cache_key(user):
+            request = self.get_request(page.get_absolute_url())
+            request.user = user
+            return menu_pool.get_renderer(request).cache_key
+
+        # Users who can see the same pages share the same menu
+        self.assertEqual(get_cache_key(user_1), get_cache_key(user_2))
+        self.assertNotEqual(get_cache_key(user_1), get_cache_key(user_3))
 
     def test_only_active_tree(self):
         context = self.get_context(page=self.get_page(1))
@@ -883,6 +998,148 @@ class MenuTests(BaseMenuTest):
         self.assertEqual(node4.children, [node3])
         self.assertEqual(node5.children, [node4])
 
+    def test_build_nodes_inner_for_shuffled_menu(self):
+        """
+            A large menu, in random order, is built without quadratic time
+        """
+        shuffle = random.Random(42).shuffle
+        nodes = [NavigationNode('Test1', '/test1/', 1, None)]
+
+        for node_id in range(2, 50001):
+            # Deep and wide branches
+            parent_id = node_id - 1 if node_id % 10 else node_id // 10
+            nodes.append(NavigationNode('Test', '/test/', node_id, parent_id))
+        shuffle(nodes)
+        nodes.append(NavigationNode('Test', '/test/', 50001, 50002))
+        nodes.append(NavigationNode('Test', '/test/', 50002, 50001))
+
+        final_list = _build_nodes_inner_for_one_menu(list(nodes), 'Test')
+        self.assertEqual(len(final_list), 50000)
+
+        added = set()
+
+        for node in final_list:
+            if node.id == 1:
+                self.assertIsNone(node.parent)
+            else:
+                # Parents always come first
+                self.assertIn(node.parent.id, added)
+                self.assertEqual(node.parent.id, node.parent_id)
+                self.assertEqual(node.parent_namespace, 'Test')
+                self.assertIn(node, node.parent.children)
+            added.add(node.id)
+
+    def test_build_nodes_inner_for_out_of_order_menu(self):
+        '''
+            node1
+             node2
+              node4
+             node3
+
+            node2, node3 and node4 come before their parent in the list,
+            they are added once their parent has been added.
+        '''
+        node1 = NavigationNode('Test1', '/test1/', 1, None)
+        node2 = NavigationNode('Test2', '/test2/', 2, 1)
+        node3 = NavigationNode('Test3', '/test3/', 3, 1)
+        node4 = NavigationNode('Test4', '/test4/', 4, 2)
+
+        final_list = _build_nodes_inner_for_one_menu([node4, node3, node2, node1], 'Test')
+        self.assertEqual(final_list, [node1, node3, node2, node4])
+        self.assertEqual(node1.children, [node3, node2])
+        self.assertEqual(node2.children, [node4])
+
+    def test_deep_menu(self):
+        """
+            A menu deeper than the recursion limit
+        """
+        root = NavigationNode('Test1', '/test1/', 1)
+        nodes = [root]
+
+        for node_id in range(2, 5002):
+            parent = nodes[-1]
+            node = NavigationNode('Test', '/test/', node_id, parent.id)
+            node.parent = parent
+            parent.children.append(node)
+            nodes.append(node)
+
+        self.assertEqual(root.get_descendants(), nodes[1:])
+        self.assertEqual(nodes[-1].get_ancestors(), nodes[-2::-1])
+        self.assertEqual(menu_tags.flatten([root]), nodes)
+
+    def test_cut_levels_wide_menu(self):
+        root = NavigationNode('Test1', '/test1/', 1)
+        root.level = 0
+        root.ancestor = True
+        nodes = [root]
+
+        for node_id in range(2, 10002):
+            node = NavigationNode('Test', '/test/', node_id, 1, visible=bool(node_id % 3))
+            node.level = 1
+            node.parent = root
+            root.children.append(node)
+            nodes.append(node)
+        nodes[1].selected = True
+        visible_nodes = [node for node in nodes[1:] if node.visible]
+
+        final = menu_tags.cut_levels(list(nodes), 0, 1, 0, 1000)
+        self.assertEqual(final, [root])
+        self.assertEqual(root.children, visible_nodes)
+
+        final = menu_tags.cut_levels(list(nodes), 0, 0, 0, 1000)
+        self.assertEqual(final, [root])
+        self.assertEqual(root.children, [])
+
+    def test_build_nodes_inner_for_zero_id_menu(self):
+        '''
+            node0
+             node2
+
+            A parent_id of 0 refers to the node with the id 0,
+            once it has been added.
+        '''
+        node0 = NavigationNode('Test0', '/test0/', 0, None)
+        node2 = NavigationNode('Test2', '/test2/', 2, 0)
+
+        final_list = _build_nodes_inner_for_one_menu([node0, node2], 'Test')
+        self.assertEqual(final_list, [node0, node2])
+        self.assertEqual(node2.parent, node0)
+        self.assertEqual(node0.children, [node2])
+
+        # Not added yet, the node is a root node
+        node0 = NavigationNode('Test0', '/test0/', 0, None)
+        node2 = NavigationNode('Test2', '/test2/', 2, 0)
+
+        final_list = _build_nodes_inner_for_one_menu([node2, node0], 'Test')
+        self.assertEqual(final_list, [node2, node0])
+        self.assertEqual(node2.parent, None)
+        self.assertEqual(node0.children, [])
+
+    def test_build_nodes_inner_for_duplicate_ids_menu(self):
+        '''
+            Children are attached to the node with their parent id
+            added last when they are added.
+        '''
+        node1 = NavigationNode('Test1', '/test1/', 1, None)
+        node2 = NavigationNode('Test2', '/test2/', 2, 1)
+        other_node1 = NavigationNode('Other1', '/other1/', 1, None)
+        node3 = NavigationNode('Test3', '/test3/', 3, 1)
+
+        final_list = _build_nodes_inner_for_one_menu([node1, node2, other_node1, node3], 'Test')
+        self.assertEqual(final_list, [node1, node2, other_node1, node3])
+        self.assertEqual(node1.children, [node2])
+        self.assertEqual(other_node1.children, [node3])
+
+        # node3 is added in the second pass, after other_node1
+        node1 = NavigationNode('Test1', '/test1/', 1, None)
+        other_node1 = NavigationNode('Other1', '/other1/', 1, None)
+        node3 = NavigationNode('Test3', '/test3/', 3, 1)
+
+        final_list = _build_nodes_inner_for_one_menu([node3, node1, other_node1], 'Test')
+        self.assertEqual(final_list, [node1, other_node1, node3])
+        self.assertEqual(node1.children, [])
+        self.assertEqual(other_node1.children, [node3])
+
     def test_build_nodes_inner_for_circular_menu(self):
         '''
         TODO:
@@ -930,6 +1187,56 @@ class MenuTests(BaseMenuTest):
         self.assertEqual(node4.children, [node3])
         self.assertEqual(node5.children, [node4])
 
+    def test_dump_and_load_nodes(self):
+        '''
+            node1
+             node2
+              node3
+             node4
+            node5
+        '''
+        attr = {'reverse_id': None, 'soft_root': False}
+        node1 = NavigationNode('Test1', '/test1/', 1, None, attr=dict(attr))
+        node2 = NavigationNode('Test2', '/test2/', 2, 1, attr=dict(attr))
+        node3 = NavigationNode('Test3', '/test3/', 3, 2, attr={'visible_for_anonymous': False})
+        node4 = NavigationNode('Test4', '/test4/', 4, 1, attr=dict(attr))
+        node5 = NavigationNode('Test5', '/test5/', 5, None, visible=False)
+        nodes = _build_nodes_inner_for_one_menu(
+            [node1, node2, node3, node4, node5],
+            'Test',
+        )
+        data = pickle.loads(pickle.dumps(dump_nodes(nodes)))
+        layouts, attrs, rows = data
+
+        # Identical attr dictionaries are stored once
+        self.assertEqual(len(layouts), 1)
+        self.assertEqual(len(attrs), 3)
+        self.assertEqual(len(rows), 5)
+
+        loaded = load_nodes(data)
+        self.assertEqual([node.title for node in loaded], [node.title for node in nodes])
+
+        for original, node in zip(nodes, loaded):
+            self.assertEqual(node.__class__, original.__class__)
+            self.assertEqual(set(node.__dict__), set(original.__dict__))
+            self.assertEqual(node.id, original.id)
+            self.assertEqual(node.url, original.url)
+            self.assertEqual(node.namespace, 'Test')
+            self.assertEqual(node.visible, original.visible)
+            self.assertEqual(node.attr, original.attr)
+            self.assertEqual(
+                getattr(node.parent, 'id', None),
+                getattr(original.parent, 'id', None),
+            )
+            self.assertEqual(
+                [child.id for child in node.children],
+                [child.id for child in original.children],
+            )
+
+        # Each node has its own attr
+        loaded[0].attr['soft_root'] = True
+        self.assertFalse(loaded[1].attr['soft_root'])
+
     def test_utils_mark_descendants(self):
         tree_nodes, flat_nodes = self._get_nodes()
         mark_descendants(tree_nodes)
@@ -1328,14 +1635,12 @@ class ShowSubMenuCheck(SubMenusFixture, BaseMenuTest):
         context = self.get_context(page.get_absolute_url(), page=page)
 
         # test standard show_menu
-        with self.assertNumQueries(5):
+        with self.assertNumQueries(3):
             """
             The queries should be:
                 get all page nodes
                 get all page permissions
                 get all titles
-                get the menu cache key
-                set the menu cache key
             """
             tpl = Template("{% load menu_tags %}{% show_sub_menu %}")
             tpl.render(context)
@@ -1502,14 +1807,12 @@ class ShowMenuBelowIdTests(BaseMenuTest):
 
         with LanguageOverride('en'):
             context = self.get_context(a.get_absolute_url())
-            with self.assertNumQueries(5):
+            with self.assertNumQueries(3):
                 """
                 The queries should be:
                     get all page nodes
                     get all page permissions
                     get all titles
-                    get the menu cache key
-                    set the menu cache key
                 """
                 # Actually seems to run:
                 tpl = Template("{% load menu_tags %}{% show_menu_below_id 'a' 0 100 100 100 %}")
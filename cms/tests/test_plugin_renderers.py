@@ -10,6 +10,7 @@ from cms.plugin_rendering import (
     StructureRenderer,
 )
 from cms.test_utils.testcases import CMSTestCase
+from cms.toolbar.toolbar import CMSToolbar
 
 
 class TestStructureRenderer(CMSTestCase):
@@ -95,10 +96,27 @@ class TestContentRenderer(TestStructureRenderer):
             self.assertFalse(renderer.placeholder_cache_is_enabled())
 
         with self.login_user_context(self.get_staff_user_with_no_permissions()):
-            # Placeholder cache is disabled for all staff users
+            # Placeholder cache is disabled for staff users seeing draft content
             renderer = self.get_renderer()
             self.assertFalse(renderer.placeholder_cache_is_enabled())
 
+    @override_settings(CMS_PLACEHOLDER_CACHE=True)
+    def test_placeholder_cache_enabled_for_staff_preview(self):
+        cms_page = create_page("page", 'nav_playground.html', "en", published=True)
+        request_path = cms_page.get_absolute_url('en')
+
+        with self.login_user_context(self.get_staff_user_with_no_permissions()):
+            request = self.get_request(request_path, 'en', page=cms_page.publisher_public)
+            request.session['cms_preview'] = True
+            renderer = self.renderer_class(request)
+            # Staff users seeing published content share the placeholder cache
+            self.assertTrue(renderer.placeholder_cache_is_enabled())
+
+            request.session['cms_edit'] = True
+            request.toolbar = CMSToolbar(request)
+            renderer = self.renderer_class(request)
+            self.assertFalse(renderer.placeholder_cache_is_enabled())
+
     def test_preload_placeholders_for_page_with_inherit_off(self):
         cms_page = create_page("page", 'nav_playground.html', "en")
         placeholder_1 = cms_page.placeholders.get(slot='body')
@@ -6,7 +6,7 @@ from sekizai.context import SekizaiContext
 
 from cms import plugin_rendering
 from cms.api import create_page, add_plugin
-from cms.cache.placeholder import get_placeholder_cache
+from cms.cache.placeholder import get_placeholder_cache, get_placeholder_inheritance_cache
 from cms.models import Page, Placeholder, CMSPlugin
 from cms.plugin_rendering import PluginContext
 from cms.test_utils.project.placeholderapp.models import Example1
@@ -651,6 +651,32 @@ class RenderingTestCase(CMSTestCase):
         # This should use the cached parent page content
         self.assertEqual(self.render(self.test_page10), u'|<p>Ultimate fallback</p>|')
 
+    def test_inherit_placeholder_resolution_cache(self):
+        expected_3 = u'|' + self.test_data['text_main'] + '|' + self.test_data3['text_sub']
+        main = self.test_page.placeholders.get(slot='main')
+        main2 = self.test_page2.placeholders.get(slot='main')
+
+        def get_resolution():
+            cached = get_placeholder_inheritance_cache(self.test_page3.pk, ['main'], 'en', 1)
+            return cached['main'][1]
+
+        self.assertIsNone(get_resolution())
+        self.assertEqual(self.render(self.test_page3), expected_3)
+        # The placeholder page3 inherits from is cached
+        self.assertEqual(get_resolution(), (self.test_page.pk, main.pk))
+        self.assertEqual(self.render(self.test_page3), expected_3)
+
+        # Adding content to a placeholder of the slot invalidates the resolution
+        add_plugin(main2, 'TextPlugin', 'en', body='parent main')
+        main2.clear_cache('en')
+        self.assertIsNone(get_resolution())
+        self.assertEqual(self.render(self.test_page3), u'|parent main|' + self.test_data3['text_sub'])
+        self.assertEqual(get_resolution(), (self.test_page2.pk, main2.pk))
+
+        # So does a change of the page tree
+        self.test_page3.clear_cache(menu=True)
+        self.assertIsNone(get_resolution())
+
     def test_inherit_placeholder_with_or(self):
         # Tests that the "or" statement used in a {% placeholder %}
         # declaration is used as the last fallback when inheritance
@@ -1,8 +1,10 @@
 # -*- coding: utf-8 -*-
 
 from django.contrib.admin.sites import site
+from django.db import connection
 from django.template import Context
 from django.template.base import Template
+from django.test.utils import CaptureQueriesContext
 from django.utils import six
 
 from cms.api import add_plugin
@@ -88,6 +90,27 @@ class StaticPlaceholderTestCase(PluginsTestBaseCase):
         self.assertNotIn("No Content", rendered)
         self.assertEqual(StaticPlaceholder.objects.filter(site_id__isnull=False, code='foobar').count(), 1)
 
+    def test_registry(self):
+        template = Template('{% load cms_tags %}{% static_placeholder "foobar" %}')
+        # Creates the static placeholder
+        template.render(self.get_context('/'))
+        static_placeholder = StaticPlaceholder.objects.get(code='foobar')
+        add_plugin(static_placeholder.draft, 'TextPlugin', 'en', body='registered')
+        static_placeholder.publish(None, 'en', force=True)
+
+        # Builds the registry
+        self.assertIn('registered', template.render(self.get_context('/')))
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertIn('registered', template.render(self.get_context('/')))
+        table = StaticPlaceholder._meta.db_table
+        self.assertFalse([query for query in queries.captured_queries if table in query['sql']])
+
+        # Publishing invalidates the registry
+        add_plugin(static_placeholder.draft, 'TextPlugin', 'en', body='published')
+        static_placeholder.publish(None, 'en', force=True)
+        self.assertIn('published', template.render(self.get_context('/')))
+
     def test_publish_stack(self):
         static_placeholder = StaticPlaceholder.objects.create(name='foo', code='bar', site_id=1)
         self.fill_placeholder(static_placeholder.draft)
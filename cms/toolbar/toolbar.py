@@ -36,6 +36,11 @@ class BaseToolbar(ToolbarAPIMixin):
     structure_mode_url_on = get_cms_setting('CMS_TOOLBAR_URL__BUILD')
     disable_url = get_cms_setting('CMS_TOOLBAR_URL__DISABLE')
 
+    # When set, the content renderers don't write the placeholder cache
+    # while rendering, flush_placeholder_cache() must then be called
+    # once the response has been rendered.
+    _defer_placeholder_cache = False
+
     @property
     def language(self):
         # Backwards compatibility
@@ -77,6 +82,12 @@ class BaseToolbar(ToolbarAPIMixin):
 
         return ContentRenderer(request=self.request)
 
+    def flush_placeholder_cache(self):
+        # Renderers are only instantiated when used
+        for name in ('content_renderer', 'legacy_renderer'):
+            if name in self.__dict__:
+                self.__dict__[name].flush_placeholder_cache()
+
     @cached_property
     def structure_renderer(self):
         from cms.plugin_rendering import StructureRenderer
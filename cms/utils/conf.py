@@ -60,9 +60,23 @@ DEFAULTS = {
     'PAGE_MEDIA_PATH': 'cms_page_media/',
     'TITLE_CHARACTER': '+',
     'PAGE_CACHE': True,
+    'PAGE_CACHE_GRACE': 0,
+    'PAGE_CACHE_DEPENDENCIES': False,
+    'PAGE_CACHE_QUERY_PARAMETERS': None,
+    'PAGE_CACHE_IGNORED_QUERY_PARAMETERS': [],
+    'PAGE_CACHE_COMPRESSION': False,
+    'PAGE_CACHE_AUTHENTICATED': False,
+    'PAGE_CACHE_VERSION_LOCAL_TTL': 0,
     'PLACEHOLDER_CACHE': True,
+    'PLACEHOLDER_CACHE_GENERATIONS': False,
     'PLUGIN_CACHE': True,
+    'PLUGIN_FRAGMENT_CACHE': False,
+    'MENU_LOCAL_CACHE_SIZE': 100,
+    'PARTIAL_MENUS': False,
     'CACHE_PREFIX': 'cms_{}_'.format(__version__),
+    'CACHE_STATS': False,
+    'CACHE_STATS_SINK': 'cms.cache.stats.MemoryStatsSink',
+    'CACHE_STATS_SERVER_TIMING': False,
     'PLUGIN_PROCESSORS': [],
     'PLUGIN_CONTEXT_PROCESSORS': [],
     'UNIHANDECODE_VERSION': None,
@@ -1,4 +1,6 @@
 # -*- coding: utf-8 -*-
+import hashlib
+
 from functools import wraps
 
 from django.utils.decorators import available_attrs
@@ -6,7 +8,7 @@ from django.utils.decorators import available_attrs
 from cms.api import get_page_draft
 from cms.cache.permissions import get_permission_cache, set_permission_cache
 from cms.constants import GRANT_ALL_PERMISSIONS
-from cms.models import Page, Placeholder
+from cms.models import Page, PagePermission, Placeholder
 from cms.utils import get_current_site
 from cms.utils.conf import get_cms_setting
 from cms.utils.permissions import (
@@ -372,6 +374,39 @@ def user_can_view_all_pages(user, site):
     return has_global_permission(user, site, action='view_page')
 
 
+def get_view_fingerprint(user, site):
+    """
+    Returns a fingerprint of the pages the given user can see on the given
+    site, derived from what cms.cms_menus.get_visible_nodes() looks at.
+    Users with the same fingerprint see the same pages.
+    """
+    if not user.is_authenticated():
+        return 'anonymous'
+
+    fingerprints = get_permission_cache(user, 'view_fingerprint') or {}
+
+    if site.pk in fingerprints:
+        return fingerprints[site.pk]
+
+    if user_can_view_all_pages(user, site):
+        parts = ['all']
+    elif not get_cms_setting('PERMISSION'):
+        # There are no view restrictions
+        parts = ['none']
+    else:
+        public_for = get_cms_setting('PUBLIC_FOR')
+        parts = ['staff' if public_for == 'staff' and user.is_staff else 'user']
+        # View restrictions are granted to groups or to the user itself
+        parts.extend(str(pk) for pk in sorted(user.groups.values_list('pk', flat=True)))
+
+        if PagePermission.objects.filter(user=user, can_view=True).exists():
+            parts.append('user:%s' % user.pk)
+    fingerprint = hashlib.sha1(':'.join(parts).encode('utf-8')).hexdigest()
+    fingerprints[site.pk] = fingerprint
+    set_permission_cache(user, 'view_fingerprint', fingerprints)
+    return fingerprint
+
+
 def get_add_id_list(user, site, check_global=True, use_cache=True):
     """
     Give a list of page where the user has add page rights or the string
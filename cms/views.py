@@ -4,14 +4,12 @@ from django.conf import settings
 from django.contrib.auth import login as auth_login, REDIRECT_FIELD_NAME
 from django.contrib.auth.views import redirect_to_login
 from django.core.urlresolvers import reverse
-from django.http import HttpResponseRedirect, HttpResponse
-from django.utils.cache import patch_cache_control
+from django.http import HttpResponseRedirect
 from django.utils.http import is_safe_url, urlquote
-from django.utils.timezone import now
 from django.utils.translation import get_language_from_request
 from django.views.decorators.http import require_POST
 
-from cms.cache.page import get_page_cache
+from cms.cache.page import _can_cache_page_for_user, get_page_cache_response
 from cms.exceptions import LanguageError
 from cms.forms.login import CMSToolbarLoginForm
 from cms.models.pagemodel import TreeNode
@@ -40,23 +38,15 @@ def details(request, slug):
     The main view of the Django-CMS! Takes a request and a slug, renders the
     page.
     """
-    response_timestamp = now()
     if get_cms_setting("PAGE_CACHE") and (
         not hasattr(request, 'toolbar') or (
             not request.toolbar.edit_mode_active and
             not request.toolbar.show_toolbar and
-            not request.user.is_authenticated()
+            _can_cache_page_for_user(request.user)
         )
     ):
-        cache_content = get_page_cache(request)
-        if cache_content is not None:
-            content, headers, expires_datetime = cache_content
-            response = HttpResponse(content)
-            response._headers = headers
-            # Recalculate the max-age header for this cached response
-            max_age = int(
-                (expires_datetime - response_timestamp).total_seconds() + 0.5)
-            patch_cache_control(response, max_age=max_age)
+        response = get_page_cache_response(request)
+        if response is not None:
             return response
 
     # Get a Page model object from the request
@@ -1,9 +1,21 @@
 # -*- coding: utf-8 -*-
+from collections import namedtuple
+
 from django.utils.encoding import smart_str
 
 
+# The nodes a menu tag needs, see CMS_PARTIAL_MENUS: the nodes on the path to
+# the selected node, the nodes up to «inactive_depth» levels below them and the
+# nodes up to «active_depth» levels below the selected node, none of them
+# deeper than «max_level» (None for no limit).
+MenuWindow = namedtuple('MenuWindow', ['inactive_depth', 'active_depth', 'max_level'])
+
+
 class Menu(object):
     namespace = None
+    # The MenuWindow of the nodes needed, None for all the nodes.
+    # Menus may ignore it and return all their nodes.
+    window = None
 
     def __init__(self, renderer):
         self.renderer = renderer
@@ -60,13 +72,23 @@ class NavigationNode(object):
         return self.attr.get(name, None)
 
     def get_descendants(self):
-        return sum(([node] + node.get_descendants() for node in self.children), [])
+        descendants = []
+        stack = list(reversed(self.children))
+
+        while stack:
+            node = stack.pop()
+            descendants.append(node)
+            stack.extend(reversed(node.children))
+        return descendants
 
     def get_ancestors(self):
-        if getattr(self, 'parent', None):
-            return [self.parent] + self.parent.get_ancestors()
-        else:
-            return []
+        ancestors = []
+        node = getattr(self, 'parent', None)
+
+        while node:
+            ancestors.append(node)
+            node = getattr(node, 'parent', None)
+        return ancestors
 
     def is_selected(self, request):
         node_abs_url = self.get_absolute_url()
@@ -1,4 +1,10 @@
 # -*- coding: utf-8 -*-
+import hashlib
+import heapq
+import threading
+import time
+
+from collections import OrderedDict
 from functools import partial
 from logging import getLogger
 
@@ -7,42 +13,109 @@ from django.contrib.sites.models import Site
 from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.core.urlresolvers import NoReverseMatch
-from django.utils.functional import cached_property
 from django.utils.module_loading import autodiscover_modules
 from django.utils.translation import get_language_from_request, ugettext_lazy as _
 
+from cms.cache import stats
 from cms.utils.conf import get_cms_setting
 from cms.utils.moderator import use_draft
 
 from menus.base import Menu
 from menus.exceptions import NamespaceAlreadyRegistered
-from menus.models import CacheKey
+from menus.tree import dump_nodes, load_nodes
 
 logger = getLogger('menus')
 
 
+def _get_menu_generation_keys(site_id, language):
+    """
+    Returns the cache keys of the generations the menu of the given site
+    and language depends on: the generation of all the menus, of the menus
+    of the site, of the menus in the language and of this menu.
+    """
+    prefix = get_cms_setting('CACHE_PREFIX')
+    return [
+        '%smenu_generation' % prefix,
+        '%smenu_generation_site_%s' % (prefix, site_id),
+        '%smenu_generation_language_%s' % (prefix, language),
+        '%smenu_generation_%s_%s' % (prefix, language, site_id),
+    ]
+
+
+def _get_new_menu_generation():
+    # Generations are based on the current time so that a generation lost
+    # by the cache backend never gets re-created with a previous value.
+    return int(time.time() * 1000000)
+
+
+# The menus kept by this process, least recently used first:
+# {cache key: (generations, compact nodes)}
+_local_menus = OrderedDict()
+_local_menus_lock = threading.Lock()
+
+
+def _get_local_menu(key, generations):
+    """
+    Returns the compact nodes of the menu kept by this process
+    under the given cache key, None if there are none for «generations».
+    """
+    with _local_menus_lock:
+        local_menu = _local_menus.pop(key, None)
+
+        if local_menu is None or local_menu[0] != generations:
+            return None
+        # Re-inserted as the most recently used
+        _local_menus[key] = local_menu
+    return local_menu[1]
+
+
+def _has_local_menu(key):
+    """
+    Returns True if this process keeps a menu under the given cache key,
+    whatever its generations.
+    """
+    return key in _local_menus
+
+
+def _set_local_menu(key, generations, data):
+    size = get_cms_setting('MENU_LOCAL_CACHE_SIZE')
+
+    if not size:
+        return
+
+    with _local_menus_lock:
+        _local_menus.pop(key, None)
+        _local_menus[key] = (generations, data)
+
+        while len(_local_menus) > size:
+            _local_menus.popitem(last=False)
+
+
 def _build_nodes_inner_for_one_menu(nodes, menu_class_name):
     '''
     This is an easier to test "inner loop" building the menu tree structure
     for one menu (one language, one site)
+
+    The nodes are visited in the order of the list. A node whose parent has
+    not been added yet is visited again in the next pass over the remaining
+    nodes, as if it was moved to the end of the list. Instead of visiting
+    it on every pass, it waits for a node with its parent id to be added.
+    Nodes whose parent is never added are left out.
     '''
-    done_nodes = {}  # Dict of node.id:Node
+    done_nodes = {}  # Dict of namespace: {node.id: node}
     final_nodes = []
+    # Dict of (namespace, parent_id): positions of the nodes waiting for it
+    waiting = {}
+    # The next visits, as (pass, position in the list), in visiting order
+    visits = [(0, position) for position in range(len(nodes))]
 
-    # This is to prevent infinite loops - we need to compare the number of
-    # times we see a specific node to "something", and for the time being,
-    # it's the total number of nodes
+    # This is to prevent infinite loops, a node is not visited in more
+    # passes than there are nodes
     list_total_length = len(nodes)
 
-    while nodes:
-        # For when the node has a parent_id but we haven't seen it yet.
-        # We must not append it to the final list in this case!
-        should_add_to_final_list = True
-
-        node = nodes.pop(0)
-
-        # Increment the "seen" counter for this specific node.
-        node._counter = getattr(node, '_counter', 0) + 1
+    while visits:
+        node_pass, position = heapq.heappop(visits)
+        node = nodes[position]
 
         # Implicit namespacing by menu.__name__
         if not node.namespace:
@@ -61,18 +134,20 @@ def _build_nodes_inner_for_one_menu(nodes, menu_class_name):
             node.parent = parent
         # If it has a parent_id but we haven't seen it yet...
         elif node.parent_id:
-            # We check for infinite loops here, by comparing the number of
-            # times we "saw" this node to the number of nodes in the list
-            if node._counter < list_total_length:
-                nodes.append(node)
-            # Never add this node to the final list until it has a real
-            # parent (node.parent)
-            should_add_to_final_list = False
-
-        if should_add_to_final_list:
-            final_nodes.append(node)
-            # add it to the "seen" list
-            done_nodes[node.namespace][node.id] = node
+            waiting.setdefault((node.namespace, node.parent_id), []).append(position)
+            continue
+
+        final_nodes.append(node)
+        # add it to the "seen" list
+        done_nodes[node.namespace][node.id] = node
+
+        # The nodes waiting for this one are visited next time they would
+        # have been: later in this pass, or in the next one.
+        for waiting_position in waiting.pop((node.namespace, node.id), []):
+            waiting_pass = node_pass if waiting_position > position else node_pass + 1
+
+            if waiting_pass < list_total_length:
+                heapq.heappush(visits, (waiting_pass, waiting_position))
     return final_nodes
 
 
@@ -108,12 +183,15 @@ class MenuRenderer(object):
 
     @property
     def cache_key(self):
+        from cms.utils.page_permissions import get_view_fingerprint
+
         prefix = get_cms_setting('CACHE_PREFIX')
 
         key = '%smenu_nodes_%s_%s' % (prefix, self.request_language, self.site.pk)
 
         if self.request.user.is_authenticated():
-            key += '_%s_user' % self.request.user.pk
+            # Users who can see the same pages share the same menu
+            key += '_%s_user' % get_view_fingerprint(self.request.user, self.site)
 
         if self.draft_mode_active:
             key += ':draft'
@@ -121,16 +199,14 @@ class MenuRenderer(object):
             key += ':public'
         return key
 
-    @cached_property
-    def is_cached(self):
-        db_cache_key_lookup = CacheKey.objects.filter(
-            key=self.cache_key,
-            language=self.request_language,
-            site=self.site.pk,
-        )
-        return db_cache_key_lookup.exists()
+    def _get_window_key(self, window):
+        # A partial menu depends on the position of the current page
+        current_page = getattr(self.request, 'current_page', None)
+        position = current_page.node.path if current_page else ''
+        window_key = '%s:%s' % ('_'.join(str(value) for value in window), position)
+        return hashlib.sha1(window_key.encode('utf-8')).hexdigest()
 
-    def _build_nodes(self):
+    def _build_nodes(self, window=None):
         """
         This is slow. Caching must be used.
         One menu is built per language and per site.
@@ -149,19 +225,67 @@ class MenuRenderer(object):
         """
         key = self.cache_key
 
-        cached_nodes = cache.get(key, None)
+        if window:
+            key += '_window_%s' % self._get_window_key(window)
+
+        generation_keys = _get_menu_generation_keys(self.site.pk, self.request_language)
+        start = time.time()
+
+        keys = list(generation_keys)
+
+        if not _has_local_menu(key):
+            # The key of the menu doesn't depend on the generations, the
+            # nodes are fetched along with them, in the same round trip.
+            # Menus kept by this process are not fetched again.
+            keys.append(key)
+
+        cached = cache.get_many(keys)
+        generations = []
+
+        for generation_key in generation_keys:
+            generation = cached.get(generation_key)
 
-        if cached_nodes and self.is_cached:
-            # Only use the cache if the key is present in the database.
-            # This prevents a condition where keys which have been removed
-            # from the database due to a change in content, are still used.
-            return cached_nodes
+            if not generation:
+                generation = _get_new_menu_generation()
+
+                if not cache.add(generation_key, generation, None):
+                    # Another process has set the generation in the meantime
+                    generation = cache.get(generation_key, generation)
+            generations.append(generation)
+
+        # The nodes are shared by the requests of this process
+        # as long as the generations don't change.
+        data = _get_local_menu(key, generations)
+
+        if data is None:
+            if key in keys:
+                cached_nodes = cached.get(key)
+            else:
+                # The menu kept by this process is outdated
+                cached_nodes = cache.get(key)
+
+            # Nodes built before the menu was last cleared
+            # belong to another generation and are ignored.
+            if cached_nodes and cached_nodes[0] == generations:
+                data = cached_nodes[1]
+                _set_local_menu(key, generations, data)
+
+        if data is not None:
+            stats.record('menu', stats.HIT, site_id=self.site.pk,
+                         language=self.request_language, duration=time.time() - start)
+            # Each request gets its own nodes, modifiers change them.
+            return load_nodes(data)
+
+        stats.record('menu', stats.MISS, site_id=self.site.pk,
+                     language=self.request_language, duration=time.time() - start)
+        start = time.time()
 
         final_nodes = []
         toolbar = getattr(self.request, 'toolbar', None)
 
         for menu_class_name in self.menus:
             menu = self.get_menu(menu_class_name)
+            menu.window = window
 
             try:
                 nodes = menu.get_nodes(self.request)
@@ -179,18 +303,13 @@ class MenuRenderer(object):
             # nodes is a list of navigation nodes (page tree in cms + others)
             final_nodes += _build_nodes_inner_for_one_menu(nodes, menu_class_name)
 
-        cache.set(key, final_nodes, get_cms_setting('CACHE_DURATIONS')['menus'])
-
-        if not self.is_cached:
-            # No need to invalidate the internal lookup cache,
-            # just set the value directly.
-            self.__dict__['is_cached'] = True
-            # We need to have a list of the cache keys for languages and sites that
-            # span several processes - so we follow the Django way and share through
-            # the database. It's still cheaper than recomputing every time!
-            # This way we can selectively invalidate per-site and per-language,
-            # since the cache is shared but the keys aren't
-            CacheKey.objects.create(key=key, language=self.request_language, site=self.site.pk)
+        # The nodes are cached in a compact form, see menus.tree
+        data = dump_nodes(final_nodes)
+        cache.set(key, (generations, data), get_cms_setting('CACHE_DURATIONS')['menus'])
+        _set_local_menu(key, generations, data)
+        # The time spent building the menu is accounted to the write
+        stats.record('menu', stats.WRITE, site_id=self.site.pk,
+                     language=self.request_language, duration=time.time() - start)
         return final_nodes
 
     def _mark_selected(self, nodes):
@@ -212,8 +331,15 @@ class MenuRenderer(object):
                 self.request, nodes, namespace, root_id, post_cut, breadcrumb)
         return nodes
 
-    def get_nodes(self, namespace=None, root_id=None, breadcrumb=False):
-        nodes = self._build_nodes()
+    def get_nodes(self, namespace=None, root_id=None, breadcrumb=False, window=None):
+        """
+        Returns the nodes of the menus, only the ones in the given MenuWindow
+        (and possibly more) if CMS_PARTIAL_MENUS is set.
+        """
+        if not get_cms_setting('PARTIAL_MENUS'):
+            window = None
+
+        nodes = self._build_nodes(window)
         nodes = self.apply_modifiers(
             nodes=nodes,
             namespace=namespace,
@@ -305,16 +431,22 @@ class MenuPool(object):
         '''
         This invalidates the cache for a given menu (site_id and language)
         '''
-        if all:
-            cache_keys = CacheKey.objects.get_keys()
+        start = time.time()
+        keys = _get_menu_generation_keys(site_id, language)
+
+        if all or (not site_id and not language):
+            key = keys[0]
+        elif not language:
+            key = keys[1]
+        elif not site_id:
+            key = keys[2]
         else:
-            cache_keys = CacheKey.objects.get_keys(site_id, language)
-
-        to_be_deleted = cache_keys.distinct().values_list('key', flat=True)
+            key = keys[3]
 
-        if to_be_deleted:
-            cache.delete_many(to_be_deleted)
-            cache_keys.delete()
+        # The menus cached for the previous generation are left to expire.
+        cache.set(key, _get_new_menu_generation(), None)
+        stats.record('menu', stats.INVALIDATION, site_id=site_id,
+                     language=language, duration=time.time() - start)
 
     def register_menu(self, menu_cls):
         from menus.base import Menu
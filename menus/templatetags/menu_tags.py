@@ -17,6 +17,7 @@ from cms.utils.i18n import (
     get_public_languages,
 )
 
+from menus.base import MenuWindow
 from menus.menu_pool import menu_pool
 from menus.utils import DefaultLanguageChanger
 
@@ -28,30 +29,52 @@ class NOT_PROVIDED:
     pass
 
 
-def cut_after(node, levels, removed):
+def _drop_removed_children(node, removed_children):
+    """
+    Drops the children of «node» removed by cut_levels() in the meantime.
+    """
+    parent_and_ids = removed_children.pop(id(node), None)
+
+    if parent_and_ids:
+        removed_ids = parent_and_ids[1]
+        node.children = [child for child in node.children if id(child) not in removed_ids]
+
+
+def cut_after(node, levels, removed, removed_children=None):
     """
     given a tree of nodes cuts after N levels
     """
+    if removed_children:
+        _drop_removed_children(node, removed_children)
+
     if levels == 0:
         removed.extend(node.children)
         node.children = []
     else:
-        removed_local = []
+        children = []
         for child in node.children:
             if child.visible:
-                cut_after(child, levels - 1, removed)
+                cut_after(child, levels - 1, removed, removed_children)
+                children.append(child)
             else:
-                removed_local.append(child)
-        for removed_child in removed_local:
-            node.children.remove(removed_child)
-        removed.extend(removed_local)
+                removed.append(child)
+        node.children = children
 
 
-def remove(node, removed):
+def remove(node, removed, removed_children=None):
+    """
+    Removes «node» from the children of its parent. With «removed_children»,
+    a dictionary of id(parent): (parent, set of ids of removed children),
+    the children lists are only rebuilt once all the nodes have been removed.
+    """
     removed.append(node)
     if node.parent:
-        if node in node.parent.children:
-            node.parent.children.remove(node)
+        if removed_children is None:
+            if node in node.parent.children:
+                node.parent.children.remove(node)
+        else:
+            parent_and_ids = removed_children.setdefault(id(node.parent), (node.parent, set()))
+            parent_and_ids[1].add(id(node))
 
 
 def cut_levels(nodes, from_level, to_level, extra_inactive, extra_active):
@@ -60,11 +83,14 @@ def cut_levels(nodes, from_level, to_level, extra_inactive, extra_active):
     """
     final = []
     removed = []
+    # Removing nodes one by one from large children lists is slow,
+    # they're filtered once instead (see remove()).
+    removed_children = {}
     selected = None
     for node in nodes:
         if not hasattr(node, 'level'):
             # remove and ignore nodes that don't have level information
-            remove(node, removed)
+            remove(node, removed, removed_children)
             continue
         if node.level == from_level:
             # turn nodes that are on from_level into root nodes
@@ -73,29 +99,32 @@ def cut_levels(nodes, from_level, to_level, extra_inactive, extra_active):
         if not node.ancestor and not node.selected and not node.descendant:
             # cut inactive nodes to extra_inactive, but not of descendants of
             # the selected node
-            cut_after(node, extra_inactive, removed)
+            cut_after(node, extra_inactive, removed, removed_children)
         if node.level > to_level and node.parent:
             # remove nodes that are too deep, but not nodes that are on
             # from_level (local root nodes)
-            remove(node, removed)
+            remove(node, removed, removed_children)
         if node.selected:
             selected = node
         if not node.visible:
-            remove(node, removed)
+            remove(node, removed, removed_children)
     if selected:
-        cut_after(selected, extra_active, removed)
+        cut_after(selected, extra_active, removed, removed_children)
+    for parent, removed_ids in removed_children.values():
+        parent.children = [child for child in parent.children if id(child) not in removed_ids]
     if removed:
-        for node in removed:
-            if node in final:
-                final.remove(node)
+        removed_ids = set(id(node) for node in removed)
+        final = [node for node in final if id(node) not in removed_ids]
     return final
 
 
 def flatten(nodes):
     flat = []
-    for node in nodes:
+    stack = list(reversed(nodes))
+    while stack:
+        node = stack.pop()
         flat.append(node)
-        flat.extend(flatten(node.children))
+        stack.extend(reversed(node.children))
     return flat
 
 
@@ -141,7 +170,13 @@ class ShowMenu(InclusionTag):
             if not menu_renderer:
                 menu_renderer = menu_pool.get_renderer(request)
 
-            nodes = menu_renderer.get_nodes(namespace, root_id)
+            if root_id:
+                # The nodes below root_id can be anywhere in the tree
+                window = None
+            else:
+                window = MenuWindow(extra_inactive, extra_active, to_level)
+
+            nodes = menu_renderer.get_nodes(namespace, root_id, window=window)
             if root_id:  # find the root id and cut the nodes
                 id_nodes = menu_pool.get_nodes_by_attribute(nodes, "reverse_id", root_id)
                 if id_nodes:
@@ -224,7 +259,7 @@ class ShowSubMenu(InclusionTag):
         if not menu_renderer:
             menu_renderer = menu_pool.get_renderer(request)
 
-        nodes = menu_renderer.get_nodes()
+        nodes = menu_renderer.get_nodes(window=MenuWindow(levels, levels, None))
         children = []
         # adjust root_level so we cut before the specified level, not after
         include_root = False
@@ -302,7 +337,7 @@ class ShowBreadcrumb(InclusionTag):
         if not menu_renderer:
             menu_renderer = menu_pool.get_renderer(request)
 
-        nodes = menu_renderer.get_nodes(breadcrumb=True)
+        nodes = menu_renderer.get_nodes(breadcrumb=True, window=MenuWindow(0, 0, None))
 
         # Find home
         home = None
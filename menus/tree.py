@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+Compact representation of the menu nodes, as stored in the menu cache.
+
+Instead of the graph of nodes, where every node references its parent and
+its children, the cache holds flat tuples:
+
+- the layouts, a (node class, attribute names) tuple per kind of node,
+- the attr dictionaries of the nodes, identical ones being stored once,
+- a (layout index, parent index, attr index, attribute values) tuple per
+  node, in the order of the nodes.
+
+These are much smaller and much faster to unpickle than the nodes.
+"""
+
+
+def _get_attr_key(attr):
+    try:
+        key = tuple(sorted(attr.items()))
+        hash(key)
+    except TypeError:
+        # Unhashable or unorderable values, the attr is not shared.
+        return None
+    return key
+
+
+def dump_nodes(nodes):
+    """
+    Returns the compact representation of the given list of nodes,
+    as built by MenuRenderer._build_nodes().
+    """
+    layouts = []
+    layout_indexes = {}
+    attrs = []
+    attr_indexes = {}
+    node_indexes = dict((id(node), index) for index, node in enumerate(nodes))
+    rows = []
+
+    for node in nodes:
+        values = dict(node.__dict__)
+        parent = values.pop('parent', None)
+        attr = values.pop('attr', None) or {}
+        # Rebuilt from the parents
+        values.pop('children', None)
+
+        layout = (node.__class__, tuple(sorted(values)))
+
+        if layout not in layout_indexes:
+            layout_indexes[layout] = len(layouts)
+            layouts.append(layout)
+
+        attr_key = _get_attr_key(attr)
+
+        if attr_key is None or attr_key not in attr_indexes:
+            if attr_key is not None:
+                attr_indexes[attr_key] = len(attrs)
+            attr_index = len(attrs)
+            # Copied, the dumped nodes might still be modified
+            attrs.append(dict(attr))
+        else:
+            attr_index = attr_indexes[attr_key]
+
+        if parent is None:
+            parent_index = -1
+        else:
+            parent_index = node_indexes[id(parent)]
+
+        rows.append((
+            layout_indexes[layout],
+            parent_index,
+            attr_index,
+            tuple(values[name] for name in layout[1]),
+        ))
+    return layouts, attrs, rows
+
+
+def load_nodes(data):
+    """
+    Returns the list of nodes of the given compact representation,
+    as returned by dump_nodes().
+    """
+    layouts, attrs, rows = data
+    nodes = []
+
+    for layout_index, parent_index, attr_index, values in rows:
+        node_class, names = layouts[layout_index]
+        # The nodes are restored as they were, without calling __init__()
+        node = node_class.__new__(node_class)
+        node.__dict__.update(zip(names, values))
+        # Each node gets its own attr, modifiers might change it.
+        node.attr = dict(attrs[attr_index])
+        node.children = []
+        node.parent = None
+        nodes.append(node)
+
+    for node, row in zip(nodes, rows):
+        parent_index = row[1]
+
+        if parent_index >= 0:
+            parent = nodes[parent_index]
+            node.parent = parent
+            parent.children.append(node)
+    return nodes
@@ -18,14 +18,22 @@ def mark_descendants(nodes):
         mark_descendants(node.children)
 
 
+def _cut_levels(nodes, level, found):
+    if nodes and nodes[0].level == level:
+        found.extend(nodes)
+        return
+
+    for node in nodes:
+        _cut_levels(node.children, level, found)
+
+
 def cut_levels(nodes, level):
     """
     For cutting the nav_extender levels if you have a from_level in the navigation.
     """
-    if nodes:
-        if nodes[0].level == level:
-            return nodes
-    return sum((cut_levels(node.children, level) for node in nodes), [])
+    found = []
+    _cut_levels(nodes, level, found)
+    return found
 
 
 def find_selected(nodes):